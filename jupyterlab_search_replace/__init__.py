@@ -16,20 +16,33 @@ def _jupyter_labextension_paths():
     return [{"src": "labextension", "dest": "jupyterlab-search-replace"}]
 
 
+from jupyter_server.extension.application import ExtensionApp
+
 from .handlers import setup_handlers
+from .search_engine import SearchEngine
 
 
-def _jupyter_server_extension_points():
-    return [{"module": "jupyterlab_search_replace"}]
+class SearchReplaceApp(ExtensionApp):
+    """Server extension searching and replacing in the files of the server root directory.
 
+    The search engine is stopped with the server.
+    """
 
-def _load_jupyter_server_extension(server_app):
-    """Registers the API handler to receive HTTP requests from the frontend extension.
+    name = "jupyterlab_search_replace"
 
-    Parameters
-    ----------
-    server_app: jupyterlab.labapp.LabApp
-        JupyterLab application instance
-    """
-    setup_handlers(server_app.web_app)
-    server_app.log.info("Registered search-replace extension")
+    def initialize_settings(self):
+        self.engine = SearchEngine(
+            self.serverapp.contents_manager, config=self.serverapp.config
+        )
+        self.engine.start()
+
+    def initialize_handlers(self):
+        setup_handlers(self.serverapp.web_app, self.engine)
+        self.log.info("Registered search-replace extension")
+
+    async def stop_extension(self):
+        await self.engine.stop()
+
+
+def _jupyter_server_extension_points():
+    return [{"module": "jupyterlab_search_replace", "app": SearchReplaceApp}]
@@ -0,0 +1,600 @@
+"""Search backends
+
+A backend finds the lines matching a query in the files of a folder and
+reports them as the ripgrep JSON entries are decoded (see :mod:`.codec`), so
+that the results have the same format whatever the backend:
+
+- ``ripgrep`` runs `ripgrep <https://github.com/BurntSushi/ripgrep>`_.
+- ``git`` lists the files with matches with ``git grep``, that only reads
+  the files tracked in the git index, then searches them with Python threads.
+- ``python`` searches the files with a pool of Python processes; see
+  :mod:`.pysearch`.
+- ``index`` searches with Python threads, in the server process, the few
+  files narrowed by the trigram index for a literal query.
+
+Each backend is configurable through its own section of the Jupyter Server
+configuration, e.g. ``c.GitGrepBackend.untracked = True``.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import re
+import shutil
+import sys
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import AsyncIterator, Deque, Dict, List, NamedTuple, Optional, Tuple
+
+from traitlets import Bool, Integer, List as ListTrait, Unicode
+from traitlets.config import LoggingConfigurable
+
+from .codec import (
+    RipgrepBegin,
+    RipgrepEnd,
+    RipgrepEntry,
+    RipgrepSummary,
+    decode_ripgrep,
+)
+from .metrics import SearchTimings
+from .pysearch import compile_query, iter_files, search_files
+
+# Above this number of files, the files to search are not passed explicitly
+# to ripgrep to avoid exceeding the command line length limit.
+MAX_EXPLICIT_FILES = 5000  # type: int
+# ripgrep error message when all the files are filtered out
+NO_FILES_SEARCHED = "No files were searched"
+
+
+class SearchError(Exception):
+    """Error raised when the search command fails.
+
+    Args:
+        code: The command return code
+        message: The error message
+        command: The command that failed
+    """
+
+    def __init__(self, code: int, message: str, command: List[str]) -> None:
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.command = command
+
+    def to_dict(self) -> dict:
+        """Error description as returned to the frontend."""
+        return {"code": self.code, "command": self.command, "message": self.message}
+
+
+def _glob_arguments(include: List[str], exclude: List[str]) -> List[str]:
+    arguments = []
+    for i in include:
+        arguments.extend(["-g", i])
+    for e in exclude:
+        arguments.extend(["-g", f"!{e}"])
+    return arguments
+
+
+def construct_command(
+    query: str,
+    case_sensitive: bool,
+    whole_word: bool,
+    include: List[str],
+    exclude: List[str],
+    use_regex: bool,
+    max_count: int,
+    threads: int = 0,
+):
+    """Helper to construct the ripgrep command line."""
+    command = ["rg", "--json", "--max-count", f"{max_count}"]
+
+    if threads > 0:
+        command.extend(["--threads", f"{threads}"])
+
+    if not use_regex:
+        command.append("--fixed-strings")
+    if not case_sensitive:
+        command.append("--ignore-case")
+    if whole_word:
+        command.append("--word-regexp")
+
+    command.extend(_glob_arguments(include, exclude))
+
+    # Deal with query starting with '-'
+    command.extend(["--", query])
+
+    return command
+
+
+def construct_files_command(include: List[str], exclude: List[str]):
+    """Helper to construct the ripgrep command line listing the files to search."""
+    return ["rg", "--files", *_glob_arguments(include, exclude)]
+
+
+def _pathspecs(include: List[str], exclude: List[str]) -> List[str]:
+    # Like for ripgrep, a glob without slash matches the name at any depth
+    def anchor(glob: str) -> str:
+        return glob.strip("/") if "/" in glob.rstrip("/") else f"**/{glob.rstrip('/')}"
+
+    pathspecs = [f":(glob){anchor(i)}" for i in include] or ["."]
+    # Like ripgrep, skip the hidden files
+    for e in [*exclude, ".*"]:
+        pathspecs.extend(
+            [f":(exclude,glob){anchor(e)}", f":(exclude,glob){anchor(e)}/**"]
+        )
+    return pathspecs
+
+
+def construct_git_command(
+    query: str,
+    case_sensitive: bool,
+    whole_word: bool,
+    include: List[str],
+    exclude: List[str],
+    use_regex: bool,
+    untracked: bool = False,
+    files: Optional[List[str]] = None,
+) -> List[str]:
+    """Helper to construct the git grep command line listing the files with matches."""
+    command = ["git", "grep", "--files-with-matches", "-z", "-I", "--no-color"]
+    if untracked:
+        command.append("--untracked")
+    command.append("--perl-regexp" if use_regex else "--fixed-strings")
+    if not case_sensitive:
+        command.append("--ignore-case")
+    if whole_word:
+        command.append("--word-regexp")
+    command.extend(["-e", query, "--"])
+    if files is None:
+        command.extend(_pathspecs(include, exclude))
+    else:
+        command.extend(f":(literal){file}" for file in files)
+    return command
+
+
+class SearchQuery(NamedTuple):
+    """Search handed to a backend."""
+
+    query: str
+    case_sensitive: bool
+    whole_word: bool
+    include: Tuple[str, ...]
+    exclude: Tuple[str, ...]
+    use_regex: bool
+    # Maximal number of lines with matches per file
+    max_count: int
+    # Absolute path of the search folder
+    cwd: str
+    # Files to search relative to the search folder; None for the whole folder
+    files: Optional[List[str]] = None
+    # Number of threads the backend can use; 0 to let it choose
+    threads: int = 0
+    # Time (in ``time.monotonic`` time) after which the search stops
+    deadline: Optional[float] = None
+    # Timings of the search to update
+    timings: Optional[SearchTimings] = None
+
+    def compile(self) -> Optional["re.Pattern"]:
+        """Compile the query for :mod:`re`; ``None`` if it is not supported."""
+        return compile_query(
+            self.query, self.case_sensitive, self.whole_word, self.use_regex
+        )
+
+
+def _timeout(deadline: Optional[float]) -> Optional[float]:
+    return None if deadline is None else max(deadline - time.monotonic(), 0)
+
+
+async def _search_chunks(
+    executor: Optional[Executor],
+    max_pending: int,
+    chunk_size: int,
+    query: SearchQuery,
+    pattern: "re.Pattern",
+    files: List[str],
+) -> AsyncIterator[RipgrepEntry]:
+    """Search files with Python by chunks in an executor.
+
+    Args:
+        executor: The executor running :func:`.pysearch.search_files`
+        max_pending: Maximal number of chunks submitted at once, to bound the memory
+        chunk_size: Number of files per chunk
+        query: The search
+        pattern: The compiled query
+        files: The files to search relative to the search folder
+    Yields:
+        The entries of the matches, as ripgrep reports them, and the summary
+    Raises:
+        asyncio.TimeoutError: if the deadline is passed
+    """
+    loop = asyncio.get_running_loop()
+    matched = 0
+    chunk_size = max(chunk_size, 1)
+    pending: Deque[asyncio.Future] = deque()
+
+    async def next_entries() -> List[RipgrepEntry]:
+        entries: List[RipgrepEntry] = []
+        nonlocal matched
+        chunk = await asyncio.wait_for(pending.popleft(), _timeout(query.deadline))
+        matched += len(chunk)
+        for file, lines in chunk:
+            entries.append(RipgrepBegin(file))
+            entries.extend(lines)
+            entries.append(RipgrepEnd())
+        return entries
+
+    try:
+        for start in range(0, len(files), chunk_size):
+            pending.append(
+                loop.run_in_executor(
+                    executor,
+                    search_files,
+                    query.cwd,
+                    files[start : start + chunk_size],
+                    pattern,
+                    query.max_count,
+                )
+            )
+            if len(pending) < max(max_pending, 1):
+                continue
+            for entry in await next_entries():
+                yield entry
+        while pending:
+            for entry in await next_entries():
+                yield entry
+        yield RipgrepSummary(len(files), matched)
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+class SearchBackend(LoggingConfigurable):
+    """Search the files of a folder.
+
+    Args:
+        engine: The search engine running the commands; it is the parent
+            of the backend configuration.
+    """
+
+    # Name of the backend used to select it
+    name = ""
+
+    def __init__(self, engine, **kwargs) -> None:
+        super().__init__(parent=engine, **kwargs)
+        self._engine = engine
+
+    async def available(self, query: SearchQuery) -> bool:
+        """Whether the backend can run a search.
+
+        Args:
+            query: The search
+        Returns:
+            ``False`` if the backend is not installed or does not support the query
+        """
+        return True
+
+    def search(self, query: SearchQuery) -> AsyncIterator[Optional[RipgrepEntry]]:
+        """Search for a query.
+
+        Args:
+            query: The search
+        Yields:
+            The entries of the matches, as ripgrep reports them
+        Raises:
+            SearchError: if the search fails
+            asyncio.TimeoutError: if the deadline is passed
+        """
+        raise NotImplementedError()
+
+    def close(self) -> None:
+        """Release the backend resources."""
+
+
+class RipgrepBackend(SearchBackend):
+    """Search with ripgrep."""
+
+    name = "ripgrep"
+
+    extra_arguments = ListTrait(
+        Unicode(),
+        [],
+        config=True,
+        help="Additional ripgrep arguments, e.g. ['--hidden', '--no-ignore'].",
+    )
+
+    def __init__(self, engine, **kwargs) -> None:
+        super().__init__(engine, **kwargs)
+        self._installed = shutil.which("rg") is not None
+
+    async def available(self, query: SearchQuery) -> bool:
+        return self._installed
+
+    async def list_files(
+        self, cwd: str, include: List[str], exclude: List[str]
+    ) -> Optional[List[str]]:
+        """List the files to search.
+
+        Args:
+            cwd: The absolute path of the search folder
+            include: Filters specifying files to include
+            exclude: Filters specifying files to exclude
+        Returns:
+            The files relative to the search folder or ``None`` if they cannot be listed
+        """
+        code, output = await self._engine.execute(
+            construct_files_command(include, exclude), cwd=cwd
+        )
+        if code != 0:
+            return None
+        return [file for file in output.splitlines() if file]
+
+    async def search(self, query: SearchQuery) -> AsyncIterator[Optional[RipgrepEntry]]:
+        command = construct_command(
+            query.query,
+            query.case_sensitive,
+            query.whole_word,
+            list(query.include),
+            list(query.exclude),
+            query.use_regex,
+            query.max_count,
+            query.threads,
+        )
+        command[1:1] = self.extra_arguments
+        if query.files is not None:
+            command.extend(query.files)
+
+        lines = self._engine.stream(
+            command, cwd=query.cwd, deadline=query.deadline, timings=query.timings
+        )
+        try:
+            async for line in lines:
+                start = time.monotonic()
+                entry = decode_ripgrep(line)
+                if query.timings is not None:
+                    query.timings.parse += time.monotonic() - start
+                yield entry
+        except SearchError as e:
+            # All files are filtered out, e.g. the folder only contains notebooks
+            if NO_FILES_SEARCHED not in e.message:
+                raise
+        finally:
+            await lines.aclose()
+
+
+class _ThreadedBackend(SearchBackend):
+    """Search the files with Python in a pool of threads of the server process."""
+
+    threads = Integer(
+        4,
+        config=True,
+        help="Number of threads searching the files.",
+    )
+
+    def __init__(self, engine, **kwargs) -> None:
+        super().__init__(engine, **kwargs)
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=max(self.threads, 1),
+                thread_name_prefix=f"search-replace-{self.name}",
+            )
+        return self._executor
+
+    def _search_chunks(
+        self,
+        chunk_size: int,
+        query: SearchQuery,
+        pattern: "re.Pattern",
+        files: List[str],
+    ) -> AsyncIterator[RipgrepEntry]:
+        """Search ``files`` by chunks in the pool of threads; see :func:`_search_chunks`."""
+        return _search_chunks(
+            self._get_executor(),
+            2 * max(self.threads, 1),
+            chunk_size,
+            query,
+            pattern,
+            files,
+        )
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+class GitGrepBackend(_ThreadedBackend):
+    """Search the files tracked by git.
+
+    ``git grep`` lists the files with matches; they are searched with Python
+    to get the matches positions. The regular expressions are interpreted by
+    git as Perl-compatible ones.
+    """
+
+    name = "git"
+
+    untracked = Bool(
+        False,
+        config=True,
+        help="Whether to search the untracked files too, except the ignored ones.",
+    )
+
+    chunk_size = Integer(
+        16,
+        config=True,
+        help="Number of files searched at once by a thread.",
+    )
+
+    def __init__(self, engine, **kwargs) -> None:
+        super().__init__(engine, **kwargs)
+        self._installed = shutil.which("git") is not None
+        self._work_trees: Dict[str, bool] = {}
+
+    async def available(self, query: SearchQuery) -> bool:
+        if not self._installed or query.compile() is None:
+            return False
+        if query.cwd not in self._work_trees:
+            code, output = await self._engine.execute(
+                ["git", "rev-parse", "--is-inside-work-tree"], cwd=query.cwd
+            )
+            self._work_trees[query.cwd] = code == 0 and output.strip() == "true"
+        return self._work_trees[query.cwd]
+
+    async def search(self, query: SearchQuery) -> AsyncIterator[Optional[RipgrepEntry]]:
+        pattern = query.compile()
+        if pattern is None:
+            raise SearchError(
+                2, f"The regular expression '{query.query}' is not supported.", []
+            )
+        command = construct_git_command(
+            query.query,
+            query.case_sensitive,
+            query.whole_word,
+            list(query.include),
+            list(query.exclude),
+            query.use_regex,
+            self.untracked,
+            query.files,
+        )
+        files = []
+        # The file names are terminated by NUL with -z as they may contain new lines
+        names = self._engine.stream(
+            command,
+            cwd=query.cwd,
+            deadline=query.deadline,
+            timings=query.timings,
+            separator=b"\0",
+        )
+        try:
+            async for name in names:
+                files.append(name.decode("utf-8"))
+        finally:
+            await names.aclose()
+
+        entries = self._search_chunks(self.chunk_size, query, pattern, sorted(files))
+        try:
+            async for entry in entries:
+                if isinstance(entry, RipgrepSummary):
+                    # git does not report the number of files it searched
+                    entry = entry._replace(searches=None)
+                yield entry
+        finally:
+            await entries.aclose()
+
+
+class PythonBackend(SearchBackend):
+    """Search with a pool of Python processes.
+
+    The ``.gitignore`` files are not taken into account and the queries must
+    be supported by the Python :mod:`re` module.
+    """
+
+    name = "python"
+
+    processes = Integer(
+        0,
+        config=True,
+        help="Number of processes searching the files; 0 for the number of CPUs.",
+    )
+
+    chunk_size = Integer(
+        64,
+        config=True,
+        help="Number of files searched at once by a process.",
+    )
+
+    def __init__(self, engine, **kwargs) -> None:
+        super().__init__(engine, **kwargs)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._workers = 0
+
+    async def available(self, query: SearchQuery) -> bool:
+        return query.compile() is not None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._workers = self.processes or os.cpu_count() or 1
+            if sys.platform == "win32":
+                # Limit of the process pools on Windows
+                self._workers = min(self._workers, 61)
+            self._pool = ProcessPoolExecutor(
+                max_workers=self._workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._pool
+
+    async def list_files(
+        self, cwd: str, include: List[str], exclude: List[str]
+    ) -> Optional[List[str]]:
+        """List the files to search; see :meth:`RipgrepBackend.list_files`."""
+        return await asyncio.get_running_loop().run_in_executor(
+            None, lambda: list(iter_files(cwd, include, exclude))
+        )
+
+    async def search(self, query: SearchQuery) -> AsyncIterator[Optional[RipgrepEntry]]:
+        pattern = query.compile()
+        if pattern is None:
+            raise SearchError(
+                2, f"The regular expression '{query.query}' is not supported.", []
+            )
+        files = query.files
+        if files is None:
+            files = await self.list_files(
+                query.cwd, list(query.include), list(query.exclude)
+            )
+
+        pool = self._get_pool()
+        entries = _search_chunks(
+            pool, 2 * self._workers, self.chunk_size, query, pattern, files or []
+        )
+        try:
+            async for entry in entries:
+                yield entry
+        finally:
+            await entries.aclose()
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+class IndexBackend(_ThreadedBackend):
+    """Search the files narrowed by the trigram index in the server process.
+
+    It is only available for the literal queries once the index has narrowed
+    the files to search; spawning a process costs more than searching a few files.
+    """
+
+    name = "index"
+
+    max_files = Integer(
+        200,
+        config=True,
+        help="Maximal number of files narrowed by the index to search them in the server process.",
+    )
+
+    async def available(self, query: SearchQuery) -> bool:
+        return (
+            self._engine._index is not None
+            and not query.use_regex
+            and query.files is not None
+            and len(query.files) <= self.max_files
+            and query.compile() is not None
+        )
+
+    async def search(self, query: SearchQuery) -> AsyncIterator[Optional[RipgrepEntry]]:
+        pattern = query.compile()
+        if pattern is None or query.files is None:
+            raise SearchError(
+                2, "The files to search are not narrowed by the index.", []
+            )
+        entries = self._search_chunks(16, query, pattern, query.files)
+        try:
+            async for entry in entries:
+                yield entry
+        finally:
+            await entries.aclose()
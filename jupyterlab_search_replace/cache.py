@@ -0,0 +1,270 @@
+"""Reuse of the search results"""
+
+import asyncio
+import hashlib
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import Hashable, List, NamedTuple, Optional, Union
+
+from .codec import dumps
+from .log import get_logger
+from .watcher import FileWatcher, is_changed
+
+
+class _CacheEntry(NamedTuple):
+    path: str
+    token: Union[int, str]
+    matches: List[dict]
+    size: int
+
+
+def get_tree_signature(folder: Path) -> str:
+    """Get a signature of the modification time and size of the files within ``folder``.
+
+    Hidden files and folders are skipped as ripgrep does not search them by default.
+
+    Args:
+        folder: The folder to sign
+    Returns:
+        The signature
+    """
+    digest = hashlib.sha1()
+    for dirpath, dirnames, filenames in os.walk(folder):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        for filename in sorted(filenames):
+            if filename.startswith("."):
+                continue
+            try:
+                stat = os.stat(os.path.join(dirpath, filename))
+            except OSError:
+                continue
+            digest.update(
+                f"{dirpath}/{filename}:{stat.st_mtime_ns}:{stat.st_size}\n".encode(
+                    "utf-8", "surrogateescape"
+                )
+            )
+    return digest.hexdigest()
+
+
+class ChangeTracker:
+    """Detect whether files changed in a folder between two points in time.
+
+    If a files watcher is running, the changes are looked up in its journal;
+    a polling watcher journals them at its next scan. Otherwise the
+    modification time and size of the files in the folder are compared, which
+    walks the whole folder at each lookup.
+
+    Args:
+        root_dir: The server root directory
+        watcher: Optional journal of the files changes
+    """
+
+    def __init__(self, root_dir: Path, watcher: Optional[FileWatcher] = None) -> None:
+        self._root_dir = root_dir
+        self._watcher = watcher
+
+    async def token(self, path: str) -> Union[int, str]:
+        """Get a token describing the current state of a folder.
+
+        Args:
+            path: The folder relative to the root directory, in POSIX format
+        Returns:
+            The token to pass to :meth:`unchanged`
+        """
+        if self._watcher is not None and self._watcher.journaling:
+            return self._watcher.version
+        return await asyncio.get_running_loop().run_in_executor(
+            None, get_tree_signature, self._root_dir / path
+        )
+
+    def unchanged(
+        self, path: str, token: Union[int, str], current: Union[int, str]
+    ) -> bool:
+        """Whether no file changed in a folder between two tokens.
+
+        Args:
+            path: The folder relative to the root directory, in POSIX format
+            token: The token of the folder at the earliest point in time
+            current: The current token of the folder
+        Returns:
+            ``True`` if the folder is unchanged
+        """
+        if isinstance(token, str) or isinstance(current, str):
+            return token == current
+
+        changes = self._watcher.changes_since(token)
+        if changes is None:
+            return False
+        prefix = "" if path == "." else path.strip("/")
+        # The folder is changed by a change within it or of one of its parents
+        return not (
+            is_changed(prefix, changes)
+            or any(
+                prefix == "" or change.startswith(prefix + "/") for change in changes
+            )
+        )
+
+
+class SearchCache:
+    """Least recently used cache of search results.
+
+    A cached result is valid as long as no file changed in the searched folder.
+
+    Args:
+        max_size: Memory budget in bytes of the cached results
+        tracker: Files changes tracker
+    """
+
+    def __init__(self, max_size: int, tracker: ChangeTracker) -> None:
+        self.max_size = max_size
+        self._tracker = tracker
+        self._entries: "OrderedDict[Hashable, _CacheEntry]" = OrderedDict()
+        self._size = 0
+
+    @property
+    def size(self) -> int:
+        """Estimated memory size in bytes of the cached results."""
+        return self._size
+
+    def lookup(
+        self, key: Hashable, path: str, token: Union[int, str]
+    ) -> Optional[List[dict]]:
+        """Get the cached result of a search.
+
+        Args:
+            key: The search arguments
+            path: The searched folder relative to the root directory, in POSIX format
+            token: The current token of the searched folder
+        Returns:
+            The cached matches or ``None``
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        if self._tracker.unchanged(path, entry.token, token):
+            self._entries.move_to_end(key)
+            get_logger().debug(f"Search cache hit for {key!s}")
+            return entry.matches
+
+        self._remove(key)
+        return None
+
+    def store(
+        self, key: Hashable, path: str, token: Union[int, str], matches: List[dict]
+    ) -> None:
+        """Cache the result of a search.
+
+        Args:
+            key: The search arguments
+            path: The searched folder relative to the root directory, in POSIX format
+            token: The token of the searched folder before the search
+            matches: The search result
+        """
+        size = len(dumps(matches))
+        if size > self.max_size:
+            return
+
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = _CacheEntry(path, token, matches, size)
+        self._size += size
+        while self._size > self.max_size:
+            self._remove(next(iter(self._entries)))
+
+    def clear(self) -> None:
+        """Empty the cache."""
+        self._entries.clear()
+        self._size = 0
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._entries.pop(key)
+        self._size -= entry.size
+
+
+class _LastSearch(NamedTuple):
+    key: Hashable
+    path: str
+    query: str
+    token: Union[int, str]
+    files: List[str]
+
+
+class QueryRefiner:
+    """Narrow a literal search to the files matched by the previous search of a session.
+
+    While typing, a literal query is usually extended; a file matching the new
+    query contains the previous one so only the files that matched before need
+    to be searched, as long as no file changed in the meantime.
+
+    Args:
+        tracker: Files changes tracker
+        max_sessions: Maximal number of sessions remembered
+    """
+
+    def __init__(self, tracker: ChangeTracker, max_sessions: int = 128) -> None:
+        self._tracker = tracker
+        self.max_sessions = max_sessions
+        self._searches: "OrderedDict[Hashable, _LastSearch]" = OrderedDict()
+
+    def candidates(
+        self,
+        session: Hashable,
+        key: Hashable,
+        path: str,
+        query: str,
+        token: Union[int, str],
+    ) -> Optional[List[str]]:
+        """Get the files to search if ``query`` refines the previous search of ``session``.
+
+        Args:
+            session: The client session
+            key: The search arguments other than the query
+            path: The searched folder relative to the root directory, in POSIX format
+            query: The literal search term
+            token: The current token of the searched folder
+        Returns:
+            The files relative to the searched folder or ``None`` if the
+            whole folder must be searched.
+        """
+        last = self._searches.get(session)
+        if (
+            last is None
+            or last.key != key
+            or last.query not in query
+            or not self._tracker.unchanged(path, last.token, token)
+        ):
+            return None
+        get_logger().debug(
+            f"Refining search '{last.query}' to '{query}' in {len(last.files)} files."
+        )
+        return last.files
+
+    def record(
+        self,
+        session: Hashable,
+        key: Hashable,
+        path: str,
+        query: str,
+        token: Union[int, str],
+        files: List[str],
+    ) -> None:
+        """Remember the files matched by a completed literal search.
+
+        Args:
+            session: The client session
+            key: The search arguments other than the query
+            path: The searched folder relative to the root directory, in POSIX format
+            query: The literal search term
+            token: The token of the searched folder before the search
+            files: The matched files relative to the searched folder
+        """
+        self._searches[session] = _LastSearch(key, path, query, token, files)
+        self._searches.move_to_end(session)
+        while len(self._searches) > self.max_sessions:
+            self._searches.popitem(last=False)
+
+    def forget(self) -> None:
+        """Forget the previous searches."""
+        self._searches.clear()
@@ -0,0 +1,205 @@
+"""Checkpoints of the files modified by replace operations
+
+The checkpoints of the files of an operation are created through the
+contents manager concurrently, with a bounded number of requests in flight,
+as each one may be a round trip to a remote checkpoint store. The
+checkpoints of the last operations are kept to undo them at once; only the
+user who replaced the files can undo an operation.
+
+The contents manager keeps a single checkpoint per file, so creating the
+checkpoint of a file invalidates the previous operations on that file: they
+cannot be undone anymore. The checkpoint may also be overwritten outside of
+a replace, when the user saves a file with a checkpoint; the checkpoints of
+an operation are therefore checked to be unchanged before being restored.
+"""
+
+import asyncio
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from jupyter_server.utils import ensure_async
+
+from .log import get_logger
+
+
+class OperationNotFoundError(KeyError):
+    """Error raised when a replace operation is unknown, too old or superseded."""
+
+    def __str__(self) -> str:
+        return (
+            f"Replace operation '{self.args[0]}' not found, too old or superseded"
+            " by a later replace of the same files."
+        )
+
+
+class OperationConflictError(Exception):
+    """Error raised when a checkpoint of a replace operation was overwritten."""
+
+    def __init__(self, operation: str, paths: List[str]) -> None:
+        super().__init__(operation, paths)
+        self.operation = operation
+        self.paths = paths
+
+    def __str__(self) -> str:
+        return (
+            f"Replace operation '{self.operation}' cannot be undone: the checkpoint"
+            f" of {', '.join(self.paths)} changed since the replace."
+        )
+
+
+class _Operation:
+    def __init__(self, checkpoints: Dict[str, dict], user: str) -> None:
+        self.checkpoints = checkpoints
+        self.user = user
+
+
+class CheckpointHistory:
+    """Create the checkpoints of replace operations and restore them.
+
+    Args:
+        contents_manager: The contents manager storing the checkpoints
+        max_operations: Number of operations that can be undone
+        concurrency: Maximal number of checkpoints created or restored concurrently
+    """
+
+    def __init__(
+        self, contents_manager, max_operations: int = 16, concurrency: int = 16
+    ) -> None:
+        self._contents_manager = contents_manager
+        self.max_operations = max_operations
+        self.concurrency = concurrency
+        self._operations: "OrderedDict[str, _Operation]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._operations)
+
+    async def create(
+        self, paths: List[str], cancelled: Callable[[], bool] = lambda: False
+    ) -> Tuple[Dict[str, dict], Dict[str, Exception]]:
+        """Create the checkpoints of files.
+
+        The recorded operations with a file whose checkpoint is created are
+        forgotten, as the checkpoint they would restore is overwritten.
+
+        Args:
+            paths: The files paths relative to the contents manager root
+            cancelled: Whether to stop creating the checkpoints
+        Returns:
+            (checkpoints, errors): The checkpoint model ``{"id", "last_modified"}``
+                and the error per file
+        """
+        semaphore = asyncio.Semaphore(max(self.concurrency, 1))
+        checkpoints: Dict[str, dict] = {}
+        errors: Dict[str, Exception] = {}
+
+        async def create_checkpoint(path: str) -> None:
+            async with semaphore:
+                if cancelled():
+                    return
+                get_logger().debug(f"Creating checkpoints for {path}")
+                try:
+                    model = await ensure_async(
+                        self._contents_manager.create_checkpoint(path)
+                    )
+                except Exception as e:
+                    errors[path] = e
+                else:
+                    checkpoints[path] = model
+
+        await asyncio.gather(*(create_checkpoint(path) for path in paths))
+        # Even on failure, the previous checkpoint may have been overwritten
+        self._forget(checkpoints.keys() | errors.keys())
+        return checkpoints, errors
+
+    def _forget(self, paths: Set[str]) -> None:
+        """Forget the operations on ``paths``."""
+        for operation, record in list(self._operations.items()):
+            if not paths.isdisjoint(record.checkpoints):
+                get_logger().debug(
+                    f"Replace operation {operation} superseded; it cannot be undone."
+                )
+                del self._operations[operation]
+
+    def record(self, checkpoints: Dict[str, dict], user: str = "") -> str:
+        """Record the checkpoints of an operation to undo it.
+
+        The oldest operation is forgotten beyond ``max_operations``.
+
+        Args:
+            checkpoints: The checkpoint model per modified file, as created
+            user: The user who modified the files
+        Returns:
+            The operation id
+        """
+        operation = uuid.uuid4().hex
+        self._operations[operation] = _Operation(checkpoints, user)
+        while len(self._operations) > max(self.max_operations, 0):
+            self._operations.popitem(last=False)
+        return operation
+
+    async def restore(self, operation: str, user: str = "") -> dict:
+        """Undo an operation by restoring the checkpoints of its files.
+
+        Args:
+            operation: The operation id
+            user: The user undoing the operation
+        Returns:
+            The report ``{"operation", "total", "restored", "errors"}``
+        Raises:
+            OperationNotFoundError: if the operation is unknown, too old, superseded
+                or belongs to another user
+            OperationConflictError: if a checkpoint of the operation was
+                overwritten since the replace; no file is restored
+        """
+        record = self._operations.get(operation)
+        # Don't tell another user that the operation exists
+        if record is None or record.user != user:
+            raise OperationNotFoundError(operation)
+        del self._operations[operation]
+        checkpoints = record.checkpoints
+
+        semaphore = asyncio.Semaphore(max(self.concurrency, 1))
+        stale: List[str] = []
+
+        async def check_checkpoint(path: str, model: dict) -> None:
+            async with semaphore:
+                current = await self._get_checkpoint(path, model["id"])
+            if current is None or current["last_modified"] != model["last_modified"]:
+                stale.append(path)
+
+        await asyncio.gather(*(check_checkpoint(*item) for item in checkpoints.items()))
+        if stale:
+            raise OperationConflictError(operation, sorted(stale))
+
+        errors: List[Dict[str, str]] = []
+
+        async def restore_checkpoint(path: str, model: dict) -> None:
+            checkpoint_id = model["id"]
+            async with semaphore:
+                try:
+                    await ensure_async(
+                        self._contents_manager.restore_checkpoint(checkpoint_id, path)
+                    )
+                except Exception as e:
+                    get_logger().error(f"Failed to restore {path}: {e!s}")
+                    errors.append({"path": path, "message": str(e) or repr(e)})
+
+        await asyncio.gather(
+            *(restore_checkpoint(*item) for item in checkpoints.items())
+        )
+        return {
+            "operation": operation,
+            "total": len(checkpoints),
+            "restored": len(checkpoints) - len(errors),
+            "errors": errors,
+        }
+
+    async def _get_checkpoint(self, path: str, checkpoint_id: str) -> Optional[dict]:
+        """Get the current model of a checkpoint of ``path``, if any."""
+        try:
+            models = await ensure_async(self._contents_manager.list_checkpoints(path))
+        except Exception as e:
+            get_logger().debug(f"Failed to list the checkpoints of {path}: {e!s}")
+            return None
+        return next((m for m in models if m["id"] == checkpoint_id), None)
@@ -0,0 +1,199 @@
+"""JSON encoding and decoding
+
+The ripgrep output is decoded into typed structures with `msgspec
+<https://jcristharif.com/msgspec/>`_ if it is installed, with `orjson
+<https://github.com/ijl/orjson>`_ or the standard library otherwise.
+The responses are encoded with orjson if it is installed.
+"""
+
+import json
+from typing import Any, List, NamedTuple, Optional, Tuple, Union
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+class RipgrepBegin(NamedTuple):
+    """Start of the matches of a file."""
+
+    path: Optional[str]
+
+
+class RipgrepMatch(NamedTuple):
+    """Line with matches; ``submatches`` are ``(text, start, end)`` in bytes.
+
+    For a notebook, ``cell`` is the index of the cell and ``output`` the index of
+    the output of the cell if the line is in an output.
+    """
+
+    line: Optional[str]
+    line_number: Optional[int]
+    absolute_offset: Optional[int]
+    submatches: List[Tuple[Optional[str], int, int]]
+    cell: Optional[int] = None
+    output: Optional[int] = None
+
+
+class RipgrepEnd(NamedTuple):
+    """End of the matches of a file."""
+
+
+class RipgrepSummary(NamedTuple):
+    """Statistics of a whole search: number of files searched and with matches."""
+
+    searches: Optional[int] = None
+    searches_with_match: Optional[int] = None
+    bytes_searched: Optional[int] = None
+
+
+RipgrepEntry = Union[RipgrepBegin, RipgrepMatch, RipgrepEnd, RipgrepSummary]
+
+_END = RipgrepEnd()
+
+
+def dumps(obj: Any) -> bytes:
+    """Serialize ``obj`` to UTF-8 encoded JSON.
+
+    Args:
+        obj: The object to serialize
+    Returns:
+        The JSON document
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode("utf-8")
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """Deserialize a JSON document.
+
+    Args:
+        data: The JSON document
+    Returns:
+        The deserialized object
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _decode_ripgrep_dict(line: Union[bytes, str]) -> Optional[RipgrepEntry]:
+    entry = loads(line)
+    entry_type = entry.get("type")
+    if entry_type == "begin":
+        return RipgrepBegin(entry.get("data", {}).get("path", {}).get("text"))
+    elif entry_type == "match":
+        data = entry.get("data")
+        return RipgrepMatch(
+            data.get("lines", {}).get("text"),
+            data.get("line_number"),
+            data.get("absolute_offset"),
+            [
+                (match.get("match", {}).get("text"), match["start"], match["end"])
+                for match in data.get("submatches", [])
+            ],
+        )
+    elif entry_type == "end":
+        return _END
+    elif entry_type == "summary":
+        stats = entry.get("data", {}).get("stats", {})
+        return RipgrepSummary(
+            stats.get("searches"),
+            stats.get("searches_with_match"),
+            stats.get("bytes_searched"),
+        )
+    return None
+
+
+if msgspec is not None:
+    # ripgrep JSON output is described at https://docs.rs/grep-printer/latest/grep_printer/struct.JSON.html
+    # Only the fields used are declared; the others are skipped by the decoder.
+
+    class _Data(msgspec.Struct):
+        # Non UTF-8 data is base64 encoded in a "bytes" field instead
+        text: Optional[str] = None
+
+    class _Submatch(msgspec.Struct):
+        match: _Data
+        start: int
+        end: int
+
+    class _BeginData(msgspec.Struct):
+        path: _Data
+
+    class _MatchData(msgspec.Struct):
+        lines: _Data
+        line_number: Optional[int] = None
+        absolute_offset: Optional[int] = None
+        submatches: List[_Submatch] = []
+
+    class _Begin(msgspec.Struct, tag_field="type", tag="begin"):
+        data: _BeginData
+
+    class _Match(msgspec.Struct, tag_field="type", tag="match"):
+        data: _MatchData
+
+    class _End(msgspec.Struct, tag_field="type", tag="end"):
+        pass
+
+    class _Context(msgspec.Struct, tag_field="type", tag="context"):
+        pass
+
+    class _Stats(msgspec.Struct, frozen=True):
+        searches: Optional[int] = None
+        searches_with_match: Optional[int] = None
+        bytes_searched: Optional[int] = None
+
+    class _SummaryData(msgspec.Struct, frozen=True):
+        stats: _Stats = _Stats()
+
+    class _Summary(msgspec.Struct, tag_field="type", tag="summary"):
+        data: _SummaryData = _SummaryData()
+
+    _decoder = msgspec.json.Decoder(Union[_Begin, _Match, _End, _Context, _Summary])
+
+    def _decode_ripgrep_struct(line: Union[bytes, str]) -> Optional[RipgrepEntry]:
+        entry = _decoder.decode(line)
+        if isinstance(entry, _Match):
+            data = entry.data
+            return RipgrepMatch(
+                data.lines.text,
+                data.line_number,
+                data.absolute_offset,
+                [
+                    (match.match.text, match.start, match.end)
+                    for match in data.submatches
+                ],
+            )
+        elif isinstance(entry, _Begin):
+            return RipgrepBegin(entry.data.path.text)
+        elif isinstance(entry, _End):
+            return _END
+        elif isinstance(entry, _Summary):
+            stats = entry.data.stats
+            return RipgrepSummary(
+                stats.searches, stats.searches_with_match, stats.bytes_searched
+            )
+        return None
+
+    _decode_ripgrep = _decode_ripgrep_struct
+else:  # pragma: no cover
+    _decode_ripgrep = _decode_ripgrep_dict
+
+
+def decode_ripgrep(line: Union[bytes, str]) -> Optional[RipgrepEntry]:
+    """Decode a line of ripgrep JSON output.
+
+    Args:
+        line: The JSON line
+    Returns:
+        The entry or ``None`` if it is not of interest
+    """
+    return _decode_ripgrep(line)
@@ -1,68 +1,576 @@
 import asyncio
 import json
+import time
+import uuid
+from typing import Dict, Optional
 
 import tornado
-from jupyter_server.base.handlers import APIHandler, path_regex
+from jupyter_server.base.handlers import APIHandler, JupyterHandler, path_regex
 from jupyter_server.utils import url_path_join
+from tornado.iostream import StreamClosedError
+from tornado.websocket import WebSocketClosedError, WebSocketHandler
 
-from .search_engine import SearchEngine
+try:
+    from jupyter_server.base.websocket import WebSocketMixin
+except ImportError:  # jupyter_server < 2
+    from jupyter_server.base.zmqhandlers import WebSocketMixin
+
+from .codec import dumps
+from .checkpoints import OperationConflictError, OperationNotFoundError
+from .jobs import JobNotFoundError
+from .metrics import record_serialization
+from .pagination import CursorNotFoundError
+from .scheduler import SearchQueueFullError
+from .search_engine import (
+    ReplaceConflictError,
+    SearchEngine,
+    SearchError,
+    SearchStats,
+    get_matches_etag,
+)
+
+# Namespace of the endpoints not taking a path
+NAMESPACE = "search-replace"
+
+
+def _get_username(handler: JupyterHandler) -> str:
+    """Get the name of the user of a request."""
+    user = handler.current_user
+    # jupyter_server < 2 current user may be a string
+    return getattr(user, "username", None) or str(user or "")
 
 
 class RouteHandler(APIHandler):
-    def initialize(self) -> None:
-        self._engine = SearchEngine(self.contents_manager)
+    def initialize(self, engine: SearchEngine) -> None:
+        self._engine = engine
+
+    def _search_arguments(self, path: str) -> tuple:
+        """Get the search arguments from the query arguments of the request."""
+        return (
+            self.get_query_argument("query"),
+            path,
+            self.get_query_argument("case_sensitive", "false") == "true",
+            self.get_query_argument("whole_word", "false") == "true",
+            self.get_query_arguments("include"),
+            self.get_query_arguments("exclude"),
+            self.get_query_argument("use_regex", "false") == "true",
+            int(self.get_query_argument("max_count", "100")),
+            _get_username(self),
+            self.get_query_argument("session", ""),
+        )
+
+    def _get_backend(self) -> Optional[str]:
+        """Get the search backend from the query arguments of the request.
+
+        Raises:
+            ValueError: if the backend is unknown
+        """
+        backend = self.get_query_argument("backend", None)
+        if backend and backend not in self._engine.backend_names:
+            raise ValueError(f"Unknown search backend '{backend}'.")
+        return backend
 
     @tornado.web.authenticated
     async def get(self, path: str = ""):
-        """GET request handler to perform a search."""
-        query = self.get_query_argument("query")
-        case_sensitive = self.get_query_argument("case_sensitive", "false") == "true"
-        whole_word = self.get_query_argument("whole_word", "false") == "true"
-        include = self.get_query_arguments("include")
-        exclude = self.get_query_arguments("exclude")
-        use_regex = self.get_query_argument("use_regex", "false") == "true"
-        max_count = int(self.get_query_argument("max_count", "100"))
+        """GET request handler to perform a search.
+
+        The complete results are tagged with an ``Etag`` header identifying
+        the matches; see :func:`get_matches_etag`.
+
+        The ``backend`` argument selects the backend running the search;
+        see :attr:`SearchEngine.search_backend`.
+
+        With ``timings=true``, the response has the ``timings`` of the search
+        phases; see :class:`.metrics.SearchTimings`. Its serialization is not
+        timed in the response but is still recorded by the metrics. It is
+        ignored by the paginated searches.
+        """
+        page_size = int(self.get_query_argument("page_size", "0"))
+        replace = self.get_query_argument("replace", None)
         try:
-            r = await self._engine.search(
-                query,
-                path,
-                case_sensitive,
-                whole_word,
-                include,
-                exclude,
-                use_regex,
-                max_count,
+            backend = self._get_backend()
+        except ValueError as e:
+            self.set_status(400)
+            self.finish(dumps({"code": 8, "message": str(e)}))
+            return
+        timings = self.get_query_argument("timings", "false") == "true"
+        args = self._search_arguments(path)
+        if self.get_query_argument("stream", "false") == "true":
+            await self._stream_search(
+                *args, replace=replace, backend=backend, timings=timings
             )
+            return
+
+        stats = SearchStats()
+        try:
+            if page_size > 0:
+                r = await self._engine.search_paginated(
+                    *args, page_size, replace=replace, backend=backend
+                )
+            else:
+                r = await self._engine.search(
+                    *args, replace=replace, backend=backend, stats=stats
+                )
         except asyncio.exceptions.CancelledError:
             r = {"code": 1, "message": "Task was cancelled."}
+        except SearchQueueFullError as e:
+            r = {"code": 4, "message": str(e)}
         except FileNotFoundError as e:
             if "'rg'" in str(e):
                 r = {"code": 2, "message": "ripgrep command not found."}
             else:
                 raise e
 
-        if r.get("code") is not None:
+        if r.get("code") == 4:
+            self.set_status(503)
+            self.set_header("Retry-After", "1")
+        elif r.get("code") is not None:
             self.set_status(500)
         else:
             self.set_status(200)
+            if "cursor" not in r and not r.get("truncated"):
+                self.set_header("Etag", f'"{get_matches_etag(r["matches"])}"')
+
+        if timings and page_size <= 0:
+            # The response is not serialized yet: its serialization is not timed
+            r["timings"] = stats.timings.to_dict()
+        start = time.monotonic()
+        body = dumps(r)
+        stats.timings.serialize = time.monotonic() - start
+        record_serialization(stats.timings.serialize)
+        self.finish(body)
 
-        self.finish(json.dumps(r))
+    async def _stream_search(
+        self,
+        *args,
+        replace: Optional[str] = None,
+        backend: Optional[str] = None,
+        timings: bool = False,
+    ) -> None:
+        """Send the search results as newline-delimited JSON.
+
+        Each line is the matches of a file ``{"path", "matches"}``. If the search
+        fails, the last line is the error description ``{"code", "message"}``.
+        If the search is stopped by a limit, the last line is ``{"truncated", "stats"}``.
+        If ``timings`` is set, a final line ``{"timings"}`` follows.
+        """
+        self.set_header("Content-Type", "application/x-ndjson")
+        stats = SearchStats()
+        stream = self._engine.search_stream(
+            *args, stats=stats, replace=replace, backend=backend
+        )
+        try:
+            async for file_matches in stream:
+                start = time.monotonic()
+                data = dumps(file_matches)
+                stats.timings.serialize += time.monotonic() - start
+                self.write(data + b"\n")
+                await self.flush()
+            if stats.truncated is not None:
+                self.write(dumps({"truncated": True, "stats": stats.to_dict()}) + b"\n")
+        except SearchError as e:
+            self.write(dumps(e.to_dict()) + b"\n")
+        except asyncio.CancelledError:
+            self.write(dumps({"code": 1, "message": "Task was cancelled."}) + b"\n")
+        except SearchQueueFullError as e:
+            self.set_status(503)
+            self.set_header("Retry-After", "1")
+            self.write(dumps({"code": 4, "message": str(e)}) + b"\n")
+        except FileNotFoundError as e:
+            if "'rg'" in str(e):
+                self.set_status(500)
+                self.write(
+                    dumps({"code": 2, "message": "ripgrep command not found."}) + b"\n"
+                )
+            else:
+                raise e
+        except StreamClosedError:
+            # The client has gone away
+            return
+        finally:
+            await stream.aclose()
+            record_serialization(stats.timings.serialize)
+
+        if timings:
+            self.write(dumps({"timings": stats.timings.to_dict()}) + b"\n")
+        self.finish()
 
     @tornado.web.authenticated
     async def post(self, path: str = ""):
-        """POST request handler to perform a replace action."""
-        json_body = self.get_json_body()
-        matches = json_body["matches"]
+        """POST request handler to perform a replace action.
+
+        The matches to replace are either in the body ``{"matches"}`` or found by
+        the search described by the query arguments, as for a GET request, with
+        the required ``replace`` template. In the latter case, the replace is only applied
+        if the matches have the number ``expected_count`` and the tag given by
+        the ``If-Match`` header.
+
+        With ``background=true``, the replace runs as a job whose state is
+        returned right away; it is then polled from ``search-replace/jobs/<id>``.
+        """
+        if self.get_query_argument("query", None) is None:
+            matches = self.get_json_body()["matches"]
+        else:
+            expected_count = self.get_query_argument("expected_count", None)
+            etag = self.request.headers.get("If-Match")
+            replace = self.get_query_argument("replace", None)
+            try:
+                if replace is None:
+                    # An empty template deletes the matches; it must be explicit
+                    raise ValueError("The replace argument is missing.")
+                matches = await self._engine.find_replacements(
+                    *self._search_arguments(path),
+                    replace,
+                    None if expected_count is None else int(expected_count),
+                    None if etag is None else etag.strip().strip('"'),
+                    self._get_backend(),
+                )
+            except ReplaceConflictError as e:
+                r = {"code": 7, "message": str(e)}
+                self.set_status(412)
+            except ValueError as e:
+                r = {"code": 8, "message": str(e)}
+                self.set_status(400)
+            except SearchError as e:
+                r = e.to_dict()
+                self.set_status(500)
+            except asyncio.CancelledError:
+                r = {"code": 1, "message": "Task was cancelled."}
+                self.set_status(500)
+            except SearchQueueFullError as e:
+                r = {"code": 4, "message": str(e)}
+                self.set_status(503)
+                self.set_header("Retry-After", "1")
+            except FileNotFoundError as e:
+                if "'rg'" in str(e):
+                    r = {"code": 2, "message": "ripgrep command not found."}
+                    self.set_status(500)
+                else:
+                    raise e
+            else:
+                r = None
+            if r is not None:
+                self.finish(dumps(r))
+                return
+
+        background = self.get_query_argument("background", "false") == "true"
+        try:
+            if background:
+                job = self._engine.start_replace(
+                    matches, path, user=_get_username(self)
+                )
+            else:
+                report = await self._engine.replace(
+                    matches, path, user=_get_username(self)
+                )
+        except ValueError as e:
+            self.set_status(400)
+            self.finish(dumps({"code": 8, "message": str(e)}))
+            return
+
+        if background:
+            self.set_status(202)
+            self.set_header(
+                "Location",
+                url_path_join(self.base_url, NAMESPACE, "jobs", job["id"]),
+            )
+            self.finish(dumps(job))
+            return
+
+        self.set_status(500 if report.errors else 201)
+        self.finish(dumps(report.to_dict()))
+
+
+class PageHandler(APIHandler):
+    def initialize(self, engine: SearchEngine) -> None:
+        self._engine = engine
+
+    @tornado.web.authenticated
+    async def get(self):
+        """GET request handler to get the next page of a paginated search."""
+        cursor = self.get_query_argument("cursor")
+        page_size = int(self.get_query_argument("page_size", "50"))
+        try:
+            r = await self._engine.pager.next(cursor, page_size, _get_username(self))
+        except CursorNotFoundError as e:
+            r = {"code": 5, "message": str(e)}
+        except SearchError as e:
+            r = e.to_dict()
+        except asyncio.CancelledError:
+            r = {"code": 1, "message": "Task was cancelled."}
+        except SearchQueueFullError as e:
+            r = {"code": 4, "message": str(e)}
+
+        if r.get("code") == 5:
+            self.set_status(404)
+        elif r.get("code") == 4:
+            self.set_status(503)
+            self.set_header("Retry-After", "1")
+        elif r.get("code") is not None:
+            self.set_status(500)
+        self.finish(dumps(r))
+
+    @tornado.web.authenticated
+    async def delete(self):
+        """DELETE request handler to stop a paginated search."""
+        cursor = self.get_query_argument("cursor")
+        try:
+            await self._engine.pager.close(cursor, _get_username(self))
+        except CursorNotFoundError as e:
+            self.set_status(404)
+            self.finish(dumps({"code": 5, "message": str(e)}))
+            return
+        self.set_status(204)
+        self.finish()
+
 
-        await self._engine.replace(matches, path)
+class JobHandler(APIHandler):
+    def initialize(self, engine: SearchEngine) -> None:
+        self._engine = engine
 
-        self.set_status(201)
+    @tornado.web.authenticated
+    def get(self, job_id: str):
+        """GET request handler to get the progress of a replace job."""
+        try:
+            self.finish(dumps(self._engine.jobs.get(job_id, _get_username(self))))
+        except JobNotFoundError as e:
+            self.set_status(404)
+            self.finish(dumps({"code": 6, "message": str(e)}))
+
+    @tornado.web.authenticated
+    def delete(self, job_id: str):
+        """DELETE request handler to cancel a replace job."""
+        try:
+            job = self._engine.jobs.cancel(job_id, _get_username(self))
+        except JobNotFoundError as e:
+            self.set_status(404)
+            self.finish(dumps({"code": 6, "message": str(e)}))
+            return
+        self.set_status(202)
+        self.finish(dumps(job))
+
+
+class UndoHandler(APIHandler):
+    def initialize(self, engine: SearchEngine) -> None:
+        self._engine = engine
+
+    @tornado.web.authenticated
+    async def post(self, operation: str):
+        """POST request handler to undo a replace operation."""
+        try:
+            r = await self._engine.undo(operation, _get_username(self))
+        except OperationNotFoundError as e:
+            self.set_status(404)
+            self.finish(dumps({"code": 9, "message": str(e)}))
+            return
+        except OperationConflictError as e:
+            self.set_status(409)
+            self.finish(dumps({"code": 10, "message": str(e), "paths": e.paths}))
+            return
+        self.set_status(500 if r["errors"] else 200)
+        self.finish(dumps(r))
+
+
+class StatusHandler(APIHandler):
+    def initialize(self, engine: SearchEngine) -> None:
+        self._engine = engine
+
+    @tornado.web.authenticated
+    def get(self):
+        """GET request handler to get the search load and limits."""
+        self.finish(dumps(self._engine.scheduler.status()))
+
+
+# Types and default values of the fields of a websocket search message
+_SEARCH_FIELDS = (
+    ("query", str, ""),
+    ("path", str, ""),
+    ("case_sensitive", bool, False),
+    ("whole_word", bool, False),
+    ("include", list, []),
+    ("exclude", list, []),
+    ("use_regex", bool, False),
+    ("max_count", int, 100),
+    ("replace", (str, type(None)), None),
+    ("backend", (str, type(None)), None),
+)
+
+
+def _get_search_fields(content: dict) -> dict:
+    """Get the search arguments of a websocket message.
+
+    Raises:
+        ValueError: if a field has not the expected type
+    """
+    fields = {}
+    for name, types, default in _SEARCH_FIELDS:
+        value = content.get(name, default)
+        valid = isinstance(value, types)
+        if types is int:
+            # A boolean is not a valid count
+            valid = valid and not isinstance(value, bool)
+        elif types is list:
+            valid = valid and all(isinstance(v, str) for v in value)
+        if not valid:
+            raise ValueError(f"Invalid value {value!r} for the field '{name}'.")
+        fields[name] = value
+    return fields
+
+
+class SearchWebSocketHandler(WebSocketMixin, WebSocketHandler, JupyterHandler):
+    """WebSocket channel pushing the search results as ripgrep finds them.
+
+    The client sends JSON messages tagged with a request ``id``:
 
+    - ``{"id", "action": "search", "query", "path", ...}`` starts a search; the
+      other keys are the :meth:`SearchEngine.search` arguments. A new search
+      cancels the searches still running on the channel.
+    - ``{"id", "action": "cancel"}`` cancels the search ``id``.
 
-def setup_handlers(web_app):
+    The server answers with messages tagged with the same ``id``:
+
+    - ``{"id", "type": "matches", "matches": [...]}`` for each file with matches
+    - ``{"id", "type": "done"}`` once the search is completed
+    - ``{"id", "type": "cancelled"}`` if the search was cancelled
+    - ``{"id", "type": "error", "code", "message"}`` if the search failed or
+      the message is invalid
+    """
+
+    async def get(self, *args, **kwargs):
+        if self.current_user is None:
+            raise tornado.web.HTTPError(403)
+        await super().get(*args, **kwargs)
+
+    def initialize(self, engine: SearchEngine) -> None:
+        self._engine = engine
+        self._session = uuid.uuid4().hex
+        self._searches: Dict[str, asyncio.Task] = {}
+
+    def on_message(self, message) -> None:
+        try:
+            content = json.loads(message)
+            request_id = content["id"]
+            action = content["action"]
+        except (ValueError, KeyError, TypeError):
+            self.log.warning(f"Invalid search-replace message: {message!s}")
+            return
+
+        if action == "search":
+            try:
+                fields = _get_search_fields(content)
+            except ValueError as e:
+                self._send(request_id, {"type": "error", "code": 3, "message": str(e)})
+                return
+            for task in self._searches.values():
+                task.cancel()
+            self._searches[request_id] = asyncio.ensure_future(
+                self._search(request_id, content, fields)
+            )
+        elif action == "cancel":
+            task = self._searches.get(request_id)
+            if task is not None:
+                task.cancel()
+        else:
+            self._send(
+                request_id,
+                {"type": "error", "code": 3, "message": f"Unknown action '{action}'."},
+            )
+
+    def on_close(self) -> None:
+        for task in self._searches.values():
+            task.cancel()
+        self._searches.clear()
+
+    async def _search(self, request_id: str, content: dict, fields: dict) -> None:
+        stats = SearchStats()
+        stream = self._engine.search_stream(
+            fields["query"],
+            fields["path"],
+            fields["case_sensitive"],
+            fields["whole_word"],
+            fields["include"],
+            fields["exclude"],
+            fields["use_regex"],
+            fields["max_count"],
+            _get_username(self),
+            self._session,
+            stats,
+            fields["replace"],
+            fields["backend"],
+        )
+        try:
+            async for file_matches in stream:
+                self._send(request_id, {"type": "matches", "matches": [file_matches]})
+            done = {"type": "done"}
+            if stats.truncated is not None:
+                done.update(truncated=True, stats=stats.to_dict())
+            if content.get("timings"):
+                done["timings"] = stats.timings.to_dict()
+            self._send(request_id, done)
+        except asyncio.CancelledError:
+            self._send(request_id, {"type": "cancelled"})
+        except SearchError as e:
+            self._send(request_id, {"type": "error", **e.to_dict()})
+        except SearchQueueFullError as e:
+            self._send(request_id, {"type": "error", "code": 4, "message": str(e)})
+        except FileNotFoundError as e:
+            if "'rg'" in str(e):
+                self._send(
+                    request_id,
+                    {
+                        "type": "error",
+                        "code": 2,
+                        "message": "ripgrep command not found.",
+                    },
+                )
+            else:
+                raise e
+        finally:
+            await stream.aclose()
+            if self._searches.get(request_id) is asyncio.current_task():
+                del self._searches[request_id]
+
+    def _send(self, request_id: str, content: dict) -> None:
+        try:
+            self.write_message(dumps({"id": request_id, **content}).decode("utf-8"))
+        except WebSocketClosedError:
+            pass
+
+
+def setup_handlers(web_app, engine: Optional[SearchEngine] = None):
     host_pattern = ".*$"
 
+    if engine is None:
+        engine = SearchEngine(web_app.settings["contents_manager"])
+
     base_url = web_app.settings["base_url"]
     route_pattern = url_path_join(base_url, "search" + path_regex)
-    handlers = [(route_pattern, RouteHandler)]
+    handlers = [
+        (route_pattern, RouteHandler, {"engine": engine}),
+        (
+            url_path_join(base_url, NAMESPACE, "ws"),
+            SearchWebSocketHandler,
+            {"engine": engine},
+        ),
+        (
+            url_path_join(base_url, NAMESPACE, "page"),
+            PageHandler,
+            {"engine": engine},
+        ),
+        (
+            url_path_join(base_url, NAMESPACE, "jobs", r"(?P<job_id>[0-9a-f]+)"),
+            JobHandler,
+            {"engine": engine},
+        ),
+        (
+            url_path_join(base_url, NAMESPACE, "undo", r"(?P<operation>[0-9a-f]+)"),
+            UndoHandler,
+            {"engine": engine},
+        ),
+        (
+            url_path_join(base_url, NAMESPACE, "status"),
+            StatusHandler,
+            {"engine": engine},
+        ),
+    ]
     web_app.add_handlers(host_pattern, handlers)
@@ -0,0 +1,377 @@
+"""Trigram index of the files content
+
+A literal query can only match a file containing all the trigrams (sequences
+of three bytes) of the query. The index stores the trigrams of each file to
+narrow the files to search before running ripgrep on them.
+
+Inspired by:
+https://swtch.com/~rsc/regexp/regexp4.html
+"""
+
+import asyncio
+import codecs
+import multiprocessing
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .log import get_logger
+from .watcher import FileWatcher, is_changed
+
+# Maximal number of trigrams looked up for a query
+MAX_QUERY_TRIGRAMS = 32  # type: int
+# Number of files indexed between two database commits
+COMMIT_BATCH_SIZE = 500  # type: int
+# Number of files sent at once to the indexing process
+_EXTRACT_CHUNK_SIZE = 16
+# Bytes that can be matched by another character when ignoring case;
+# e.g. ripgrep matches the Kelvin sign for 'k' and the long s for 's'.
+_UNSAFE_FOLDING = frozenset(b"ks")
+# Byte order marks of the UTF-16 files; ripgrep searches them transcoded to UTF-8
+_UTF16_BOMS = (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    mtime INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    indexed INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS trigrams (
+    trigram INTEGER NOT NULL,
+    file INTEGER NOT NULL,
+    PRIMARY KEY (trigram, file)
+) WITHOUT ROWID;
+"""
+
+
+def get_trigrams(data: bytes) -> Set[int]:
+    """Get the case-insensitive trigrams of ``data``.
+
+    Args:
+        data: The content to index
+    Returns:
+        The trigrams as integers
+    """
+    data = data.lower()
+    return {
+        int.from_bytes(trigram, "big")
+        for trigram in {data[i : i + 3] for i in range(len(data) - 2)}
+    }
+
+
+def _read_trigrams(path: Path) -> Optional[Set[int]]:
+    """Get the trigrams of a file as searched; ``None`` if it cannot be read."""
+    try:
+        data = path.read_bytes()
+    except OSError:
+        return None
+    if data.startswith(_UTF16_BOMS):
+        data = data.decode("utf-16", errors="replace").encode("utf-8")
+    return get_trigrams(data)
+
+
+def get_query_trigrams(query: str, case_sensitive: bool) -> Set[int]:
+    """Get the trigrams a file must contain to match the literal ``query``.
+
+    Args:
+        query: The literal search term
+        case_sensitive: Whether the search is case sensitive or not
+    Returns:
+        The trigrams as integers; empty if the query cannot be narrowed with the index
+    """
+    data = query.encode("utf-8").lower()
+    trigrams = set()
+    for i in range(len(data) - 2):
+        trigram = data[i : i + 3]
+        # Non-ASCII characters may be case folded to a different byte sequence
+        if not case_sensitive and any(
+            byte >= 0x80 or byte in _UNSAFE_FOLDING for byte in trigram
+        ):
+            continue
+        trigrams.add(int.from_bytes(trigram, "big"))
+    return trigrams
+
+
+class TrigramIndex:
+    """Persistent trigram index of the files within a directory.
+
+    The index is stored in a SQLite database. It is updated incrementally, the
+    files being (re-)indexed only if their modification time or size changed.
+    All database accesses are run in a dedicated thread. The trigrams of the
+    files indexed in the background are extracted in a dedicated process, so
+    that a long update does not hold the GIL of the server.
+
+    Args:
+        root_dir: The directory containing the indexed files
+        db_path: The index database file
+        max_file_size: Files bigger than this size in bytes are not indexed; they are
+            always considered as candidates.
+        max_inline_updates: Maximal number of outdated files to index while answering
+            a query; if more files are outdated, they are indexed in the background
+            and the index is not used for the query.
+        max_background_updates: Maximal number of files indexed by a background
+            update; the remaining ones are indexed by the next updates. ``0`` for
+            no limit.
+        watcher: Optional journal of the files changes. If it is realtime, only the
+            changed files are checked before a query instead of all of them. The
+            changed files are also re-indexed in the background.
+    """
+
+    def __init__(
+        self,
+        root_dir: Path,
+        db_path: Path,
+        max_file_size: int = 10 * 1024 * 1024,
+        max_inline_updates: int = 200,
+        watcher: Optional[FileWatcher] = None,
+        max_background_updates: int = 10000,
+    ) -> None:
+        self._root_dir = root_dir
+        self._db_path = db_path
+        self.max_file_size = max_file_size
+        self.max_inline_updates = max_inline_updates
+        self.max_background_updates = max_background_updates
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="search-replace-index"
+        )
+        self._extractor: Optional[ProcessPoolExecutor] = None
+        self._connection: Optional[sqlite3.Connection] = None
+        # Cache of the files table {path: (id, mtime, size, indexed)}
+        self._files: Optional[Dict[str, Tuple[int, int, int, bool]]] = None
+        self._background_update: Optional[asyncio.Future] = None
+        self._watcher = watcher
+        # Journal version up to which the changes were collected
+        self._version: Optional[int] = None
+        # Files up-to-date as of the journal version
+        self._checked: Set[str] = set()
+        if watcher is not None:
+            watcher.subscribe(self._on_files_changed)
+
+    async def candidates(
+        self, paths: List[str], query: str, case_sensitive: bool
+    ) -> Optional[List[str]]:
+        """Filter the files that may contain the literal ``query``.
+
+        Args:
+            paths: The files to filter, relative to the root directory
+            query: The literal search term
+            case_sensitive: Whether the search is case sensitive or not
+        Returns:
+            The subset of ``paths`` that may match or ``None`` if the index cannot
+            be used for this query.
+        """
+        trigrams = get_query_trigrams(query, case_sensitive)
+        if not trigrams or "\n" in query or self.updating:
+            return None
+
+        changes = None
+        if self._watcher is not None and self._watcher.realtime:
+            if self._version is not None:
+                changes = self._watcher.changes_since(self._version)
+            self._version = self._watcher.version
+        outdated = await self._run(self._outdated, paths, changes)
+        if len(outdated) > self.max_inline_updates:
+            self.update_in_background(outdated)
+            return None
+        if outdated:
+            await self._run(self._index, outdated)
+
+        return await self._run(self._lookup, paths, sorted(trigrams))
+
+    @property
+    def updating(self) -> bool:
+        """Whether the index is being updated in the background."""
+        return (
+            self._background_update is not None and not self._background_update.done()
+        )
+
+    def update_in_background(self, paths: Iterable[str]) -> None:
+        """Index the ``paths`` in the background if no update is running.
+
+        Args:
+            paths: The files to index, relative to the root directory
+        """
+        self._update_in_background(self._index, list(paths))
+
+    def _update_in_background(self, func, paths) -> None:
+        if not self.updating:
+            get_logger().debug("Updating the search index in the background.")
+            self._background_update = asyncio.ensure_future(
+                self._run(func, paths, self.max_background_updates)
+            )
+
+    async def close(self) -> None:
+        """Close the index database."""
+        await self._run(self._close)
+        self._executor.shutdown(wait=False)
+        if self._extractor is not None:
+            self._extractor.shutdown(wait=False, cancel_futures=True)
+            self._extractor = None
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, partial(func, *args)
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(str(self._db_path))
+            self._connection.executescript(_SCHEMA)
+            self._files = {
+                path: (id_, mtime, size, bool(indexed))
+                for id_, path, mtime, size, indexed in self._connection.execute(
+                    "SELECT id, path, mtime, size, indexed FROM files"
+                )
+            }
+        return self._connection
+
+    def _close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+            self._files = None
+
+    def _on_files_changed(self, paths: Set[str]) -> None:
+        if self._files is not None:
+            self._update_in_background(self._index_changes, paths)
+
+    def _index_changes(self, changes: Set[str], limit: Optional[int]) -> None:
+        # Only re-index known files; the others will be indexed if they are searched.
+        # A changed directory stands for all the known files under it.
+        self._connect()
+        self._index([path for path in self._files if is_changed(path, changes)], limit)
+
+    def _outdated(self, paths: List[str], changes: Optional[Set[str]]) -> List[str]:
+        self._connect()
+        if changes is None:
+            self._checked.clear()
+        elif changes:
+            self._checked = {
+                path for path in self._checked if not is_changed(path, changes)
+            }
+
+        outdated = []
+        for path in paths:
+            if path in self._checked:
+                continue
+            entry = self._files.get(path)
+            try:
+                stat = os.stat(self._root_dir / path)
+            except OSError:
+                # Deleted files are removed from the index
+                if entry is not None:
+                    outdated.append(path)
+                continue
+            if entry is None or entry[1:3] != (stat.st_mtime_ns, stat.st_size):
+                outdated.append(path)
+            else:
+                self._checked.add(path)
+        # The outdated files are marked as checked once indexed
+        return outdated
+
+    def _get_extractor(self) -> ProcessPoolExecutor:
+        if self._extractor is None:
+            self._extractor = ProcessPoolExecutor(
+                max_workers=1, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._extractor
+
+    def _index(self, paths: List[str], limit: Optional[int] = None) -> None:
+        """Index ``paths``; in the background if ``limit`` is set.
+
+        A background update indexes at most ``limit`` files, the files left
+        outdated are indexed by the next updates.
+        """
+        background = limit is not None
+        if background and 0 < limit < len(paths):
+            paths = paths[:limit]
+        connection = self._connect()
+        for start in range(0, len(paths), COMMIT_BATCH_SIZE):
+            batch = paths[start : start + COMMIT_BATCH_SIZE]
+            self._index_batch(connection, batch, background)
+            connection.commit()
+            self._checked.update(batch)
+
+    def _index_batch(
+        self, connection: sqlite3.Connection, paths: List[str], background: bool
+    ) -> None:
+        outdated = []
+        for path in paths:
+            entry = self._files.get(path)
+            try:
+                stat = os.stat(self._root_dir / path)
+            except OSError:
+                self._remove_file(connection, path)
+                continue
+            if entry is None or entry[1:3] != (stat.st_mtime_ns, stat.st_size):
+                outdated.append((path, stat, stat.st_size <= self.max_file_size))
+
+        to_read = [self._root_dir / path for path, _, indexed in outdated if indexed]
+        if background and to_read:
+            contents = self._get_extractor().map(
+                _read_trigrams, to_read, chunksize=_EXTRACT_CHUNK_SIZE
+            )
+        else:
+            contents = map(_read_trigrams, to_read)
+        for path, stat, indexed in outdated:
+            trigrams = next(contents) if indexed else set()
+            if trigrams is None:
+                # Deleted in the meantime
+                self._remove_file(connection, path)
+            else:
+                self._store_file(connection, path, stat, indexed, trigrams)
+
+    def _remove_file(self, connection: sqlite3.Connection, path: str) -> None:
+        entry = self._files.pop(path, None)
+        if entry is not None:
+            connection.execute("DELETE FROM trigrams WHERE file = ?", (entry[0],))
+            connection.execute("DELETE FROM files WHERE id = ?", (entry[0],))
+
+    def _store_file(
+        self,
+        connection: sqlite3.Connection,
+        path: str,
+        stat: os.stat_result,
+        indexed: bool,
+        trigrams: Set[int],
+    ) -> None:
+        entry = self._files.get(path)
+        if entry is None:
+            id_ = connection.execute(
+                "INSERT INTO files (path, mtime, size, indexed) VALUES (?, ?, ?, ?)",
+                (path, stat.st_mtime_ns, stat.st_size, indexed),
+            ).lastrowid
+        else:
+            id_ = entry[0]
+            connection.execute("DELETE FROM trigrams WHERE file = ?", (id_,))
+            connection.execute(
+                "UPDATE files SET mtime = ?, size = ?, indexed = ? WHERE id = ?",
+                (stat.st_mtime_ns, stat.st_size, indexed, id_),
+            )
+        connection.executemany(
+            "INSERT INTO trigrams (trigram, file) VALUES (?, ?)",
+            ((trigram, id_) for trigram in trigrams),
+        )
+        self._files[path] = (id_, stat.st_mtime_ns, stat.st_size, indexed)
+
+    def _lookup(self, paths: List[str], trigrams: List[int]) -> List[str]:
+        connection = self._connect()
+        trigrams = trigrams[:MAX_QUERY_TRIGRAMS]
+        subquery = " INTERSECT ".join(
+            ["SELECT file FROM trigrams WHERE trigram = ?"] * len(trigrams)
+        )
+        matching = {id_ for (id_,) in connection.execute(subquery, trigrams).fetchall()}
+
+        candidates = []
+        for path in paths:
+            entry = self._files.get(path)
+            # Files not in the index have been deleted in the meantime
+            if entry is not None and (entry[0] in matching or not entry[3]):
+                candidates.append(path)
+        return candidates
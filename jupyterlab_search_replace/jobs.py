@@ -0,0 +1,166 @@
+"""Replacements running in the background
+
+A replace job is identified by an opaque and unguessable id and only the user
+who started it can use it. Its progress is polled while the files are rewritten and it can be cancelled between two
+files; a file being rewritten is always completed or left untouched.
+"""
+
+import asyncio
+import uuid
+from typing import Awaitable, Callable, Dict, Optional
+
+from .log import get_logger
+from .replacer import ReplaceReport
+
+
+class JobNotFoundError(KeyError):
+    """Error raised when a replace job is unknown or has expired."""
+
+    def __str__(self) -> str:
+        return f"Replace job '{self.args[0]}' not found or expired."
+
+
+class _ReplaceJob:
+    def __init__(self, job_id: str, report: ReplaceReport, user: str) -> None:
+        self.id = job_id
+        self.user = user
+        self.report = report
+        self.task: Optional[asyncio.Task] = None
+        self.error: Optional[str] = None
+        self.expiration: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def status(self) -> str:
+        if self.task is None or not self.task.done():
+            return "cancelling" if self.report.cancelled else "running"
+        if self.task.cancelled() or self.report.cancelled:
+            return "cancelled"
+        if self.error is not None:
+            return "failed"
+        return "done"
+
+    def to_dict(self) -> dict:
+        state = {"id": self.id, "status": self.status, **self.report.to_dict()}
+        if self.error is not None:
+            state["message"] = self.error
+        return state
+
+
+class ReplaceJobManager:
+    """Run replacements in the background and keep their report.
+
+    A finished job is kept ``ttl`` seconds for its report to be polled.
+
+    Args:
+        ttl: Time to live in seconds of a finished job
+    """
+
+    def __init__(self, ttl: float = 300.0) -> None:
+        self.ttl = ttl
+        self._jobs: Dict[str, _ReplaceJob] = {}
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    def start(
+        self,
+        replace: Callable[[ReplaceReport], Awaitable[ReplaceReport]],
+        total: int,
+        user: str = "",
+    ) -> dict:
+        """Start a replace job.
+
+        Args:
+            replace: The function applying the replacement and updating the given report
+            total: The number of files to rewrite
+            user: The user starting the job
+        Returns:
+            The job state ``{"id", "status", "total", "done", ...}``
+        """
+        job = _ReplaceJob(uuid.uuid4().hex, ReplaceReport(total), user)
+        self._jobs[job.id] = job
+        job.task = asyncio.ensure_future(self._run(job, replace))
+        return job.to_dict()
+
+    def get(self, job_id: str, user: str = "") -> dict:
+        """Get the state of a job.
+
+        Args:
+            job_id: The job id
+            user: The user requesting the job
+        Returns:
+            The job state ``{"id", "status", "total", "done", ...}``
+        Raises:
+            JobNotFoundError: if the job is unknown, has expired or belongs to
+                another user
+        """
+        job = self._get(job_id, user)
+        return job.to_dict()
+
+    def cancel(self, job_id: str, user: str = "") -> dict:
+        """Cancel a job; the files being rewritten are completed.
+
+        Args:
+            job_id: The job id
+            user: The user requesting the job
+        Returns:
+            The job state ``{"id", "status", "total", "done", ...}``
+        Raises:
+            JobNotFoundError: if the job is unknown, has expired or belongs to
+                another user
+        """
+        job = self._get(job_id, user)
+        if job.task is not None and not job.task.done():
+            job.report.cancelled = True
+        return job.to_dict()
+
+    async def wait(self, job_id: str, user: str = "") -> dict:
+        """Wait for a job to finish.
+
+        Args:
+            job_id: The job id
+            user: The user requesting the job
+        Returns:
+            The job final state
+        Raises:
+            JobNotFoundError: if the job is unknown, has expired or belongs to
+                another user
+        """
+        job = self._get(job_id, user)
+        await asyncio.wait([job.task])
+        return job.to_dict()
+
+    def _get(self, job_id: str, user: str) -> _ReplaceJob:
+        job = self._jobs.get(job_id)
+        # Don't tell another user that the job exists
+        if job is None or job.user != user:
+            raise JobNotFoundError(job_id)
+        return job
+
+    async def close_all(self) -> None:
+        """Cancel all the jobs and wait for them to finish."""
+        tasks = []
+        for job in list(self._jobs.values()):
+            job.report.cancelled = True
+            if job.expiration is not None:
+                job.expiration.cancel()
+            tasks.append(job.task)
+        self._jobs.clear()
+        if tasks:
+            await asyncio.wait(tasks)
+
+    async def _run(
+        self,
+        job: _ReplaceJob,
+        replace: Callable[[ReplaceReport], Awaitable[ReplaceReport]],
+    ) -> None:
+        try:
+            await replace(job.report)
+        except Exception as e:
+            get_logger().error(f"Replace job {job.id} failed: {e!s}", exc_info=e)
+            job.error = str(e) or repr(e)
+        finally:
+            if job.id in self._jobs:
+                job.expiration = asyncio.get_running_loop().call_later(
+                    self.ttl, self._jobs.pop, job.id, None
+                )
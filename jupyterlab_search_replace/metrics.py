@@ -0,0 +1,170 @@
+"""Instrumentation of the searches
+
+The timings and volumes of each search are collected in a
+:class:`SearchTimings`. Once the search is over, they are observed by
+`Prometheus <https://prometheus.io/>`_ metrics registered in the default
+registry, which Jupyter Server exposes on its ``/metrics`` endpoint. The
+metrics are disabled if ``prometheus_client`` is not installed.
+"""
+
+import time
+from typing import Optional
+
+try:
+    from prometheus_client import Counter, Histogram
+except ImportError:  # pragma: no cover
+    Counter = Histogram = None
+
+# Backend label of the searches answered from the cache of the results
+CACHE_BACKEND = "cache"
+
+# Duration buckets in seconds, from a cached result to a search of a huge folder
+_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+if Histogram is not None:
+    SEARCHES = Counter(
+        "search_replace_searches",
+        "Number of searches per backend and outcome (done, truncated, cancelled or error).",
+        ["backend", "outcome"],
+    )
+    SEARCH_DURATION = Histogram(
+        "search_replace_search_duration_seconds",
+        "Wall time of the searches.",
+        ["backend"],
+        buckets=_BUCKETS,
+    )
+    SPAWN_DURATION = Histogram(
+        "search_replace_spawn_duration_seconds",
+        "Time to start the search processes.",
+        ["backend"],
+        buckets=_BUCKETS,
+    )
+    FIRST_MATCH_DURATION = Histogram(
+        "search_replace_first_match_seconds",
+        "Time from the start of a search to its first match.",
+        ["backend"],
+        buckets=_BUCKETS,
+    )
+    PARSE_DURATION = Histogram(
+        "search_replace_parse_duration_seconds",
+        "Time spent decoding the output of the search processes.",
+        ["backend"],
+        buckets=_BUCKETS,
+    )
+    SERIALIZATION_DURATION = Histogram(
+        "search_replace_serialization_duration_seconds",
+        "Time spent serializing the search responses.",
+        buckets=_BUCKETS,
+    )
+    OUTPUT_BYTES = Counter(
+        "search_replace_output_bytes",
+        "Bytes of output read from the search processes.",
+        ["backend"],
+    )
+    FILES_SEARCHED = Counter(
+        "search_replace_files_searched",
+        "Number of files searched.",
+        ["backend"],
+    )
+    FILES_MATCHED = Counter(
+        "search_replace_files_matched",
+        "Number of files with matches.",
+        ["backend"],
+    )
+
+
+def record_serialization(duration: float) -> None:
+    """Record the time spent serializing a search response.
+
+    Args:
+        duration: The duration in seconds
+    """
+    if Histogram is not None:
+        SERIALIZATION_DURATION.observe(duration)
+
+
+class SearchTimings:
+    """Timings (in seconds) and volumes of a search.
+
+    ``None`` values are unknown, e.g. the search did not start a process.
+    """
+
+    def __init__(self) -> None:
+        self.backend = ""
+        self.start = time.monotonic()
+        # Time to start the search processes
+        self.spawn: Optional[float] = None
+        # Time from the start of the search to its first match
+        self.first_match: Optional[float] = None
+        # Wall time of the backend search
+        self.search = 0.0
+        # Time spent decoding the output of the search processes
+        self.parse = 0.0
+        # Time spent serializing the response
+        self.serialize = 0.0
+        # Bytes of output read from the search processes
+        self.output_bytes = 0
+        self.files_searched: Optional[int] = None
+        self.files_matched: Optional[int] = None
+
+    def add_spawn(self, duration: float) -> None:
+        """Account for the start of a search process."""
+        self.spawn = (self.spawn or 0.0) + duration
+
+    def add_files(self, searched: Optional[int], matched: Optional[int]) -> None:
+        """Account for the statistics of a backend search."""
+        if searched is not None:
+            self.files_searched = (self.files_searched or 0) + searched
+        if matched is not None:
+            self.files_matched = (self.files_matched or 0) + matched
+
+    def match_found(self) -> None:
+        """Record the time of the first match."""
+        if self.first_match is None:
+            self.first_match = time.monotonic() - self.start
+
+    def to_dict(self) -> dict:
+        """Timings as returned to the frontend; durations are in milliseconds."""
+
+        def ms(duration: Optional[float]) -> Optional[float]:
+            return None if duration is None else round(duration * 1000, 3)
+
+        return {
+            "backend": self.backend,
+            "spawn": ms(self.spawn),
+            "first_match": ms(self.first_match),
+            "search": ms(self.search),
+            "parse": ms(self.parse),
+            "serialize": ms(self.serialize),
+            "output_bytes": self.output_bytes,
+            "files_searched": self.files_searched,
+            "files_matched": self.files_matched,
+        }
+
+    def observe(self, outcome: str) -> None:
+        """Observe the search by the Prometheus metrics.
+
+        Args:
+            outcome: ``done``, ``truncated``, ``cancelled`` or ``error``
+        """
+        if Histogram is None:
+            return
+        backend = self.backend or "none"
+        SEARCHES.labels(backend, outcome).inc()
+        if not self.backend:
+            # Failed before the backend started
+            return
+        SEARCH_DURATION.labels(backend).observe(self.search)
+        if self.backend == CACHE_BACKEND:
+            # No process was run
+            return
+        PARSE_DURATION.labels(backend).observe(self.parse)
+        OUTPUT_BYTES.labels(backend).inc(self.output_bytes)
+        if self.spawn is not None:
+            SPAWN_DURATION.labels(backend).observe(self.spawn)
+        if self.first_match is not None:
+            FIRST_MATCH_DURATION.labels(backend).observe(self.first_match)
+        if self.files_searched is not None:
+            FILES_SEARCHED.labels(backend).inc(self.files_searched)
+        if self.files_matched is not None:
+            FILES_MATCHED.labels(backend).inc(self.files_matched)
@@ -0,0 +1,183 @@
+"""Search and replace within the notebooks cells
+
+ripgrep sees a notebook as its JSON document: the matches are reported on
+escaped lines and the embedded outputs are scanned. Instead, the notebooks
+are parsed and the cells sources (and optionally the text outputs) are
+searched with the Python :mod:`re` module, like the pure Python engine. The
+positions of the matches are relative to the cell: ``line_number`` is the line within the cell and
+``start``/``end`` are bytes positions within that line.
+"""
+
+import io
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from .codec import RipgrepMatch, loads
+from .pysearch import search_text
+from .replacer import LineEdits, rewrite
+
+# Glob of the notebook files
+NOTEBOOK_GLOB = "*.ipynb"
+NOTEBOOK_SUFFIX = ".ipynb"
+
+# Edits of a notebook per cell index
+CellEdits = Dict[int, LineEdits]
+
+
+class CellText(NamedTuple):
+    """Searchable text of a cell; ``output`` is the output index for an output text."""
+
+    cell: int
+    output: Optional[int]
+    text: str
+
+
+def _join(text) -> str:
+    # Multi-line strings are stored as a list of lines in notebooks
+    return "".join(text) if isinstance(text, list) else (text or "")
+
+
+def _split(text: str) -> List[str]:
+    # Like nbformat, only split on "\n"; str.splitlines also splits on "\r",
+    # "\x0c", "\u2028"...
+    lines = text.split("\n")
+    return [line + "\n" for line in lines[:-1]] + ([lines[-1]] if lines[-1] else [])
+
+
+def get_cells_text(content: bytes, include_outputs: bool = False) -> List[CellText]:
+    """Extract the searchable text of a notebook.
+
+    Args:
+        content: The notebook JSON document
+        include_outputs: Whether to extract the text outputs of the code cells
+    Returns:
+        The text of the cells
+    Raises:
+        ValueError: if the content is not a JSON document
+    """
+    notebook = loads(content)
+    texts = []
+    for index, cell in enumerate(notebook.get("cells", [])):
+        texts.append(CellText(index, None, _join(cell.get("source"))))
+        if not include_outputs:
+            continue
+        for output_index, output in enumerate(cell.get("outputs", [])):
+            if output.get("output_type") == "stream":
+                text = _join(output.get("text"))
+            elif output.get("output_type") == "error":
+                text = f"{output.get('ename', '')}: {output.get('evalue', '')}"
+            else:
+                text = _join(output.get("data", {}).get("text/plain"))
+            if text:
+                texts.append(CellText(index, output_index, text))
+    return texts
+
+
+def search_cells(
+    cells: List[CellText], pattern: "re.Pattern", max_count: int = 0
+) -> Iterator[RipgrepMatch]:
+    """Search the lines of the cells.
+
+    Args:
+        cells: The text of the cells
+        pattern: The compiled query; see :func:`.pysearch.compile_query`
+        max_count: The maximal number of lines with matches; 0 for no limit
+    Yields:
+        The lines with matches, as ripgrep reports them, with their cell
+    """
+    count = 0
+    for cell in cells:
+        for line in search_text(
+            cell.text, pattern, max_count - count if max_count else 0
+        ):
+            yield line._replace(cell=cell.cell, output=cell.output)
+            count += 1
+        if 0 < max_count <= count:
+            return
+
+
+class NotebookCache:
+    """Cache of the notebooks text, invalidated by their modification time and size.
+
+    The methods are thread-safe.
+
+    Args:
+        max_entries: Maximal number of notebooks cached; the least recently used
+            are evicted first
+    """
+
+    def __init__(self, max_entries: int = 256) -> None:
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, bool], Tuple[int, int, List[CellText]]]" = (
+            OrderedDict()
+        )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_cells(
+        self, file_path: Path, include_outputs: bool = False
+    ) -> List[CellText]:
+        """Get the text of the cells of a notebook.
+
+        Args:
+            file_path: The notebook path
+            include_outputs: Whether to extract the text outputs of the code cells
+        Returns:
+            The text of the cells
+        Raises:
+            OSError: if the notebook cannot be read
+            ValueError: if the notebook is not a JSON document
+        """
+        key = (str(file_path), include_outputs)
+        stat = os.stat(file_path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[:2] == (stat.st_mtime_ns, stat.st_size):
+                self._entries.move_to_end(key)
+                return entry[2]
+
+        cells = get_cells_text(file_path.read_bytes(), include_outputs)
+        if self.max_entries > 0:
+            with self._lock:
+                self._entries[key] = (stat.st_mtime_ns, stat.st_size, cells)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return cells
+
+
+def edit_notebook(content: bytes, cell_edits: CellEdits) -> bytes:
+    """Apply edits to the cells sources of a notebook.
+
+    The notebook is serialized like nbformat does.
+
+    Args:
+        content: The notebook JSON document
+        cell_edits: The edits of the lines of each cell; see :func:`.replacer.rewrite`
+    Returns:
+        The edited notebook
+    Raises:
+        ValueError: if an edit is outside of the cells sources
+    """
+    notebook = json.loads(content)
+    cells = notebook.get("cells", [])
+    for index, line_edits in cell_edits.items():
+        if not 0 <= index < len(cells):
+            raise ValueError(f"Cell {index} beyond the end of the notebook.")
+        source = cells[index].get("source", "")
+        destination = io.BytesIO()
+        rewrite(io.BytesIO(_join(source).encode("utf-8")), destination, line_edits)
+        text = destination.getvalue().decode("utf-8")
+        cells[index]["source"] = _split(text) if isinstance(source, list) else text
+
+    edited = json.dumps(notebook, indent=1, ensure_ascii=False)
+    if content.endswith(b"\n"):
+        edited += "\n"
+    return edited.encode("utf-8")
@@ -0,0 +1,208 @@
+"""Paginated search results
+
+The matches of a search are read from its stream page per page. Between
+two pages, the stream is paused; ripgrep is blocked when its output pipe is
+full so that a page costs a constant memory whatever the number of matches.
+A paused search does not hold its scheduler slot; it waits for a slot again
+before reading the next page.
+"""
+
+import asyncio
+import uuid
+from typing import TYPE_CHECKING, AsyncIterator, Dict, Hashable, List, Optional
+
+from .log import get_logger
+from .scheduler import SearchQueueFullError
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .search_engine import SearchStats
+
+
+class CursorNotFoundError(KeyError):
+    """Error raised when a cursor is unknown or has expired."""
+
+    def __str__(self) -> str:
+        return f"Search cursor '{self.args[0]}' not found or expired."
+
+
+class _PaginatedSearch:
+    def __init__(
+        self,
+        user: str,
+        session: Hashable,
+        stream: AsyncIterator[dict],
+        stats: "SearchStats",
+    ) -> None:
+        self.user = user
+        self.session = session
+        self.stream = stream
+        self.stats = stats
+        self.lock = asyncio.Lock()
+        # Next file matches, read ahead to know if the stream is exhausted
+        self.next: Optional[dict] = None
+        self.done = False
+        self.expiration: Optional[asyncio.TimerHandle] = None
+
+
+class ResultPager:
+    """Serve the results of searches page per page.
+
+    A search is identified by an opaque and unguessable cursor valid ``ttl``
+    seconds after the last page was served; only the user who started it can
+    use it. Each user session has at most one paginated search; starting a new
+    one closes the previous one.
+
+    Args:
+        ttl: Time to live in seconds of an unused cursor
+    """
+
+    def __init__(self, ttl: float = 60.0) -> None:
+        self.ttl = ttl
+        self._searches: Dict[str, _PaginatedSearch] = {}
+        self._sessions: Dict[Hashable, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._searches)
+
+    async def start(
+        self,
+        stream: AsyncIterator[dict],
+        stats: "SearchStats",
+        page_size: int,
+        user: str = "",
+        session: Hashable = "",
+    ) -> dict:
+        """Start a paginated search and get its first page.
+
+        Args:
+            stream: The search stream yielding the matches file per file
+            stats: The statistics updated by the search stream
+            page_size: The maximal number of files in the page
+            user: The user requesting the search
+            session: The client session requesting the search
+        Returns:
+            The page ``{"matches", "cursor"}``; the cursor is ``None`` for the last page.
+        Raises:
+            SearchError: if the search fails
+            SearchQueueFullError: if too many searches are pending
+        """
+        previous = self._sessions.get((user, session))
+        if previous is not None:
+            await self._close(previous, self._searches[previous])
+
+        cursor = uuid.uuid4().hex
+        search = _PaginatedSearch(user, session, stream, stats)
+        self._searches[cursor] = search
+        self._sessions[(user, session)] = cursor
+        return await self._page(cursor, search, page_size)
+
+    async def next(self, cursor: str, page_size: int, user: str = "") -> dict:
+        """Get the next page of a search.
+
+        Args:
+            cursor: The search cursor
+            page_size: The maximal number of files in the page
+            user: The user requesting the page
+        Returns:
+            The page ``{"matches", "cursor"}``; the cursor is ``None`` for the last page.
+        Raises:
+            CursorNotFoundError: if the cursor is unknown, has expired or belongs
+                to another user
+            SearchError: if the search fails
+            SearchQueueFullError: if too many searches are pending
+        """
+        search = self._get(cursor, user)
+        return await self._page(cursor, search, page_size)
+
+    async def close(self, cursor: str, user: str = "") -> None:
+        """Stop a search and release its cursor.
+
+        Args:
+            cursor: The search cursor
+            user: The user stopping the search
+        Raises:
+            CursorNotFoundError: if the cursor is unknown, has expired or belongs
+                to another user
+        """
+        search = self._get(cursor, user)
+        await self._close(cursor, search)
+
+    async def close_all(self) -> None:
+        """Stop all the searches."""
+        for cursor, search in list(self._searches.items()):
+            await self._close(cursor, search)
+
+    def _get(self, cursor: str, user: str) -> _PaginatedSearch:
+        search = self._searches.get(cursor)
+        # Don't tell another user that the cursor exists
+        if search is None or search.user != user:
+            raise CursorNotFoundError(cursor)
+        return search
+
+    async def _close(self, cursor: str, search: _PaginatedSearch) -> None:
+        self._forget(cursor, search)
+        async with search.lock:
+            await search.stream.aclose()
+
+    async def _page(
+        self, cursor: str, search: _PaginatedSearch, page_size: int
+    ) -> dict:
+        matches: List[dict] = []
+        async with search.lock:
+            if search.expiration is not None:
+                search.expiration.cancel()
+            try:
+                if search.stats.slot is not None:
+                    await search.stats.slot.resume()
+            except SearchQueueFullError:
+                # Keep the search to let the client retry later
+                self._expire_later(cursor)
+                raise
+            try:
+                if search.next is None and not search.done:
+                    search.next = await self._read(search)
+                while search.next is not None and len(matches) < page_size:
+                    matches.append(search.next)
+                    search.next = await self._read(search)
+                if not search.done and search.stats.slot is not None:
+                    # Let the other searches run until the next page is requested
+                    search.stats.slot.pause()
+            except BaseException:
+                self._forget(cursor, search)
+                await search.stream.aclose()
+                raise
+
+        page = {"matches": matches, "cursor": None}
+        if search.done:
+            self._forget(cursor, search)
+            if search.stats.truncated is not None:
+                page.update(truncated=True, stats=search.stats.to_dict())
+        else:
+            page["cursor"] = cursor
+            self._expire_later(cursor)
+        return page
+
+    def _expire_later(self, cursor: str) -> None:
+        self._searches[cursor].expiration = asyncio.get_running_loop().call_later(
+            self.ttl, lambda: asyncio.ensure_future(self._expire(cursor))
+        )
+
+    async def _read(self, search: _PaginatedSearch) -> Optional[dict]:
+        try:
+            return await search.stream.__anext__()
+        except StopAsyncIteration:
+            search.done = True
+            return None
+
+    async def _expire(self, cursor: str) -> None:
+        search = self._searches.get(cursor)
+        if search is not None and not search.lock.locked():
+            get_logger().debug(f"Search cursor {cursor} expired.")
+            await self._close(cursor, search)
+
+    def _forget(self, cursor: str, search: _PaginatedSearch) -> None:
+        if search.expiration is not None:
+            search.expiration.cancel()
+        self._searches.pop(cursor, None)
+        if self._sessions.get((search.user, search.session)) == cursor:
+            del self._sessions[(search.user, search.session)]
@@ -0,0 +1,169 @@
+"""Management of the search processes with asyncio
+
+The processes are started with :func:`asyncio.create_subprocess_exec` and
+their pipes are read by the event loop; no thread is held while they run.
+
+Each process leads its own process group so that stopping it also stops
+the processes it spawned. It is first asked to exit with ``SIGTERM`` and
+killed with ``SIGKILL`` if it does not exit in time.
+
+Some event loops do not support subprocesses, like the selector event loop
+that Jupyter Server uses on Windows. The processes are then started with
+:class:`subprocess.Popen` and their pipes are read in threads.
+"""
+
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+from functools import partial
+from typing import IO, List, Optional, Tuple, Union
+
+from .log import get_logger
+
+# Default time in seconds given to a process to exit before it is killed
+KILL_TIMEOUT = 5.0  # type: float
+
+
+async def _in_thread(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(None, partial(func, *args))
+
+
+class _PipeReader:
+    """Read a pipe in a thread; subset of :class:`asyncio.StreamReader`."""
+
+    def __init__(self, pipe: IO[bytes]) -> None:
+        self._pipe = pipe
+
+    async def read(self, n: int = -1) -> bytes:
+        """Read up to ``n`` bytes, as soon as some are available; all if ``n`` is negative."""
+        if n < 0:
+            return await _in_thread(self._pipe.read)
+        return await _in_thread(self._pipe.read1, n)
+
+    async def readline(self) -> bytes:
+        """Read a line."""
+        return await _in_thread(self._pipe.readline)
+
+
+class ThreadedProcess:
+    """Process started with :class:`subprocess.Popen`, waited for in threads.
+
+    It has the interface of :class:`asyncio.subprocess.Process` used here.
+
+    Args:
+        popen: The process
+    """
+
+    def __init__(self, popen: subprocess.Popen) -> None:
+        self._popen = popen
+        self.pid = popen.pid
+        self.stdout = _PipeReader(popen.stdout)
+        self.stderr = _PipeReader(popen.stderr)
+
+    @property
+    def returncode(self) -> Optional[int]:
+        """The return code; ``None`` if the process is running."""
+        return self._popen.poll()
+
+    def terminate(self) -> None:
+        """Ask the process to exit."""
+        self._popen.terminate()
+
+    def kill(self) -> None:
+        """Kill the process."""
+        self._popen.kill()
+
+    async def wait(self) -> int:
+        """Wait for the process to exit.
+
+        Returns:
+            The return code
+        """
+        return await _in_thread(self._popen.wait)
+
+    async def communicate(self) -> Tuple[bytes, bytes]:
+        """Read the outputs until the process exits.
+
+        Returns:
+            (stdout, stderr) content
+        """
+        return await _in_thread(self._popen.communicate)
+
+
+Process = Union[asyncio.subprocess.Process, ThreadedProcess]
+
+
+async def start_process(cmd: List[str], cwd: Optional[str] = None) -> Process:
+    """Start a process in its own process group with its output piped.
+
+    The standard input is closed so that a command falling back to reading it
+    (e.g. ripgrep without path) does not wait on the server input.
+
+    Args:
+        cmd: The command with its arguments
+        cwd: The working directory
+    Returns:
+        The process; a :class:`ThreadedProcess` if the event loop does not
+        support subprocesses
+    Raises:
+        FileNotFoundError: if the command is not found
+    """
+    if sys.platform == "win32":
+        group = {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    else:
+        group = {"start_new_session": True}
+    kwargs = dict(
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        cwd=cwd,
+        **group,
+    )
+    try:
+        return await asyncio.create_subprocess_exec(*cmd, **kwargs)
+    except NotImplementedError:
+        # The event loop does not support subprocesses
+        popen = await _in_thread(partial(subprocess.Popen, cmd, **kwargs))
+        return ThreadedProcess(popen)
+
+
+def _signal_group(process: Process, sig: int) -> None:
+    try:
+        if sys.platform == "win32":
+            if sig == signal.SIGTERM:
+                process.terminate()
+            else:
+                process.kill()
+        else:
+            os.killpg(process.pid, sig)
+    except ProcessLookupError:
+        # The process group has already exited
+        pass
+
+
+async def terminate_process(process: Process, timeout: float = KILL_TIMEOUT) -> int:
+    """Stop a process and the processes of its group.
+
+    ``SIGTERM`` is sent to the group; ``SIGKILL`` follows if the process has
+    not exited after ``timeout`` seconds.
+
+    Args:
+        process: The process started by :func:`start_process`
+        timeout: Time in seconds given to the process to exit before it is killed
+    Returns:
+        The process return code
+    """
+    if process.returncode is not None:
+        return process.returncode
+
+    _signal_group(process, signal.SIGTERM)
+    try:
+        return await asyncio.wait_for(process.wait(), max(timeout, 0))
+    except asyncio.TimeoutError:
+        get_logger().warning(
+            f"Process {process.pid} did not exit after {timeout}s; killing it."
+        )
+    _signal_group(process, getattr(signal, "SIGKILL", signal.SIGTERM))
+    return await process.wait()
@@ -0,0 +1,221 @@
+"""Search engine in pure Python, used when ripgrep is not installed
+
+The files are listed with :func:`os.scandir`, skipping the hidden files and
+applying the include and exclude globs. They are searched in chunks by a
+pool of processes: each file is memory-mapped, skipped if it is binary (it
+contains a NUL byte in its first block, like ripgrep) and its lines are
+matched with a compiled :mod:`re` pattern.
+
+The matches are reported as the ripgrep JSON entries are decoded so that the
+results have the same format whatever the engine.
+
+Contrary to ripgrep, the ``.gitignore`` files are not taken into account.
+"""
+
+import fnmatch
+import functools
+import mmap
+import os
+import re
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+from .codec import RipgrepMatch
+
+# Number of bytes checked for a NUL byte to detect binary files
+BINARY_DETECTION_SIZE = 8192  # type: int
+
+
+@functools.lru_cache(maxsize=256)
+def _compile_glob(glob: str) -> "re.Pattern":
+    # Like gitignore, ``*`` does not match ``/`` contrary to ``**``
+    parts = re.split(r"(\*\*/?|\*|\?)", glob)
+    regex = "".join(
+        {"**/": "(?:.*/)?", "**": ".*", "*": "[^/]*", "?": "[^/]"}.get(part)
+        or fnmatch.translate(part)[4:-3]
+        for part in parts
+        if part
+    )
+    return re.compile(rf"(?s:{regex})\Z")
+
+
+def _matches_glob(path: str, glob: str) -> bool:
+    # Like gitignore, a glob without slash matches the name at any depth
+    if "/" not in glob.rstrip("/"):
+        path = path.rsplit("/", 1)[-1]
+    return _compile_glob(glob.strip("/")).match(path) is not None
+
+
+def iter_files(
+    root: str, include: Sequence[str] = (), exclude: Sequence[str] = ()
+) -> Iterator[str]:
+    """List the files to search in a folder.
+
+    The hidden files and folders are skipped. The folders matching an exclude
+    glob are skipped too.
+
+    Args:
+        root: The folder to list
+        include: Globs of the files to search; all files if empty
+        exclude: Globs of the files and folders to skip; they take precedence
+            over the include globs
+    Yields:
+        The files paths relative to ``root``, in POSIX format
+    """
+    folders = [""]
+    while folders:
+        folder = folders.pop()
+        try:
+            with os.scandir(os.path.join(root, folder)) as it:
+                entries = sorted(it, key=lambda entry: entry.name, reverse=True)
+        except OSError:
+            continue
+        files = []
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            path = f"{folder}/{entry.name}" if folder else entry.name
+            if any(_matches_glob(path, glob) for glob in exclude):
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    folders.append(path)
+                elif entry.is_file() and (
+                    not include or any(_matches_glob(path, glob) for glob in include)
+                ):
+                    files.append(path)
+            except OSError:
+                continue
+        yield from reversed(files)
+
+
+def compile_query(
+    query: str, case_sensitive: bool, whole_word: bool, use_regex: bool
+) -> Optional["re.Pattern"]:
+    """Compile a search query for :mod:`re`.
+
+    Returns:
+        The pattern or ``None`` if the query is not supported by :mod:`re`
+    """
+    pattern = query if use_regex else re.escape(query)
+    if whole_word:
+        pattern = rf"\b(?:{pattern})\b"
+    try:
+        return re.compile(pattern, 0 if case_sensitive else re.IGNORECASE)
+    except re.error:
+        return None
+
+
+def _encode(text: str) -> bytes:
+    # The undecodable bytes are escaped as lone surrogates, one per byte
+    return text.encode("utf-8", errors="surrogateescape")
+
+
+def _valid(text: str) -> Optional[str]:
+    # Like ripgrep, the text that is not valid UTF-8 is not reported
+    try:
+        text.encode("utf-8")
+    except UnicodeEncodeError:
+        return None
+    return text
+
+
+def search_text(
+    text: str, pattern: "re.Pattern", max_count: int = 0
+) -> List[RipgrepMatch]:
+    """Search the lines of a text.
+
+    The positions are in bytes of the UTF-8 encoded text; the bytes that are
+    not valid UTF-8 must be escaped as lone surrogates (``surrogateescape``
+    error handler) so that they are counted once. The lines and matches that
+    are not valid UTF-8 are reported as ``None``, as ripgrep does.
+
+    Args:
+        text: The text to search
+        pattern: The compiled query
+        max_count: The maximal number of lines with matches; 0 for no limit
+    Returns:
+        The lines with matches, as ripgrep reports them
+    """
+    results = []
+    offset = 0
+    lines = text.split("\n")
+    for line_number, line in enumerate(lines, start=1):
+        if line_number < len(lines):
+            line += "\n"
+        submatches = []
+        position, byte_position = 0, 0
+        for match in pattern.finditer(line):
+            if match.start() == match.end():
+                continue
+            byte_position += len(_encode(line[position : match.start()]))
+            matched = match.group(0)
+            end = byte_position + len(_encode(matched))
+            submatches.append((_valid(matched), byte_position, end))
+            position, byte_position = match.end(), end
+        if submatches:
+            results.append(RipgrepMatch(_valid(line), line_number, offset, submatches))
+            if 0 < max_count <= len(results):
+                break
+        offset += len(_encode(line))
+    return results
+
+
+def _literal(pattern: "re.Pattern") -> Optional[bytes]:
+    """Get the bytes a file must contain to match a case sensitive literal pattern."""
+    if pattern.flags & re.IGNORECASE:
+        return None
+    literal = re.sub(r"\\(.)", r"\1", pattern.pattern, flags=re.DOTALL)
+    if re.escape(literal) != pattern.pattern:
+        return None
+    return literal.encode("utf-8")
+
+
+def search_file(
+    file_path: str, pattern: "re.Pattern", max_count: int = 0
+) -> List[RipgrepMatch]:
+    """Search a file.
+
+    Args:
+        file_path: The file path
+        pattern: The compiled query
+        max_count: The maximal number of lines with matches; 0 for no limit
+    Returns:
+        The lines with matches; none for binary files
+    """
+    with open(file_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as content:
+            if content.find(b"\0", 0, BINARY_DETECTION_SIZE) >= 0:
+                return []
+            literal = _literal(pattern)
+            if literal is not None and content.find(literal) < 0:
+                return []
+            # Escape the invalid bytes so that the positions match the file content
+            text = content[:].decode("utf-8", errors="surrogateescape")
+    return search_text(text, pattern, max_count)
+
+
+def search_files(
+    root: str, files: Sequence[str], pattern: "re.Pattern", max_count: int = 0
+) -> List[Tuple[str, List[RipgrepMatch]]]:
+    """Search a chunk of files; run in a worker process.
+
+    Args:
+        root: The folder containing the files
+        files: The files paths relative to ``root``
+        pattern: The compiled query
+        max_count: The maximal number of lines with matches per file; 0 for no limit
+    Returns:
+        The lines with matches of the files with matches
+    """
+    results = []
+    for file in files:
+        try:
+            lines = search_file(str(Path(root) / file), pattern, max_count)
+        except (OSError, ValueError):
+            continue
+        if lines:
+            results.append((file, lines))
+    return results
@@ -0,0 +1,220 @@
+"""Replacement of matches within files
+
+The file is rewritten in a single pass by chunks of bounded size to a
+temporary file that is then renamed over the original one. The memory used
+does not depend on the size of the file nor on the length of its lines.
+"""
+
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, List, Optional, Tuple
+
+# Maximal number of bytes read at once
+CHUNK_SIZE = 1024 * 1024  # type: int
+
+LineEdits = Dict[int, List[Tuple[int, int, bytes]]]
+
+
+class ReplaceReport:
+    """Progress and outcome of a replacement in several files, updated while it runs.
+
+    Setting ``cancelled`` stops the replacement before the next file.
+    """
+
+    def __init__(self, total: int = 0) -> None:
+        self.total = total
+        self.cancelled = False
+        self.done = 0
+        self.bytes = 0
+        self.errors: List[Dict[str, str]] = []
+        # Id of the operation to undo the replacement
+        self.operation: Optional[str] = None
+
+    def add_success(self, path: str, size: int) -> None:
+        """Record a file rewritten.
+
+        Args:
+            path: The file path
+            size: The size in bytes of the rewritten file
+        """
+        self.done += 1
+        self.bytes += size
+
+    def add_error(self, path: str, error: BaseException) -> None:
+        """Record a file that could not be rewritten.
+
+        Args:
+            path: The file path
+            error: The error
+        """
+        self.done += 1
+        self.errors.append({"path": path, "message": str(error) or repr(error)})
+
+    def to_dict(self) -> dict:
+        """Report as returned to the frontend."""
+        return {
+            "total": self.total,
+            "done": self.done,
+            "replaced": self.done - len(self.errors),
+            "bytes": self.bytes,
+            "errors": self.errors,
+            "operation": self.operation,
+        }
+
+
+def _copy_line(source: BinaryIO, destination: BinaryIO, chunk_size: int) -> bool:
+    """Copy the rest of the current line; return ``False`` at the end of the file."""
+    while True:
+        chunk = source.readline(chunk_size)
+        if not chunk:
+            return False
+        destination.write(chunk)
+        if chunk.endswith(b"\n"):
+            return True
+
+
+def rewrite(
+    source: BinaryIO,
+    destination: BinaryIO,
+    line_edits: LineEdits,
+    chunk_size: int = CHUNK_SIZE,
+) -> int:
+    """Copy ``source`` to ``destination`` applying the edits.
+
+    Args:
+        source: The original content
+        destination: The stream to write the edited content to
+        line_edits: The edits per line number (base 1); the edits of a line are
+            sorted, non-overlapping ``(start, end, replacement)`` with positions
+            in bytes within the line
+        chunk_size: Maximal number of bytes read at once
+    Returns:
+        The number of bytes written
+    Raises:
+        ValueError: if an edit is outside of the content
+    """
+    start_offset = destination.tell()
+    line_number = 1
+    for edit_line in sorted(line_edits):
+        while line_number < edit_line:
+            if not _copy_line(source, destination, chunk_size):
+                raise ValueError(f"Line {edit_line} beyond the end of the file.")
+            line_number += 1
+
+        position = 0
+        for start, end, replacement in line_edits[edit_line]:
+            if start < position or end < start:
+                raise ValueError(f"Overlapping matches on line {edit_line}.")
+            # Copy the text before the match then skip the match
+            for until, output in ((start, destination), (end, None)):
+                while position < until:
+                    chunk = source.read(min(until - position, chunk_size))
+                    if not chunk:
+                        raise ValueError(f"Match beyond the end of line {edit_line}.")
+                    if output is not None:
+                        output.write(chunk)
+                    position += len(chunk)
+            destination.write(replacement)
+
+        _copy_line(source, destination, chunk_size)
+        line_number += 1
+
+    shutil.copyfileobj(source, destination, chunk_size)
+    return destination.tell() - start_offset
+
+
+def _write_in_place(file_path: Path, write: Callable[[BinaryIO], int]) -> int:
+    """Write a file through a temporary file copied back into it once complete."""
+    with tempfile.TemporaryFile() as content:
+        size = write(content)
+        content.seek(0)
+        with file_path.open("r+b") as destination:
+            shutil.copyfileobj(content, destination)
+            destination.truncate()
+            destination.flush()
+            os.fsync(destination.fileno())
+    return size
+
+
+def _atomic_write(file_path: Path, write: Callable[[BinaryIO], int]) -> int:
+    """Write a file through a temporary file renamed over it once complete.
+
+    The file is written in place if renaming would lose its identity: for a
+    file with hard links, in a read-only directory or whose owner cannot be
+    kept.
+    """
+    # Write the target of the symbolic links
+    file_path = file_path.resolve()
+    stat = file_path.stat()
+    if stat.st_nlink > 1 or not os.access(file_path.parent, os.W_OK):
+        return _write_in_place(file_path, write)
+
+    fd, temp_path = tempfile.mkstemp(
+        prefix=f".{file_path.name}.", suffix=".tmp", dir=file_path.parent
+    )
+    try:
+        with os.fdopen(fd, "wb") as destination:
+            size = write(destination)
+            destination.flush()
+            os.fsync(destination.fileno())
+        # Keep the mode, flags and extended attributes but not the times
+        shutil.copystat(file_path, temp_path)
+        os.utime(temp_path)
+        if hasattr(os, "chown"):
+            temp_stat = os.stat(temp_path)
+            if (temp_stat.st_uid, temp_stat.st_gid) != (stat.st_uid, stat.st_gid):
+                try:
+                    os.chown(temp_path, stat.st_uid, stat.st_gid)
+                except PermissionError:
+                    os.unlink(temp_path)
+                    return _write_in_place(file_path, write)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+    return size
+
+
+def rewrite_file(
+    file_path: Path, line_edits: LineEdits, chunk_size: int = CHUNK_SIZE
+) -> int:
+    """Apply edits to a file.
+
+    The edited content is written to a temporary file in the same directory
+    that atomically replaces the original file once complete; the original
+    file is left untouched if an error occurs. The symbolic links are followed
+    and the files with hard links or in a read-only directory are rewritten in
+    place.
+
+    Args:
+        file_path: The file to edit
+        line_edits: The edits per line number; see :func:`rewrite`
+        chunk_size: Maximal number of bytes read at once
+    Returns:
+        The size in bytes of the edited file
+    Raises:
+        ValueError: if an edit is outside of the file content
+    """
+
+    def write(destination: BinaryIO) -> int:
+        with file_path.open("rb") as source:
+            return rewrite(source, destination, line_edits, chunk_size)
+
+    return _atomic_write(file_path, write)
+
+
+def write_file(file_path: Path, content: bytes) -> int:
+    """Replace the content of a file atomically; see :func:`rewrite_file`.
+
+    Args:
+        file_path: The file to write
+        content: The new content
+    Returns:
+        The size in bytes of the file
+    """
+    return _atomic_write(file_path, lambda destination: destination.write(content))
@@ -0,0 +1,217 @@
+"""Scheduling of the search processes of the server users."""
+
+import asyncio
+from collections import OrderedDict, defaultdict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, Hashable, Tuple
+
+from .log import get_logger
+
+
+class SearchQueueFullError(Exception):
+    """Error raised when too many searches are pending."""
+
+
+class SearchSlot:
+    """Admission of a search by the :class:`SearchScheduler`.
+
+    A paused search, e.g. a paginated search waiting for its next page to be
+    requested, does not count in the caps; it must be resumed before running
+    again.
+    """
+
+    def __init__(self, scheduler: "SearchScheduler", user: str, threads: int) -> None:
+        self._scheduler = scheduler
+        self._user = user
+        # Number of threads the search may use; 0 to let the search decide
+        self.threads = threads
+        self.paused = False
+        self._held = True
+
+    def pause(self) -> None:
+        """Release the slot while the search is paused."""
+        if self._held and not self.paused:
+            self.paused = True
+            self._scheduler._release(self._user)
+
+    async def resume(self) -> None:
+        """Wait for the paused search to be admitted again.
+
+        Raises:
+            SearchQueueFullError: if the search cannot be queued
+        """
+        if self._held and self.paused:
+            await self._scheduler._acquire(self._user)
+            self.paused = False
+
+    def _release(self) -> None:
+        if self._held and not self.paused:
+            self._scheduler._release(self._user)
+        self._held = False
+
+
+class SearchScheduler:
+    """Schedule the searches of the server users.
+
+    Each client session runs at most one search at a time: starting a search
+    cancels the previous one of the same user and session.
+
+    The number of searches running concurrently is capped per user and
+    server-wide. When a cap is reached, the searches are queued and admitted
+    in a round-robin over the users so that none of them starves.
+
+    If the queue is full, new searches are rejected. And if a threads budget is
+    set, it is shared among the running searches when they are admitted.
+
+    Args:
+        max_processes: Maximal number of concurrent searches on the server; 0 for no limit
+        max_processes_per_user: Maximal number of concurrent searches per user; 0 for no limit
+        max_pending: Maximal number of queued searches on the server; 0 for no limit
+        threads_budget: Number of threads shared by the running searches; 0 for no budget
+    """
+
+    def __init__(
+        self,
+        max_processes: int = 0,
+        max_processes_per_user: int = 0,
+        max_pending: int = 0,
+        threads_budget: int = 0,
+    ) -> None:
+        self.max_processes = max_processes
+        self.max_processes_per_user = max_processes_per_user
+        self.max_pending = max_pending
+        self.threads_budget = threads_budget
+        self._tasks: Dict[Tuple[str, Hashable], asyncio.Task] = {}
+        self._running = 0
+        self._running_per_user: Dict[str, int] = defaultdict(int)
+        # Users with pending searches in round-robin order
+        self._waiters: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+
+    @property
+    def running(self) -> int:
+        """Number of searches running."""
+        return self._running
+
+    @property
+    def pending(self) -> int:
+        """Number of searches waiting to be admitted."""
+        return sum(len(waiters) for waiters in self._waiters.values())
+
+    def status(self) -> dict:
+        """Scheduler load and limits."""
+        return {
+            "running": self.running,
+            "pending": self.pending,
+            "max_processes": self.max_processes,
+            "max_processes_per_user": self.max_processes_per_user,
+            "max_pending": self.max_pending,
+            "threads_budget": self.threads_budget,
+        }
+
+    @asynccontextmanager
+    async def slot(
+        self, user: str = "", session: Hashable = ""
+    ) -> AsyncIterator[SearchSlot]:
+        """Wait for the current task to be allowed to run a search.
+
+        The previous task registered for the same ``user`` and ``session`` is cancelled
+        and waited for.
+
+        Args:
+            user: The user name
+            session: The client session identifier
+        Returns:
+            The slot of the search
+        Raises:
+            SearchQueueFullError: if the search cannot be queued
+        """
+        key = (user, session)
+        task = asyncio.current_task()
+        previous = self._tasks.get(key)
+        self._tasks[key] = task
+
+        try:
+            if previous is not None and previous is not task and not previous.done():
+                get_logger().debug(f"Cancelling previous search of {key!s}")
+                previous.cancel()
+                # Wait for its process to be terminated
+                await asyncio.wait([previous])
+            await self._acquire(user)
+            slot = SearchSlot(self, user, self._threads())
+            try:
+                yield slot
+            finally:
+                slot._release()
+        finally:
+            if self._tasks.get(key) is task:
+                del self._tasks[key]
+
+    def _threads(self) -> int:
+        if self.threads_budget <= 0:
+            return 0
+        return max(1, self.threads_budget // self._running)
+
+    def _can_run(self, user: str) -> bool:
+        return (self.max_processes <= 0 or self._running < self.max_processes) and (
+            self.max_processes_per_user <= 0
+            or self._running_per_user.get(user, 0) < self.max_processes_per_user
+        )
+
+    async def _acquire(self, user: str) -> None:
+        if user not in self._waiters and self._can_run(user):
+            self._running += 1
+            self._running_per_user[user] += 1
+            return
+
+        if self.max_pending > 0 and self.pending >= self.max_pending:
+            raise SearchQueueFullError(
+                f"Too many pending searches ({self.pending!s}), try again later."
+            )
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(user, deque()).append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was granted in the meantime
+                self._release(user)
+            else:
+                waiters = self._waiters.get(user)
+                if waiters is not None and waiter in waiters:
+                    waiters.remove(waiter)
+                    if not waiters:
+                        del self._waiters[user]
+            raise
+
+    def _release(self, user: str) -> None:
+        self._running -= 1
+        self._running_per_user[user] -= 1
+        if self._running_per_user[user] <= 0:
+            del self._running_per_user[user]
+        self._wake_up()
+
+    def _wake_up(self) -> None:
+        """Admit pending searches, one user at a time."""
+        admitted = True
+        while admitted and self._waiters:
+            admitted = False
+            for user in list(self._waiters):
+                if self.max_processes > 0 and self._running >= self.max_processes:
+                    return
+                if not self._can_run(user):
+                    continue
+
+                waiters = self._waiters[user]
+                waiter = waiters.popleft()
+                if waiters:
+                    # Move the user at the end of the round-robin
+                    self._waiters.move_to_end(user)
+                else:
+                    del self._waiters[user]
+
+                if not waiter.done():
+                    self._running += 1
+                    self._running_per_user[user] += 1
+                    waiter.set_result(None)
+                admitted = True
@@ -5,100 +5,673 @@ https://github.com/simark/theia/commit/5691f3811c5e82fec7fca3ad8e2952c8d03c9026
 """
 
 import asyncio
-import json
+import hashlib
 import logging
 import os
+import re
+import time
 
-from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from subprocess import Popen, PIPE
-from typing import ClassVar, Iterable, List, Optional, Tuple, Union
+from typing import (
+    AsyncIterator,
+    Dict,
+    Hashable,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
 
-import tornado
 from jupyter_server.services.contents.manager import (
     AsyncContentsManager,
     ContentsManager,
 )
-from jupyter_server.utils import ensure_async, url2path
+from jupyter_core.paths import jupyter_data_dir
+from jupyter_server.utils import url2path
+from traitlets import Bool, Enum, Float, Integer, List as ListTrait, Unicode, default
+from traitlets.config import Configurable
 
+from .codec import (
+    RipgrepBegin,
+    RipgrepEnd,
+    RipgrepEntry,
+    RipgrepMatch,
+    RipgrepSummary,
+    dumps,
+)
+from .backends import (
+    MAX_EXPLICIT_FILES,
+    GitGrepBackend,
+    IndexBackend,
+    PythonBackend,
+    RipgrepBackend,
+    SearchBackend,
+    SearchError,
+    SearchQuery,
+    construct_command,
+)
+from .cache import ChangeTracker, QueryRefiner, SearchCache
+from .checkpoints import CheckpointHistory
+from .index import TrigramIndex
+from .jobs import ReplaceJobManager
 from .log import get_logger
+from .metrics import CACHE_BACKEND, SearchTimings
+from .notebooks import NOTEBOOK_GLOB, NOTEBOOK_SUFFIX, NotebookCache, search_cells
+from .pagination import ResultPager
+from .process import start_process, terminate_process
+from .pysearch import compile_query
+from .replacer import ReplaceReport
+from .scheduler import SearchScheduler, SearchSlot
+from .storage import ContentsFileBackend, FileBackend, LocalFileBackend, is_local
+from .substitution import compile_replacement, substitute
+from .watcher import FileWatcher
 
 
 MAX_LOG_OUTPUT = 6000  # type: int
-
-
-def construct_command(
-    query: str,
-    case_sensitive: bool,
-    whole_word: bool,
-    include: List[str],
-    exclude: List[str],
-    use_regex: bool,
-    max_count: int,
-):
-    """Helper to construct the ripgrep command line."""
-    command = ["rg", "--json", "--max-count", f"{max_count}"]
-
-    if not use_regex:
-        command.append("--fixed-strings")
-    if not case_sensitive:
-        command.append("--ignore-case")
-    if whole_word:
-        command.append("--word-regexp")
-
-    if include:
-        for i in include:
-            command.extend(["-g", i])
-    if exclude:
-        for e in exclude:
-            command.extend(["-g", f"!{e}"])
-
-    # Deal with query starting with '-'
-    command.extend(["--", query])
-
-    return command
+STREAM_CHUNK_SIZE = 65536  # type: int
 
 
 def get_utf8_positions(string: str, positions: Iterable[int]) -> List[int]:
     """Get the utf-8 position within a ``string`` from its binary ``position``.
 
+    The string is encoded once and the bytes between two consecutive positions
+    are decoded only once, so that mapping all the positions of a line costs
+    a single pass over it. For ASCII strings, the positions are unchanged.
+
     Args:
         string: The utf-8 string
         position: The binary position
     Returns
         The utf-8 position
     """
+    positions = list(positions)
+    if string.isascii():
+        return positions
+
     bstring = string.encode("utf-8")
-    return [len(bstring[:position].decode("utf-8")) for position in positions]
+    utf8_positions = [0] * len(positions)
+    previous, count = 0, 0
+    for index in sorted(range(len(positions)), key=positions.__getitem__):
+        position = positions[index]
+        count += len(bstring[previous:position].decode("utf-8"))
+        previous = position
+        utf8_positions[index] = count
+    return utf8_positions
+
+
+def _existing_files(cwd: str, files: List[str]) -> List[str]:
+    return [file for file in files if os.path.isfile(os.path.join(cwd, file))]
+
+
+class _SearchOptions(NamedTuple):
+    """Normalized arguments of a search; hashable to identify it."""
+
+    query: str
+    # Search folder relative to the root directory, in POSIX format
+    path: str
+    case_sensitive: bool
+    whole_word: bool
+    include: Tuple[str, ...]
+    exclude: Tuple[str, ...]
+    use_regex: bool
+    max_count: int
+    # Name of the search backend; empty for the configured one
+    backend: str = ""
+
+    @classmethod
+    def create(
+        cls,
+        query: str,
+        path: str,
+        case_sensitive: bool,
+        whole_word: bool,
+        include: Optional[List[str]],
+        exclude: Optional[List[str]],
+        use_regex: bool,
+        max_count: int,
+        backend: Optional[str] = None,
+    ) -> "_SearchOptions":
+        return cls(
+            query,
+            Path(url2path(path)).as_posix(),
+            bool(case_sensitive),
+            bool(whole_word),
+            tuple(include or []),
+            tuple(exclude or []),
+            bool(use_regex),
+            int(max_count),
+            backend or "",
+        )
+
+
+class ReplaceConflictError(Exception):
+    """Error raised when the matches to replace differ from the reviewed ones."""
 
 
-class SearchEngine:
+def get_matches_etag(matches: List[dict]) -> str:
+    """Get a tag identifying the matches of a search whatever the order of the files.
+
+    The replacement strings are not part of the tag.
+
+    Args:
+        matches: The matches per file ``[{"path", "matches"}]``
+    Returns:
+        The tag
+    """
+    digest = hashlib.sha1()
+    for file_matches in sorted(matches, key=lambda f: f["path"]):
+        digest.update(file_matches["path"].encode("utf-8") + b"\0")
+        for match in file_matches["matches"]:
+            position = f"{match['line_number']}:{match['start']}:{match['end']}"
+            digest.update(f"{position}:{match['match']}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class SearchLimits(NamedTuple):
+    """Global limits of a search; 0 for no limit."""
+
+    # Maximal number of matches
+    max_matches: int = 0
+    # Maximal number of files with matches
+    max_files: int = 0
+    # Maximal size in bytes of the serialized matches
+    max_size: int = 0
+    # Maximal duration in seconds
+    timeout: float = 0.0
+
+
+class SearchStats:
+    """Statistics of a search, updated while it runs."""
+
+    def __init__(self) -> None:
+        self.matches = 0
+        self.files = 0
+        self.size = 0
+        self.start = time.monotonic()
+        self.elapsed = 0.0
+        # Name of the limit that truncated the search
+        self.truncated: Optional[str] = None
+        # Timings of the search phases
+        self.timings = SearchTimings()
+        # Scheduler slot of the running search; paused between two pages
+        self.slot: Optional[SearchSlot] = None
+
+    def to_dict(self) -> dict:
+        """Statistics as returned to the frontend."""
+        return {
+            "matches": self.matches,
+            "files": self.files,
+            "bytes": self.size,
+            "elapsed": self.elapsed,
+            "limit": self.truncated,
+        }
+
+
+class _FileMatchesBuilder:
+    """Assemble ripgrep JSON entries into matches per file.
+
+    Entries are fed one at a time, in the order ripgrep emits them;
+    the matches of a file are returned once its ``end`` entry is seen.
+
+    Once a limit is reached, the following matches are dropped and
+    ``stats.truncated`` is set to the limit name.
+
+    Args:
+        limits: The search limits
+        stats: The search statistics to update
+    """
+
+    def __init__(
+        self,
+        limits: SearchLimits = SearchLimits(),
+        stats: Optional[SearchStats] = None,
+    ) -> None:
+        self._path: Optional[str] = None
+        self._matches: List[dict] = []
+        self._limits = limits
+        self._stats = SearchStats() if stats is None else stats
+
+    def feed(self, entry: Optional[RipgrepEntry]) -> Optional[dict]:
+        """Process a ripgrep JSON entry.
+
+        Args:
+            entry: The decoded ripgrep JSON entry
+        Returns:
+            The file matches ``{"path", "matches"}`` when the entry closes a file,
+            ``None`` otherwise.
+        """
+        if self._stats.truncated is not None:
+            return None
+
+        if isinstance(entry, RipgrepMatch):
+            line = entry.line
+            bounds = [
+                bound for _, start, end in entry.submatches for bound in (start, end)
+            ]
+            if line is None:
+                # The line is not valid UTF-8; the positions cannot be mapped
+                positions = bounds
+            else:
+                # Compute positions for utf-8 string, for all the submatches at once
+                positions = get_utf8_positions(line, bounds)
+            for i, (text, start, end) in enumerate(entry.submatches):
+                formatted_entry = {
+                    "line": line,
+                    "match": text,
+                    "start": start,
+                    "end": end,
+                    # Computed afterwards if requested; see substitution.py
+                    "replace": None,
+                    "start_utf8": positions[2 * i],
+                    "end_utf8": positions[2 * i + 1],
+                    "line_number": entry.line_number,
+                    "absolute_offset": entry.absolute_offset,
+                }
+                if entry.cell is not None:
+                    formatted_entry["cell"] = entry.cell
+                    if entry.output is not None:
+                        formatted_entry["output"] = entry.output
+                if not self._count(formatted_entry):
+                    break
+                self._matches.append(formatted_entry)
+                if 0 < self._limits.max_matches <= self._stats.matches:
+                    self._stats.truncated = "max_matches"
+                    break
+        elif isinstance(entry, RipgrepBegin):
+            if 0 < self._limits.max_files <= self._stats.files:
+                self._stats.truncated = "max_files"
+                return None
+            self._stats.files += 1
+            self._path = entry.path
+            self._matches = []
+        elif isinstance(entry, RipgrepEnd):
+            return self.flush()
+
+        return None
+
+    def flush(self) -> Optional[dict]:
+        """Get the matches of the file being processed.
+
+        Returns:
+            The file matches ``{"path", "matches"}`` or ``None`` if no file is processed
+        """
+        if self._path is None:
+            return None
+        file_matches = {"path": self._path, "matches": self._matches}
+        self._path = None
+        self._matches = []
+        return file_matches
+
+    def _count(self, match: dict) -> bool:
+        """Account for a new match; return ``False`` if it exceeds the size limit."""
+        if self._limits.max_size > 0:
+            size = len(dumps(match))
+            if self._stats.size + size > self._limits.max_size:
+                self._stats.truncated = "max_size"
+                return False
+            self._stats.size += size
+        self._stats.matches += 1
+        return True
+
+
+async def _read_lines(
+    stream: asyncio.StreamReader,
+    chunk_size: int = STREAM_CHUNK_SIZE,
+    deadline: Optional[float] = None,
+    separator: bytes = b"\n",
+) -> AsyncIterator[bytes]:
+    """Iterate over the lines of ``stream`` as soon as they are available.
+
+    The stream is read by chunks rather than with ``readline`` as a ripgrep
+    JSON entry can be longer than the stream buffer limit. The lines are
+    terminated by ``separator``, e.g. ``b"\\0"`` for the ``-z`` output of git.
+
+    Raises:
+        asyncio.TimeoutError: if the ``deadline`` (in ``time.monotonic`` time) is passed
+    """
+    # Chunks of the line being read; they are joined once the line is complete
+    # so that a long line is not copied for each chunk.
+    pending: List[bytes] = []
+    while True:
+        if deadline is None:
+            chunk = await stream.read(chunk_size)
+        else:
+            chunk = await asyncio.wait_for(
+                stream.read(chunk_size), max(deadline - time.monotonic(), 0)
+            )
+        if not chunk:
+            break
+        if chunk.find(separator) < 0:
+            pending.append(chunk)
+            continue
+        lines = chunk.split(separator)
+        if pending:
+            pending.append(lines[0])
+            lines[0] = b"".join(pending)
+        pending = [lines.pop()]
+        for line in lines:
+            yield line
+    last = b"".join(pending)
+    if last:
+        yield last
+
+
+class SearchEngine(Configurable):
     """Engine to search recursively for a regex pattern in text files of a directory.
 
-    The implementation is using `ripgrep <https://github.com/BurntSushi/ripgrep>`_.
+    The files are searched by a backend, `ripgrep <https://github.com/BurntSushi/ripgrep>`_
+    by default; see :mod:`.backends`.
     """
 
-    # Keep track of the previous search task to run only one task at a time
-    search_task: ClassVar[Optional[asyncio.Task]] = None
+    max_processes = Integer(
+        0,
+        config=True,
+        help="Maximal number of ripgrep processes running concurrently on the server; 0 for no limit.",
+    )
+
+    max_processes_per_user = Integer(
+        0,
+        config=True,
+        help="Maximal number of ripgrep processes running concurrently for a user; 0 for no limit.",
+    )
+
+    max_pending = Integer(
+        0,
+        config=True,
+        help="Maximal number of searches waiting for a ripgrep process; 0 for no limit. Beyond it, searches are rejected.",
+    )
+
+    threads_budget = Integer(
+        0,
+        config=True,
+        help="Number of threads shared by the running ripgrep processes; 0 to let ripgrep choose for each process.",
+    )
+
+    max_matches = Integer(
+        0,
+        config=True,
+        help="Maximal number of matches returned by a search; 0 for no limit. Beyond it, the search is stopped.",
+    )
+
+    max_files = Integer(
+        0,
+        config=True,
+        help="Maximal number of files with matches returned by a search; 0 for no limit. Beyond it, the search is stopped.",
+    )
+
+    max_response_size = Integer(
+        0,
+        config=True,
+        help="Maximal size in bytes of the matches returned by a search; 0 for no limit. Beyond it, the search is stopped.",
+    )
+
+    kill_timeout = Float(
+        5.0,
+        config=True,
+        help="Time in seconds given to a stopped search process to exit after SIGTERM before it is killed with SIGKILL.",
+    )
+
+    search_timeout = Float(
+        0.0,
+        config=True,
+        help="Maximal duration in seconds of a ripgrep process; 0 for no limit. Beyond it, the search is stopped.",
+    )
+
+    cursor_ttl = Float(
+        60.0,
+        config=True,
+        help="Time in seconds after which an unused cursor of a paginated search expires and its ripgrep process is terminated.",
+    )
+
+    max_replace_workers = Integer(
+        4,
+        config=True,
+        help="Maximal number of files rewritten concurrently by a replace.",
+    )
+
+    file_backend = Enum(
+        ("auto", "local", "contents"),
+        "auto",
+        config=True,
+        help="""Backend writing the files of a replace.
+
+        'local' rewrites the files directly in the root directory, 'contents' reads
+        and saves them through the contents manager. 'auto' uses 'local' for the
+        contents managers storing the files on the local filesystem.""",
+    )
+
+    search_backend = Enum(
+        ("auto", "ripgrep", "git", "python", "index"),
+        "auto",
+        config=True,
+        help="""Backend searching the files unless a search selects another one.
+
+        'auto' uses the first backend of 'backend_order' available for the query.""",
+    )
+
+    backend_order = ListTrait(
+        Enum(("ripgrep", "git", "python", "index")),
+        ["index", "ripgrep", "python"],
+        config=True,
+        help="""Backends tried in order by the 'auto' backend.
+
+        'ripgrep' requires ripgrep to be installed, 'git' the search folder to be in
+        a git work tree, 'python' and 'git' a query supported by the Python re
+        module, and 'index' a literal query for which the index narrowed the files.""",
+    )
+
+    notebook_search = Bool(
+        False,
+        config=True,
+        help="""Whether to search the notebooks cells instead of their JSON document.
+
+        The matches positions are relative to the cell given by the 'cell' key.
+        The queries not supported by the Python re module search the JSON document.""",
+    )
+
+    notebook_outputs = Bool(
+        False,
+        config=True,
+        help="Whether to search the text outputs of the notebooks code cells too.",
+    )
+
+    notebook_cache_size = Integer(
+        256,
+        config=True,
+        help="Maximal number of notebooks whose cells text is cached.",
+    )
+
+    max_checkpoint_workers = Integer(
+        16,
+        config=True,
+        help="Maximal number of checkpoints created or restored concurrently.",
+    )
+
+    undo_history = Integer(
+        16,
+        config=True,
+        help="Number of replace operations that can be undone.",
+    )
+
+    job_ttl = Float(
+        300.0,
+        config=True,
+        help="Time in seconds a finished replace job report is kept.",
+    )
+
+    use_index = Bool(
+        False,
+        config=True,
+        help="Whether to narrow the files to search for literal queries with a trigram index of the files content.",
+    )
+
+    index_path = Unicode(
+        config=True,
+        help="Path of the trigram index database; default to a file in the Jupyter data directory.",
+    )
+
+    index_max_file_size = Integer(
+        10 * 1024 * 1024,
+        config=True,
+        help="Files bigger than this size in bytes are not indexed and always searched.",
+    )
+
+    file_watcher = Enum(
+        ("auto", "inotify", "polling", "none"),
+        "auto",
+        config=True,
+        help="""Backend watching the files changes to keep the index and the cache up-to-date.
+
+        'inotify' requires the watchdog package, 'polling' scans periodically the
+        files modification time and size, 'auto' uses inotify if available and
+        'none' disables the watcher.""",
+    )
+
+    watcher_poll_interval = Float(
+        5.0,
+        config=True,
+        help="Interval in seconds between two scans of the files by the polling watcher.",
+    )
+
+    watcher_debounce = Float(
+        0.5,
+        config=True,
+        help="Quiet period in seconds before processing a batch of files changes.",
+    )
+
+    use_cache = Bool(
+        False,
+        config=True,
+        help="Whether to cache the search results until a file changes in the searched folder.",
+    )
+
+    cache_max_size = Integer(
+        64 * 1024 * 1024,
+        config=True,
+        help="Memory budget in bytes of the cached search results; the least recently used are evicted first.",
+    )
+
+    refine_queries = Bool(
+        False,
+        config=True,
+        help="""Whether to search only the files matched by the previous search of a session
+        when a literal query is extended, as long as no file changed in the meantime.""",
+    )
+
+    @default("index_path")
+    def _default_index_path(self) -> str:
+        root_hash = hashlib.sha1(str(self._root_dir).encode("utf-8")).hexdigest()
+        return os.path.join(
+            jupyter_data_dir(), "jupyterlab_search_replace", f"index-{root_hash}.db"
+        )
 
     def __init__(
-        self, contents_manager: Union[AsyncContentsManager, ContentsManager]
+        self, contents_manager: Union[AsyncContentsManager, ContentsManager], **kwargs
     ) -> None:
         """
         Args:
             contents_manager: Server contents manager
         """
+        super().__init__(**kwargs)
         self._contents_manager = contents_manager
         self._root_dir = Path(os.path.expanduser(contents_manager.root_dir)).resolve()
+        # Keep track of the search tasks to run only one task at a time per session
+        self._scheduler = SearchScheduler(
+            self.max_processes,
+            self.max_processes_per_user,
+            self.max_pending,
+            self.threads_budget,
+        )
+        self._watcher = (
+            FileWatcher(
+                self._root_dir,
+                self.file_watcher,
+                self.watcher_poll_interval,
+                self.watcher_debounce,
+            )
+            if (self.use_index or self.use_cache or self.refine_queries)
+            and self.file_watcher != "none"
+            else None
+        )
+        self._index = (
+            TrigramIndex(
+                self._root_dir,
+                Path(self.index_path),
+                self.index_max_file_size,
+                watcher=self._watcher,
+            )
+            if self.use_index
+            else None
+        )
+        self._tracker = (
+            ChangeTracker(self._root_dir, self._watcher)
+            if self.use_cache or self.refine_queries
+            else None
+        )
+        self._cache = (
+            SearchCache(self.cache_max_size, self._tracker) if self.use_cache else None
+        )
+        self._refiner = QueryRefiner(self._tracker) if self.refine_queries else None
+        self._pager = ResultPager(self.cursor_ttl)
+        self._jobs = ReplaceJobManager(self.job_ttl)
+        self._notebooks = NotebookCache(self.notebook_cache_size)
+        self._backends: Dict[str, SearchBackend] = {
+            backend.name: backend
+            for backend in (
+                RipgrepBackend(self),
+                GitGrepBackend(self),
+                PythonBackend(self),
+                IndexBackend(self),
+            )
+        }
+        self._replace_executor = ThreadPoolExecutor(
+            max_workers=max(self.max_replace_workers, 1),
+            thread_name_prefix="search-replace-rewrite",
+        )
+        if self.file_backend == "local" or (
+            self.file_backend == "auto" and is_local(contents_manager)
+        ):
+            self._files: FileBackend = LocalFileBackend(
+                self._root_dir, self._replace_executor
+            )
+        else:
+            self._files = ContentsFileBackend(contents_manager, self._replace_executor)
+        self._checkpoints = CheckpointHistory(
+            contents_manager, self.undo_history, self.max_checkpoint_workers
+        )
+
+    def start(self) -> None:
+        """Start the engine background services."""
+        if self._watcher is not None:
+            self._watcher.start()
+
+    async def stop(self) -> None:
+        """Stop the engine background services.
 
-    async def _execute(
+        The paginated searches and the replace jobs are stopped, the worker
+        processes and threads are shut down and the index is closed.
+        """
+        if self._watcher is not None:
+            self._watcher.stop()
+        await self._pager.close_all()
+        await self._jobs.close_all()
+        self._replace_executor.shutdown(wait=False)
+        for backend in self._backends.values():
+            backend.close()
+        if self._index is not None:
+            await self._index.close()
+
+    async def execute(
         self, cmd: List[str], cwd: Optional[str] = None
     ) -> Tuple[int, str]:
         """Asynchronously execute a command.
 
         Args:
             cmd (List[str]): command with arguments to execute
-
+            cwd (str): working directory
 
         Returns:
             (int, str): (return code, output) or (return code, error)
@@ -106,17 +679,11 @@ class SearchEngine:
 
         self.log.debug("run '{!s}' in {!s}".format(" ".join(cmd), cwd))
 
-        current_loop = tornado.ioloop.IOLoop.current()
-        process = await current_loop.run_in_executor(
-            None, partial(Popen, cmd, stdout=PIPE, stderr=PIPE, cwd=cwd)
-        )
+        process = await start_process(cmd, cwd=cwd)
         try:
-            output, error = await current_loop.run_in_executor(
-                None, process.communicate
-            )
+            output, error = await process.communicate()
         except asyncio.CancelledError:
-            process.terminate()
-            await current_loop.run_in_executor(None, process.wait)
+            await terminate_process(process, self.kill_timeout)
             raise
 
         returncode = process.returncode
@@ -139,6 +706,308 @@ class SearchEngine:
 
         return returncode, output
 
+    async def stream(
+        self,
+        cmd: List[str],
+        cwd: Optional[str] = None,
+        deadline: Optional[float] = None,
+        timings: Optional[SearchTimings] = None,
+        separator: bytes = b"\n",
+    ) -> AsyncIterator[bytes]:
+        """Asynchronously execute a command and iterate over its output lines.
+
+        The process and its children are terminated if the iteration is stopped
+        before its end; see :func:`.process.terminate_process`.
+
+        Args:
+            cmd (List[str]): command with arguments to execute
+            cwd (str): working directory
+            deadline (float): time (in ``time.monotonic`` time) after which
+                the process is terminated
+            timings (SearchTimings): timings to account the process start and
+                output size in
+            separator (bytes): terminator of the output lines
+
+        Raises:
+            SearchError: if the command exits with an error code
+            asyncio.TimeoutError: if the deadline is passed
+        """
+        self.log.debug("stream '{!s}' in {!s}".format(" ".join(cmd), cwd))
+
+        start = time.monotonic()
+        process = await start_process(cmd, cwd=cwd)
+        if timings is not None:
+            timings.add_spawn(time.monotonic() - start)
+        # Drain stderr concurrently to avoid filling its pipe
+        error = asyncio.ensure_future(process.stderr.read())
+        try:
+            async for line in _read_lines(
+                process.stdout, deadline=deadline, separator=separator
+            ):
+                if timings is not None:
+                    timings.output_bytes += len(line) + 1
+                yield line
+            returncode = await process.wait()
+            error_msg = (await error).decode("utf-8")
+        finally:
+            if process.returncode is None:
+                await terminate_process(process, self.kill_timeout)
+            if not error.done():
+                error.cancel()
+
+        self.log.debug(f"exit code: {returncode!s}")
+        # Exit code 1 is the case for no match found
+        if returncode not in (0, 1):
+            raise SearchError(returncode, error_msg, cmd)
+
+    async def _index_candidates(
+        self,
+        query: str,
+        path: str,
+        case_sensitive: bool,
+        include: List[str],
+        exclude: List[str],
+        use_regex: bool,
+    ) -> Optional[List[str]]:
+        """Get the files that may match a query from the trigram index.
+
+        Returns:
+            The candidate files relative to the search folder or ``None``
+            if the whole folder must be searched.
+        """
+        if self._index is None or use_regex:
+            return None
+
+        # ripgrep does not apply the globs on explicit paths so the files to
+        # search are listed first.
+        listed = await self._list_files(path, include, exclude)
+        if listed is None:
+            return None
+
+        prefix = Path(url2path(path))
+        files = {(prefix / file).as_posix(): file for file in listed}
+        candidates = await self._index.candidates(list(files), query, case_sensitive)
+        if candidates is None or len(candidates) > MAX_EXPLICIT_FILES:
+            return None
+        self.log.debug(f"Index narrowed the search to {len(candidates)} files.")
+        return [files[candidate] for candidate in candidates]
+
+    async def _list_files(
+        self,
+        path: str,
+        include: List[str],
+        exclude: List[str],
+        notebooks_only: bool = False,
+    ) -> Optional[List[str]]:
+        """List the files to search.
+
+        The files are listed by ripgrep, or by Python if ripgrep is not installed.
+
+        Args:
+            path: The search folder relative to the root directory
+            include: Filters specifying files to include
+            exclude: Filters specifying files to exclude
+            notebooks_only: Whether to list only the notebooks
+        Returns:
+            The files relative to the search folder or ``None`` if they cannot be listed
+        """
+        cwd = os.path.join(self._root_dir, url2path(path))
+        ripgrep = self._backends["ripgrep"]
+        if await ripgrep.available(
+            SearchQuery("", False, False, (), (), False, 0, cwd)
+        ):
+            files = await ripgrep.list_files(cwd, include, exclude)
+        else:
+            files = await self._backends["python"].list_files(cwd, include, exclude)
+        if files is not None and notebooks_only:
+            files = [file for file in files if file.endswith(NOTEBOOK_SUFFIX)]
+        return files
+
+    async def _select_backend(self, name: str, query: SearchQuery) -> SearchBackend:
+        """Select the backend running a search.
+
+        Args:
+            name: The backend name; empty for the configured one
+            query: The search
+        Returns:
+            The backend
+        Raises:
+            SearchError: if the backend is unknown or not available for the query
+        """
+        name = name or self.search_backend
+        names = self.backend_order if name == "auto" else [name]
+        for candidate in names:
+            backend = self._backends.get(candidate)
+            if backend is None:
+                raise SearchError(2, f"Unknown search backend '{candidate}'.", [])
+            if await backend.available(query):
+                self.log.debug(f"Searching with the {backend.name} backend.")
+                return backend
+        raise SearchError(
+            2, f"No search backend among {names!r} is available for this query.", []
+        )
+
+    async def _search_notebooks(
+        self,
+        options: _SearchOptions,
+        pattern: "re.Pattern",
+        files: Optional[List[str]],
+        deadline: Optional[float] = None,
+    ) -> AsyncIterator[RipgrepEntry]:
+        """Search the cells of the notebooks.
+
+        Args:
+            options: The search options
+            pattern: The compiled query
+            files: The files to search, relative to the search folder; ``None``
+                to search the whole folder
+            deadline: Time (in ``time.monotonic`` time) after which the search stops
+        Yields:
+            The entries of the matches, as ripgrep reports them
+        Raises:
+            asyncio.TimeoutError: if the deadline is passed
+        """
+        cwd = os.path.join(self._root_dir, url2path(options.path))
+        if files is None:
+            files = await self._list_files(
+                options.path,
+                list(options.include),
+                list(options.exclude),
+                notebooks_only=True,
+            )
+        notebooks = sorted(
+            file for file in files or [] if file.endswith(NOTEBOOK_SUFFIX)
+        )
+
+        loop = asyncio.get_running_loop()
+        for notebook in notebooks:
+            if deadline is not None and time.monotonic() > deadline:
+                raise asyncio.TimeoutError()
+            try:
+                lines = await loop.run_in_executor(
+                    None,
+                    self._search_notebook,
+                    Path(cwd) / notebook,
+                    pattern,
+                    options.max_count,
+                )
+            except (OSError, ValueError) as e:
+                self.log.debug(f"Unable to search notebook {notebook}: {e!s}")
+                continue
+            if lines:
+                yield RipgrepBegin(notebook)
+                for line in lines:
+                    yield line
+                yield RipgrepEnd()
+
+    def _search_notebook(
+        self, file_path: Path, pattern: "re.Pattern", max_count: int
+    ) -> List[RipgrepMatch]:
+        cells = self._notebooks.get_cells(file_path, self.notebook_outputs)
+        return list(search_cells(cells, pattern, max_count))
+
+    async def _lookup(
+        self, options: _SearchOptions, user: str, session: Hashable
+    ) -> Tuple[Optional[List[dict]], Optional[List[str]], Union[int, str, None]]:
+        """Look for the result of a search among the previous ones.
+
+        Returns:
+            (matches, files, token): The cached matches or ``None``, the files to
+            search or ``None`` to search the whole folder, and the token of the
+            searched folder to record the result with.
+        """
+        if self._tracker is None:
+            return None, None, None
+
+        token = await self._tracker.token(options.path)
+        if self._cache is not None:
+            matches = self._cache.lookup(options, options.path, token)
+            if matches is not None:
+                return matches, None, token
+
+        files = None
+        if self._refiner is not None and self._is_refinable(options):
+            files = self._refiner.candidates(
+                (user, session),
+                options._replace(query="", max_count=0),
+                options.path,
+                options.query,
+                token,
+            )
+        return None, files, token
+
+    def _record(
+        self,
+        options: _SearchOptions,
+        user: str,
+        session: Hashable,
+        token: Union[int, str, None],
+        matches: Optional[List[dict]],
+        files: List[str],
+    ) -> None:
+        """Record the result of a completed search.
+
+        Args:
+            options: The search options
+            user: The user requesting the search
+            session: The client session requesting the search
+            token: The token of the searched folder before the search
+            matches: The search result if it fits in the cache, ``None`` otherwise
+            files: The files with matches
+        """
+        if token is None:
+            return
+        if self._cache is not None and matches is not None:
+            self._cache.store(options, options.path, token, matches)
+        if (
+            self._refiner is not None
+            and self._is_refinable(options)
+            and len(files) <= MAX_EXPLICIT_FILES
+        ):
+            self._refiner.record(
+                (user, session),
+                options._replace(query="", max_count=0),
+                options.path,
+                options.query,
+                token,
+                files,
+            )
+
+    @staticmethod
+    def _is_refinable(options: _SearchOptions) -> bool:
+        # A whole word containing the previous query does not contain it as a whole word
+        return not options.use_regex and not options.whole_word
+
+    @property
+    def limits(self) -> SearchLimits:
+        """SearchLimits : Global limits of a search"""
+        return SearchLimits(
+            self.max_matches,
+            self.max_files,
+            self.max_response_size,
+            self.search_timeout,
+        )
+
+    @property
+    def backend_names(self) -> List[str]:
+        """List[str] : Names of the search backends, ``auto`` included"""
+        return ["auto", *self._backends]
+
+    @property
+    def jobs(self) -> ReplaceJobManager:
+        """Replace jobs running in the background."""
+        return self._jobs
+
+    @property
+    def pager(self) -> ResultPager:
+        """ResultPager : Pages of the paginated searches"""
+        return self._pager
+
+    @property
+    def scheduler(self) -> SearchScheduler:
+        """SearchScheduler : Search processes scheduler"""
+        return self._scheduler
+
     @property
     def log(self) -> logging.Logger:
         """logging.Logger : Extension logger"""
@@ -154,6 +1023,11 @@ class SearchEngine:
         exclude: Optional[List[str]] = None,
         use_regex: bool = False,
         max_count: int = 100,
+        user: str = "",
+        session: Hashable = "",
+        replace: Optional[str] = None,
+        backend: Optional[str] = None,
+        stats: Optional[SearchStats] = None,
     ) -> dict:
         """Search for ``query`` in files in ``path``.
 
@@ -169,84 +1043,449 @@ class SearchEngine:
             exclude: Filters specifying files to exclude
             use_regex: Whether the search term is a regular expression or not
             max_count: The maximal number of lines with matches per file to return
+            user: The user requesting the search
+            session: The client session requesting the search; a new search
+                cancels the previous one of the same user and session
+            replace: The replacement template; if set, the replacement string
+                of each match is computed if possible
+            backend: The name of the backend running the search; ``None`` for
+                :attr:`search_backend`
+            stats: The search statistics to update
 
         Returns:
             Dictionary with the matches or the error description
+        Raises:
+            SearchQueueFullError: if too many searches are pending
         """
-        # JSON output is described at https://docs.rs/grep-printer/0.1.0/grep_printer/struct.JSON.html
-        command = construct_command(
+        options = _SearchOptions.create(
             query,
+            path,
             case_sensitive,
             whole_word,
-            include or [],
-            exclude or [],
+            include,
+            exclude,
             use_regex,
             max_count,
+            backend,
         )
-        cwd = os.path.join(self._root_dir, url2path(path))
-        # TODO this is not compatible of a multi-users server
-        if SearchEngine.search_task is not None and not SearchEngine.search_task.done():
-            SearchEngine.search_task.cancel()
-        SearchEngine.search_task = asyncio.create_task(self._execute(command, cwd=cwd))
-        code, output = await SearchEngine.search_task
-
-        if code == 0:
-            matches_per_files = []
-            iter_lines = iter(output.splitlines())
-            for line in iter_lines:
-                entry = json.loads(line)
-
-                if entry.get("type") == "begin":
-                    path = entry.get("data", {}).get("path", {}).get("text")
-                    matches = []
-                    for file_line in iter_lines:
-                        subentry = json.loads(file_line)
-                        if subentry.get("type") == "match":
-                            data = subentry.get("data")
-                            for match in data.get("submatches", []):
-                                formatted_entry = {
-                                    "line": data.get("lines", {}).get("text"),
-                                    "match": match.get("match", {}).get("text"),
-                                    "start": match.get("start"),
-                                    "end": match.get("end"),
-                                    # TODO Provision the ability to get the replacement string from ripgrep
-                                    # See https://github.com/BurntSushi/ripgrep/issues/1872
-                                    "replace": None,
-                                }
-                                # Compute positions for utf-8 string
-                                positions = get_utf8_positions(
-                                    formatted_entry["line"],
-                                    [match["start"], match["end"]],
-                                )
-                                formatted_entry["start_utf8"] = positions[0]
-                                formatted_entry["end_utf8"] = positions[1]
-                                for key in ("line_number", "absolute_offset"):
-                                    formatted_entry[key] = data.get(key)
+        if stats is None:
+            stats = SearchStats()
+        matches, files, token = await self._lookup(options, user, session)
+        if matches is None:
+            try:
+                matches = [
+                    file_matches
+                    async for file_matches in self._search_stream(
+                        options, files, user, session, stats
+                    )
+                ]
+            except SearchError as e:
+                return e.to_dict()
+        else:
+            self._observe_cache_hit(stats)
 
-                                matches.append(formatted_entry)
+        if stats.truncated is None:
+            self._record(
+                options,
+                user,
+                session,
+                token,
+                matches,
+                [file_matches["path"] for file_matches in matches],
+            )
 
-                        elif subentry.get("type") == "end":
-                            matches_per_files.append({"path": path, "matches": matches})
-                            break
+        replacement = compile_replacement(
+            query, replace, options.case_sensitive, options.use_regex
+        )
+        if replacement is not None:
+            matches = [
+                substitute(replacement, file_matches) for file_matches in matches
+            ]
 
-            return {"matches": matches_per_files}
-        else:
+        if stats.truncated is not None:
+            return {"matches": matches, "truncated": True, "stats": stats.to_dict()}
+        return {"matches": matches}
+
+    async def search_stream(
+        self,
+        query: str,
+        path: str = "",
+        case_sensitive: bool = False,
+        whole_word: bool = False,
+        include: Optional[List[str]] = None,
+        exclude: Optional[List[str]] = None,
+        use_regex: bool = False,
+        max_count: int = 100,
+        user: str = "",
+        session: Hashable = "",
+        stats: Optional[SearchStats] = None,
+        replace: Optional[str] = None,
+        backend: Optional[str] = None,
+    ) -> AsyncIterator[dict]:
+        """Search for ``query`` in files in ``path`` yielding the matches file per file.
+
+        Contrary to :meth:`search`, the matches of a file are yielded as soon as
+        ripgrep has finished processing it; the whole output is never held in memory.
+
+        If a global limit is reached, the iteration stops early and
+        ``stats.truncated`` is set to the name of the limit.
+
+        Args:
+            query: The search term
+            path: The root folder to run the search in
+            case_sensitive: Whether the search is case sensitive or not
+            whole_word: Whether the search is for whole words or not
+            include: Filters specifying files to include
+            exclude: Filters specifying files to exclude
+            use_regex: Whether the search term is a regular expression or not
+            max_count: The maximal number of lines with matches per file to return
+            user: The user requesting the search
+            session: The client session requesting the search; a new search
+                cancels the previous one of the same user and session
+            stats: The search statistics to update
+            replace: The replacement template; if set, the replacement string
+                of each match is computed if possible
+            backend: The name of the backend running the search; ``None`` for
+                :attr:`search_backend`
+
+        Yields:
+            The matches of a file ``{"path", "matches"}``
+
+        Raises:
+            SearchError: if ripgrep fails
+            SearchQueueFullError: if too many searches are pending
+        """
+        options = _SearchOptions.create(
+            query,
+            path,
+            case_sensitive,
+            whole_word,
+            include,
+            exclude,
+            use_regex,
+            max_count,
+            backend,
+        )
+        if stats is None:
+            stats = SearchStats()
+        replacement = compile_replacement(
+            query, replace, options.case_sensitive, options.use_regex
+        )
+        matches, files, token = await self._lookup(options, user, session)
+        if matches is not None:
             try:
-                output = json.loads(output)
-                if output["type"] == "summary":
-                    stats = output["data"]["stats"]
-                    if (
-                        stats["matched_lines"] == 0
-                        and stats["matches"] == 0
-                        and stats["searches"] == 0
-                        and stats["searches_with_match"] == 0
-                    ):
-                        return {"matches": []}
-            except (json.JSONDecodeError, KeyError):
-                # If parsing the JSON fails or one key is missing
-                # consider the output as invalid
-                pass
-            return {"code": code, "command": command, "message": output}
+                for file_matches in matches:
+                    yield (
+                        file_matches
+                        if replacement is None
+                        else substitute(replacement, file_matches)
+                    )
+            except (asyncio.CancelledError, GeneratorExit):
+                self._observe_cache_hit(stats, "cancelled")
+                raise
+            self._observe_cache_hit(stats)
+            self._record(
+                options,
+                user,
+                session,
+                token,
+                matches,
+                [file_matches["path"] for file_matches in matches],
+            )
+            return
+
+        # Keep the matches for the cache as long as they fit in its budget
+        matches = [] if self._cache is not None else None
+        size = 0
+        matched_files = []
+        stream = self._search_stream(options, files, user, session, stats)
+        try:
+            async for file_matches in stream:
+                matched_files.append(file_matches["path"])
+                if matches is not None:
+                    size += len(dumps(file_matches))
+                    if size > self._cache.max_size:
+                        matches = None
+                    else:
+                        matches.append(file_matches)
+                yield (
+                    file_matches
+                    if replacement is None
+                    else substitute(replacement, file_matches)
+                )
+        finally:
+            # Stop the search processes now if the iteration is stopped early
+            await stream.aclose()
+        if stats.truncated is None:
+            self._record(options, user, session, token, matches, matched_files)
+
+    def _observe_cache_hit(self, stats: SearchStats, outcome: str = "done") -> None:
+        """Observe a search answered from the cache by the metrics."""
+        stats.elapsed = time.monotonic() - stats.start
+        stats.timings.backend = CACHE_BACKEND
+        stats.timings.search = stats.elapsed
+        stats.timings.observe(outcome)
+
+    async def _search_stream(
+        self,
+        options: _SearchOptions,
+        files: Optional[List[str]],
+        user: str,
+        session: Hashable,
+        stats: SearchStats,
+    ) -> AsyncIterator[dict]:
+        # JSON output is described at https://docs.rs/grep-printer/0.1.0/grep_printer/struct.JSON.html
+        cwd = os.path.join(self._root_dir, url2path(options.path))
+        limits = self.limits
+        builder = _FileMatchesBuilder(limits, stats)
+        outcome = "error"
+        pattern = (
+            compile_query(
+                options.query,
+                options.case_sensitive,
+                options.whole_word,
+                options.use_regex,
+            )
+            if self.notebook_search
+            else None
+        )
+        try:
+            async with self._scheduler.slot(user, session) as slot:
+                stats.slot = slot
+                notebooks = files
+                exclude = list(options.exclude)
+                if pattern is not None:
+                    # The last glob takes precedence over the include globs
+                    exclude.append(NOTEBOOK_GLOB)
+                    if files is not None:
+                        files = [f for f in files if not f.endswith(NOTEBOOK_SUFFIX)]
+                if files is None:
+                    files = await self._index_candidates(
+                        options.query,
+                        options.path,
+                        options.case_sensitive,
+                        list(options.include),
+                        exclude,
+                        options.use_regex,
+                    )
+                if files:
+                    # The files of a previous search or of the index may have been
+                    # deleted in the meantime; ripgrep fails on missing paths.
+                    files = await asyncio.get_running_loop().run_in_executor(
+                        None, _existing_files, cwd, files
+                    )
+                deadline = time.monotonic() + limits.timeout if limits.timeout else None
+                query = SearchQuery(
+                    options.query,
+                    options.case_sensitive,
+                    options.whole_word,
+                    options.include,
+                    tuple(exclude),
+                    options.use_regex,
+                    options.max_count,
+                    cwd,
+                    files,
+                    slot.threads,
+                    deadline,
+                    stats.timings,
+                )
+                backend = await self._select_backend(options.backend, query)
+                stats.timings.backend = backend.name
+
+                sources: List[AsyncIterator[Optional[RipgrepEntry]]] = []
+                if files is None or files:
+                    sources.append(backend.search(query))
+                if pattern is not None:
+                    sources.append(
+                        self._search_notebooks(options, pattern, notebooks, deadline)
+                    )
+
+                timings = stats.timings
+                for entries in sources:
+                    # Exiting the iteration terminates the backend search
+                    start = time.monotonic()
+                    try:
+                        async for entry in entries:
+                            if isinstance(entry, RipgrepMatch):
+                                timings.match_found()
+                            elif isinstance(entry, RipgrepSummary):
+                                timings.add_files(
+                                    entry.searches, entry.searches_with_match
+                                )
+                            file_matches = builder.feed(entry)
+                            if file_matches is not None:
+                                yield file_matches
+                            if stats.truncated is not None:
+                                break
+                    except asyncio.TimeoutError:
+                        stats.truncated = "timeout"
+                    finally:
+                        await entries.aclose()
+                        timings.search += time.monotonic() - start
+                    if stats.truncated is not None:
+                        break
+
+            if stats.truncated is not None:
+                self.log.debug(f"Search truncated by the {stats.truncated} limit.")
+                file_matches = builder.flush()
+                if file_matches is not None and file_matches["matches"]:
+                    yield file_matches
+            outcome = "done" if stats.truncated is None else "truncated"
+        except (asyncio.CancelledError, GeneratorExit):
+            outcome = "cancelled"
+            raise
+        finally:
+            stats.elapsed = time.monotonic() - stats.start
+            stats.timings.observe(outcome)
+
+    async def find_replacements(
+        self,
+        query: str,
+        path: str = "",
+        case_sensitive: bool = False,
+        whole_word: bool = False,
+        include: Optional[List[str]] = None,
+        exclude: Optional[List[str]] = None,
+        use_regex: bool = False,
+        max_count: int = 100,
+        user: str = "",
+        session: Hashable = "",
+        replace: str = "",
+        expected_count: Optional[int] = None,
+        etag: Optional[str] = None,
+        backend: Optional[str] = None,
+    ) -> List[dict]:
+        """Search for ``query`` in files in ``path`` and compute the replacement of the matches.
+
+        The result is meant to be passed to :meth:`replace` without going through
+        the client. It is checked against the result reviewed by the user.
+
+        Args:
+            query: The search term
+            path: The root folder to run the search in
+            case_sensitive: Whether the search is case sensitive or not
+            whole_word: Whether the search is for whole words or not
+            include: Filters specifying files to include
+            exclude: Filters specifying files to exclude
+            use_regex: Whether the search term is a regular expression or not
+            max_count: The maximal number of lines with matches per file to return
+            user: The user requesting the search
+            session: The client session requesting the search
+            replace: The replacement template
+            expected_count: The number of matches expected; ``None`` to not check it
+            etag: The tag of the matches expected (see :func:`get_matches_etag`);
+                ``None`` to not check it
+            backend: The name of the backend running the search; ``None`` for
+                :attr:`search_backend`
+        Returns:
+            The matches per file with their replacement string
+        Raises:
+            SearchError: if ripgrep fails
+            SearchQueueFullError: if too many searches are pending
+            ReplaceConflictError: if the search is truncated or the matches
+                differ from the expected ones
+            ValueError: if the replacement cannot be computed on the server
+        """
+        if compile_replacement(query, replace, case_sensitive, use_regex) is None:
+            raise ValueError(f"Unable to compute the replacement of '{query}'.")
+
+        r = await self.search(
+            query,
+            path,
+            case_sensitive,
+            whole_word,
+            include,
+            exclude,
+            use_regex,
+            max_count,
+            user,
+            session,
+            replace,
+            backend,
+        )
+        if r.get("code") is not None:
+            raise SearchError(r["code"], r["message"], r.get("command", []))
+        if r.get("truncated"):
+            raise ReplaceConflictError(
+                f"The search was stopped by the {r['stats']['limit']} limit."
+            )
+
+        matches = r["matches"]
+        if expected_count is not None:
+            count = sum(len(file_matches["matches"]) for file_matches in matches)
+            if count != expected_count:
+                raise ReplaceConflictError(
+                    f"Expected {expected_count} matches, found {count}."
+                )
+        if etag is not None and get_matches_etag(matches) != etag:
+            raise ReplaceConflictError("The matches changed since they were reviewed.")
+        return matches
+
+    async def search_paginated(
+        self,
+        query: str,
+        path: str = "",
+        case_sensitive: bool = False,
+        whole_word: bool = False,
+        include: Optional[List[str]] = None,
+        exclude: Optional[List[str]] = None,
+        use_regex: bool = False,
+        max_count: int = 100,
+        user: str = "",
+        session: Hashable = "",
+        page_size: int = 50,
+        replace: Optional[str] = None,
+        backend: Optional[str] = None,
+    ) -> dict:
+        """Search for ``query`` in files in ``path`` and get the first page of matches.
+
+        The following pages are fetched from :attr:`pager` with the returned cursor.
+        The search is paused between two pages and stopped once its cursor expires.
+
+        Args:
+            query: The search term
+            path: The root folder to run the search in
+            case_sensitive: Whether the search is case sensitive or not
+            whole_word: Whether the search is for whole words or not
+            include: Filters specifying files to include
+            exclude: Filters specifying files to exclude
+            use_regex: Whether the search term is a regular expression or not
+            max_count: The maximal number of lines with matches per file to return
+            user: The user requesting the search
+            session: The client session requesting the search; a new search
+                cancels the previous one of the same user and session
+            page_size: The maximal number of files per page
+            replace: The replacement template; if set, the replacement string
+                of each match is computed if possible
+            backend: The name of the backend running the search; ``None`` for
+                :attr:`search_backend`
+
+        Returns:
+            The page ``{"matches", "cursor"}`` or the error description;
+            the cursor is ``None`` for the last page.
+        Raises:
+            SearchQueueFullError: if too many searches are pending
+        """
+        stats = SearchStats()
+        stream = self.search_stream(
+            query,
+            path,
+            case_sensitive,
+            whole_word,
+            include,
+            exclude,
+            use_regex,
+            max_count,
+            user,
+            session,
+            stats,
+            replace,
+            backend,
+        )
+        try:
+            return await self._pager.start(stream, stats, page_size, user, session)
+        except SearchError as e:
+            return e.to_dict()
 
     def group_matches_by_line(self, line_matches: List[dict]) -> dict:
         """Group matches within a file by line.
@@ -254,10 +1493,13 @@ class SearchEngine:
         Args:
             line_matches: The matches to group by
         Returns:
-            The mapping line/matches positions ``{line_number: List[Tuple[start, end, replace_bytes]]}``
+            The mapping line/matches positions ``{line_number: List[Tuple[start, end, replace_bytes]]}``;
+            the matches without replacement are skipped.
         """
         d = {}
         for match in line_matches:
+            if match["replace"] is None:
+                continue
             if match["line_number"] not in d:
                 d[match["line_number"]] = [
                     (match["start"], match["end"], match["replace"].encode("utf-8"))
@@ -270,47 +1512,190 @@ class SearchEngine:
             d[line] = sorted(matches, key=lambda tup: tup[0])
         return d
 
-    async def replace(self, matches: List, path: str, create_checkpoint=True) -> None:
+    def group_matches_by_cell(self, cell_matches: List[dict]) -> dict:
+        """Group matches within a notebook by cell and line.
+
+        The matches in the cells outputs are ignored.
+
+        Args:
+            cell_matches: The matches to group by
+        Returns:
+            The mapping cell/line/matches positions; see :meth:`group_matches_by_line`
+        """
+        cells = {}
+        for match in cell_matches:
+            if match.get("output") is None:
+                cells.setdefault(match["cell"], []).append(match)
+        return {
+            cell: self.group_matches_by_line(matches) for cell, matches in cells.items()
+        }
+
+    async def replace(
+        self,
+        matches: List,
+        path: str,
+        create_checkpoint=True,
+        report: Optional[ReplaceReport] = None,
+        user: str = "",
+    ) -> ReplaceReport:
         """Replace the ``matches`` within ``path``.
 
         A match is described by a dictionary: {"line_number", "start", "end", "replace"}
         where ``line_number`` is base 1, ``start`` and ``end`` are bytes positions
-        in the line and ``replace`` is UTF-8 string to use as replacement.
+        in the line and ``replace`` is UTF-8 string to use as replacement. The
+        matches of a notebook search have a ``cell`` key; the line is then within
+        the cell source.
+
+        The checkpoints of all the files are created first, concurrently, and the
+        files are then rewritten concurrently in a thread pool; a file failing does
+        not prevent the others from being rewritten. The files not started yet are
+        skipped once ``report.cancelled`` is set.
+
+        The replacement can be undone with :meth:`undo` given ``report.operation``.
+
+        Each file must appear once in ``matches``, as its matches are replaced by
+        reading and rewriting it in one go.
 
         Args:
             matches: The search matches to replace
             path: The root folder in which to apply the replace
-            create_checkpoint: Whether to create a checkpoint before replacing matches
+            create_checkpoint: Whether to create a checkpoint before replacing matches;
+                the replacement can only be undone if so
+            report: The report to update while the files are rewritten; its total
+                must be set by the caller
+            user: The user replacing the matches; only they can undo the replacement
+        Returns:
+            The report of the replacement
+        Raises:
+            ValueError: if a file appears several times in ``matches``
         """
-        for file_match in matches:
-            file_relative_path = file_match["path"]
-            line_matches = file_match["matches"]
+        self._check_paths(matches)
+        if report is None:
+            report = ReplaceReport(len(matches))
+        semaphore = asyncio.Semaphore(max(self.max_replace_workers, 1))
+        root = url2path(path)
 
-            relative_path = os.path.join(url2path(path), file_relative_path)
+        checkpoints: Dict[str, dict] = {}
+        if create_checkpoint:
+            paths = [os.path.join(root, file_match["path"]) for file_match in matches]
+            checkpoints, errors = await self._checkpoints.create(
+                paths, lambda: report.cancelled
+            )
+            for file_match in matches:
+                relative_path = os.path.join(root, file_match["path"])
+                if relative_path in errors:
+                    error = errors[relative_path]
+                    self.log.error(
+                        f"Failed to create checkpoint for {relative_path}: {error!s}"
+                    )
+                    report.add_error(file_match["path"], error)
+            # Only the files with a checkpoint are modified
+            matches = [
+                file_match
+                for file_match in matches
+                if os.path.join(root, file_match["path"]) in checkpoints
+            ]
+        replaced: List[str] = []
 
-            if create_checkpoint:
-                self.log.debug(f"Creating checkpoints for {relative_path}")
-                await ensure_async(
-                    self._contents_manager.create_checkpoint(relative_path)
+        async def replace_file(file_match: dict) -> None:
+            file_relative_path = file_match["path"]
+            relative_path = os.path.join(root, file_relative_path)
+            async with semaphore:
+                if report.cancelled:
+                    return
+                try:
+                    if any("cell" in match for match in file_match["matches"]):
+                        size = await self._files.rewrite_notebook(
+                            relative_path,
+                            self.group_matches_by_cell(file_match["matches"]),
+                        )
+                    else:
+                        grouped_line_matches = self.group_matches_by_line(
+                            file_match["matches"]
+                        )
+                        size = await self._files.rewrite(
+                            relative_path, grouped_line_matches
+                        )
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.log.error(
+                        f"Failed to replace matches in {relative_path}: {e!s}"
+                    )
+                    report.add_error(file_relative_path, e)
+                else:
+                    replaced.append(relative_path)
+                    report.add_success(file_relative_path, size)
+
+        try:
+            await asyncio.gather(*(replace_file(file_match) for file_match in matches))
+        finally:
+            if replaced and create_checkpoint:
+                report.operation = self._checkpoints.record(
+                    {
+                        relative_path: checkpoints[relative_path]
+                        for relative_path in replaced
+                    },
+                    user,
                 )
+            # The files may be modified within the resolution of their modification time
+            if self._cache is not None:
+                self._cache.clear()
+            if self._refiner is not None:
+                self._refiner.forget()
+        return report
 
-            file_path: Path = self._root_dir / relative_path
+    @staticmethod
+    def _check_paths(matches: List) -> None:
+        """Check that each file appears once in the ``matches`` to replace."""
+        paths = set()
+        for file_match in matches:
+            if file_match["path"] in paths:
+                raise ValueError(
+                    f"The file '{file_match['path']}' appears several times in the matches."
+                )
+            paths.add(file_match["path"])
 
-            grouped_line_matches = self.group_matches_by_line(line_matches)
+    def start_replace(
+        self, matches: List, path: str, create_checkpoint=True, user: str = ""
+    ) -> dict:
+        """Replace the ``matches`` within ``path`` in the background.
 
-            with file_path.open("rb") as fp:
-                data = fp.readlines()
-            for line_number, matches in grouped_line_matches.items():
-                original_line = data[line_number - 1]
-                replaced_line = b""
-                for i, match in enumerate(matches):
-                    start = 0 if i == 0 else matches[i - 1][1]
-                    end = match[0]
-                    replace = match[2]
-                    replaced_line += original_line[start:end] + replace
+        Args:
+            matches: The search matches to replace; see :meth:`replace`
+            path: The root folder in which to apply the replace
+            create_checkpoint: Whether to create a checkpoint before replacing matches
+            user: The user starting the replace; only they can use the job
+        Returns:
+            The job state ``{"id", "status", "total", "done", ...}``
+        Raises:
+            ValueError: if a file appears several times in ``matches``
+        """
+        self._check_paths(matches)
+        return self._jobs.start(
+            lambda report: self.replace(matches, path, create_checkpoint, report, user),
+            len(matches),
+            user,
+        )
 
-                start = matches[-1][1]
-                data[line_number - 1] = replaced_line + original_line[start:]
+    async def undo(self, operation: str, user: str = "") -> dict:
+        """Undo a replace operation by restoring the checkpoints of its files.
 
-            with file_path.open("wb") as fp:
-                fp.writelines(data)
+        Args:
+            operation: The operation id of the replace report
+            user: The user undoing the operation
+        Returns:
+            The report ``{"operation", "total", "restored", "errors"}``
+        Raises:
+            OperationNotFoundError: if the operation is unknown, too old, superseded
+                or belongs to another user
+            OperationConflictError: if a checkpoint of the operation was
+                overwritten since the replace, e.g. by a save of the user
+        """
+        try:
+            return await self._checkpoints.restore(operation, user)
+        finally:
+            if self._cache is not None:
+                self._cache.clear()
+            if self._refiner is not None:
+                self._refiner.forget()
@@ -0,0 +1,165 @@
+"""Access to the files content for the replace operations
+
+Two backends are available:
+
+- ``local`` rewrites the files directly on the local filesystem, streaming
+  them to a temporary file renamed over the original one.
+- ``contents`` reads and saves the files through the server contents manager,
+  for contents managers not storing the files on the local filesystem.
+"""
+
+import asyncio
+import base64
+import io
+from concurrent.futures import Executor
+from pathlib import Path
+from typing import Optional, Union
+
+from jupyter_server.services.contents.filemanager import FileManagerMixin
+from jupyter_server.services.contents.manager import (
+    AsyncContentsManager,
+    ContentsManager,
+)
+from jupyter_server.utils import ensure_async
+
+from .notebooks import CellEdits, edit_notebook
+from .replacer import LineEdits, rewrite, rewrite_file, write_file
+
+
+def is_local(contents_manager: Union[AsyncContentsManager, ContentsManager]) -> bool:
+    """Whether a contents manager stores the files in its local root directory.
+
+    Args:
+        contents_manager: The server contents manager
+    Returns:
+        ``False`` for the contents managers not derived from the file managers
+    """
+    return isinstance(contents_manager, FileManagerMixin) or not isinstance(
+        contents_manager, (AsyncContentsManager, ContentsManager)
+    )
+
+
+class FileBackend:
+    """Rewrite the content of files.
+
+    Args:
+        executor: The executor running the blocking operations
+    """
+
+    def __init__(self, executor: Optional[Executor] = None) -> None:
+        self._executor = executor
+
+    async def rewrite(self, path: str, line_edits: LineEdits) -> int:
+        """Apply edits to a file.
+
+        Args:
+            path: The file path relative to the server root directory
+            line_edits: The edits per line number; see :func:`.replacer.rewrite`
+        Returns:
+            The size in bytes of the edited file
+        Raises:
+            ValueError: if an edit is outside of the file content
+        """
+        raise NotImplementedError()
+
+    async def rewrite_notebook(self, path: str, cell_edits: CellEdits) -> int:
+        """Apply edits to the cells of a notebook.
+
+        Args:
+            path: The notebook path relative to the server root directory
+            cell_edits: The edits per cell; see :func:`.notebooks.edit_notebook`
+        Returns:
+            The size in bytes of the edited notebook
+        Raises:
+            ValueError: if an edit is outside of the cells sources
+        """
+        raise NotImplementedError()
+
+
+class LocalFileBackend(FileBackend):
+    """Rewrite the files on the local filesystem.
+
+    Args:
+        root_dir: The server root directory
+        executor: The executor running the blocking operations
+    """
+
+    def __init__(self, root_dir: Path, executor: Optional[Executor] = None) -> None:
+        super().__init__(executor)
+        self._root_dir = root_dir
+
+    async def rewrite(self, path: str, line_edits: LineEdits) -> int:
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, rewrite_file, self._root_dir / path, line_edits
+        )
+
+    async def rewrite_notebook(self, path: str, cell_edits: CellEdits) -> int:
+        def edit(file_path: Path) -> int:
+            content = edit_notebook(file_path.read_bytes(), cell_edits)
+            return write_file(file_path, content)
+
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, edit, self._root_dir / path
+        )
+
+
+class ContentsFileBackend(FileBackend):
+    """Rewrite the files through the server contents manager.
+
+    The file is loaded in memory; the edits are applied in the executor.
+
+    Args:
+        contents_manager: The server contents manager
+        executor: The executor running the blocking operations
+    """
+
+    def __init__(
+        self,
+        contents_manager: Union[AsyncContentsManager, ContentsManager],
+        executor: Optional[Executor] = None,
+    ) -> None:
+        super().__init__(executor)
+        self._contents_manager = contents_manager
+
+    async def rewrite(self, path: str, line_edits: LineEdits) -> int:
+        api_path = Path(path).as_posix()
+        model = await ensure_async(
+            self._contents_manager.get(api_path, content=True, type="file")
+        )
+        if model["format"] == "base64":
+            content = base64.b64decode(model["content"])
+        else:
+            content = model["content"].encode("utf-8")
+
+        destination = io.BytesIO()
+        size = await asyncio.get_running_loop().run_in_executor(
+            self._executor, rewrite, io.BytesIO(content), destination, line_edits
+        )
+        content = destination.getvalue()
+
+        if model["format"] == "base64":
+            saved = {"format": "base64", "content": base64.b64encode(content).decode()}
+        else:
+            saved = {"format": "text", "content": content.decode("utf-8")}
+        await ensure_async(
+            self._contents_manager.save({"type": "file", **saved}, api_path)
+        )
+        return size
+
+    async def rewrite_notebook(self, path: str, cell_edits: CellEdits) -> int:
+        api_path = Path(path).as_posix()
+        model = await ensure_async(
+            self._contents_manager.get(
+                api_path, content=True, type="file", format="text"
+            )
+        )
+        content = await asyncio.get_running_loop().run_in_executor(
+            self._executor, edit_notebook, model["content"].encode("utf-8"), cell_edits
+        )
+        await ensure_async(
+            self._contents_manager.save(
+                {"type": "file", "format": "text", "content": content.decode("utf-8")},
+                api_path,
+            )
+        )
+        return len(content)
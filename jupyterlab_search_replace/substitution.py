@@ -0,0 +1,108 @@
+"""Replacement strings of the matches computed on the server
+
+The replacement template of a regular expression search follows the
+JavaScript ``String.replace`` syntax used by the frontend: ``$1``..``$99``
+and ``$<name>`` insert a group, ``$&`` the whole match and ``$$`` a dollar
+sign. Like in the frontend, the template of a literal search is inserted as
+is, ``$&`` included.
+
+The groups are resolved with the Python :mod:`re` module; ripgrep does not
+report the replacement in its JSON output
+(see https://github.com/BurntSushi/ripgrep/issues/1872).
+"""
+
+import re
+from typing import Callable, Optional
+
+from .log import get_logger
+
+# Replacement of a match {"line", "match", "start_utf8", "end_utf8", ...};
+# ``None`` if it cannot be computed
+Replacement = Callable[[dict], Optional[str]]
+
+_JS_TOKEN = re.compile(r"\$(\$|&|<([^>]*)>|\d{1,2})|\\")
+
+
+def _convert_template(template: str, pattern: "re.Pattern") -> str:
+    """Convert a JavaScript replacement template into a Python one."""
+
+    def convert(token: "re.Match") -> str:
+        if token.group(0) == "\\":
+            return "\\\\"
+        value = token.group(1)
+        if value == "$":
+            return "$"
+        if value == "&":
+            return r"\g<0>"
+        name = token.group(2)
+        if name is not None:
+            if name in pattern.groupindex:
+                return rf"\g<{name}>"
+            return "" if pattern.groupindex else token.group(0).replace("\\", "\\\\")
+        # Like JavaScript, use the longest existing group number
+        for digits in (value, value[:1]):
+            if 0 < int(digits) <= pattern.groups:
+                return rf"\g<{int(digits)}>" + value[len(digits) :]
+        return token.group(0)
+
+    return _JS_TOKEN.sub(convert, template)
+
+
+def compile_replacement(
+    query: str, replace: Optional[str], case_sensitive: bool, use_regex: bool
+) -> Optional[Replacement]:
+    """Get the function computing the replacement string of a match.
+
+    Args:
+        query: The search term
+        replace: The replacement template
+        case_sensitive: Whether the search is case sensitive or not
+        use_regex: Whether the search term is a regular expression or not
+    Returns:
+        The replacement function or ``None`` if it cannot be computed on
+        the server; e.g. if ``query`` is not supported by :mod:`re`.
+    """
+    if replace is None:
+        return None
+    if not use_regex or re.search(r"\$([1-9]|<|&)", replace) is None:
+        # Like the frontend, the template is only interpreted for a regular
+        # expression and if it refers to the match
+        return lambda match: replace
+
+    try:
+        pattern = re.compile(query, 0 if case_sensitive else re.IGNORECASE)
+    except re.error as e:
+        get_logger().debug(f"Unable to compute the replacement of '{query}': {e!s}")
+        return None
+    template = _convert_template(replace, pattern)
+
+    def replacement(match: dict) -> Optional[str]:
+        if match["line"] is not None:
+            # Match within the line for the lookarounds to see the context
+            found = pattern.match(match["line"], match["start_utf8"])
+            if found is not None and found.end() == match["end_utf8"]:
+                return found.expand(template)
+        if match["match"] is None:
+            # The match is not valid UTF-8; it cannot be replaced
+            return None
+        return pattern.sub(template, match["match"], count=1)
+
+    return replacement
+
+
+def substitute(replacement: Replacement, file_matches: dict) -> dict:
+    """Get a copy of the matches of a file with their replacement string.
+
+    Args:
+        replacement: The replacement function
+        file_matches: The matches of a file ``{"path", "matches"}``
+    Returns:
+        The matches of the file with ``replace`` set
+    """
+    return {
+        "path": file_matches["path"],
+        "matches": [
+            {**match, "replace": replacement(match)}
+            for match in file_matches["matches"]
+        ],
+    }
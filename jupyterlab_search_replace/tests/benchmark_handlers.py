@@ -0,0 +1,106 @@
+"""End-to-end benchmarks of the search and replace requests on synthetic corpora
+
+They require `pytest-benchmark <https://pytest-benchmark.readthedocs.io>`_;
+see the README to run them and compare them with the baseline.
+"""
+
+import asyncio
+import json
+
+import pytest
+
+from .corpus import CORPORA, NEEDLE
+
+pytest.importorskip("pytest_benchmark")
+
+
+@pytest.fixture(scope="module", params=sorted(CORPORA))
+def corpus(request, tmp_path_factory):
+    root = tmp_path_factory.mktemp(request.param)
+    CORPORA[request.param](root)
+    return request.param, root
+
+
+@pytest.fixture
+def jp_root_dir(corpus):
+    # The server serves the corpus generated once per module
+    return corpus[1]
+
+
+def _run(coroutine):
+    return asyncio.get_event_loop().run_until_complete(coroutine)
+
+
+def test_search(benchmark, jp_fetch):
+    def search():
+        return _run(jp_fetch("search", params={"query": NEEDLE}, method="GET"))
+
+    response = benchmark.pedantic(search, rounds=5, warmup_rounds=1)
+
+    assert response.code == 200
+    assert json.loads(response.body)["matches"]
+
+
+def test_search_regex(benchmark, jp_fetch):
+    def search():
+        return _run(
+            jp_fetch(
+                "search",
+                params={"query": "n[e]+dle\\b", "use_regex": "true"},
+                method="GET",
+            )
+        )
+
+    response = benchmark.pedantic(search, rounds=5, warmup_rounds=1)
+
+    assert json.loads(response.body)["matches"]
+
+
+def test_search_stream(benchmark, jp_fetch):
+    def search():
+        return _run(
+            jp_fetch("search", params={"query": NEEDLE, "stream": "true"}, method="GET")
+        )
+
+    response = benchmark.pedantic(search, rounds=5, warmup_rounds=1)
+
+    assert response.body.count(b"\n") > 0
+
+
+@pytest.mark.parametrize(
+    "jp_server_config",
+    [
+        {
+            "ServerApp": {"jpserver_extensions": {"jupyterlab_search_replace": True}},
+            "SearchEngine": {"notebook_search": True},
+        }
+    ],
+)
+def test_search_notebook_cells(benchmark, corpus, jp_fetch):
+    if corpus[0] != "notebooks":
+        pytest.skip("Only relevant for notebooks.")
+
+    def search():
+        return _run(jp_fetch("search", params={"query": NEEDLE}, method="GET"))
+
+    response = benchmark.pedantic(search, rounds=5, warmup_rounds=1)
+
+    assert "cell" in json.loads(response.body)["matches"][0]["matches"][0]
+
+
+def test_replace(benchmark, jp_fetch):
+    # Replacing the needle by itself rewrites the files without changing the corpus
+    def replace():
+        return _run(
+            jp_fetch(
+                "search",
+                params={"query": NEEDLE, "replace": NEEDLE},
+                body=b"",
+                method="POST",
+            )
+        )
+
+    response = benchmark.pedantic(replace, rounds=3)
+
+    assert response.code == 201
+    assert json.loads(response.body)["replaced"] > 0
@@ -0,0 +1,219 @@
+"""Benchmarks of the stages of a search and a replace
+
+They require `pytest-benchmark <https://pytest-benchmark.readthedocs.io>`_;
+see the README to run them and compare them with the baseline.
+"""
+
+import asyncio
+import io
+import shutil
+import subprocess
+
+import pytest
+
+from ..codec import decode_ripgrep, dumps
+from ..notebooks import edit_notebook, get_cells_text, search_cells
+from ..pysearch import compile_query, search_text
+from ..replacer import rewrite
+from ..search_engine import SearchEngine, _FileMatchesBuilder, get_utf8_positions
+from ..substitution import compile_replacement, substitute
+from .corpus import (
+    NEEDLE,
+    dense_matches,
+    long_unicode_lines,
+    many_small_files,
+    notebooks,
+)
+
+pytest.importorskip("pytest_benchmark")
+
+
+@pytest.fixture(scope="module")
+def dense_root(tmp_path_factory):
+    root = tmp_path_factory.mktemp("dense")
+    dense_matches(root, files=20)
+    return root
+
+
+@pytest.fixture(scope="module")
+def ripgrep_output(dense_root):
+    if shutil.which("rg") is None:
+        pytest.skip("ripgrep is not installed.")
+    output = subprocess.run(
+        ["rg", "--json", "--", NEEDLE],
+        cwd=dense_root,
+        stdin=subprocess.DEVNULL,
+        capture_output=True,
+        check=True,
+    ).stdout
+    return output.splitlines()
+
+
+@pytest.fixture(scope="module")
+def file_matches(ripgrep_output):
+    builder = _FileMatchesBuilder()
+    matches = []
+    for line in ripgrep_output:
+        result = builder.feed(decode_ripgrep(line))
+        if result is not None:
+            matches.append(result)
+    return matches
+
+
+@pytest.fixture(scope="module")
+def unicode_line(tmp_path_factory):
+    root = tmp_path_factory.mktemp("unicode")
+    long_unicode_lines(root, files=1)
+    line = (root / "unicode_0.txt").read_text(encoding="utf-8").splitlines()[0]
+    bline = line.encode("utf-8")
+    positions = []
+    start = bline.find(NEEDLE.encode())
+    while start >= 0:
+        positions.extend((start, start + len(NEEDLE)))
+        start = bline.find(NEEDLE.encode(), start + 1)
+    return line, positions
+
+
+def _get_utf8_positions_per_match(string, positions):
+    # Reference implementation decoding the line prefix for each position
+    bstring = string.encode("utf-8")
+    return [len(bstring[:position].decode("utf-8")) for position in positions]
+
+
+@pytest.mark.benchmark(group="utf8_positions")
+def test_get_utf8_positions(benchmark, unicode_line):
+    line, positions = unicode_line
+
+    result = benchmark(get_utf8_positions, line, positions)
+
+    assert result == _get_utf8_positions_per_match(line, positions)
+
+
+@pytest.mark.benchmark(group="utf8_positions")
+def test_get_utf8_positions_per_match(benchmark, unicode_line):
+    line, positions = unicode_line
+
+    # ripgrep reports the positions per match, not per line
+    result = benchmark(
+        lambda: [
+            _get_utf8_positions_per_match(line, positions[i : i + 2])
+            for i in range(0, len(positions), 2)
+        ]
+    )
+
+    assert len(result) == len(positions) // 2
+
+
+def test_decode_ripgrep(benchmark, ripgrep_output):
+    entries = benchmark(lambda: [decode_ripgrep(line) for line in ripgrep_output])
+
+    assert len(entries) == len(ripgrep_output)
+
+
+def test_build_file_matches(benchmark, ripgrep_output):
+    entries = [decode_ripgrep(line) for line in ripgrep_output]
+
+    def build():
+        builder = _FileMatchesBuilder()
+        return [m for m in map(builder.feed, entries) if m is not None]
+
+    assert len(benchmark(build)) == 20
+
+
+def test_dumps_matches(benchmark, file_matches):
+    body = benchmark(dumps, {"matches": file_matches})
+
+    assert body.startswith(b'{"matches":')
+
+
+def test_substitute(benchmark, file_matches):
+    replacement = compile_replacement(f"({NEEDLE})", "[$1]", False, True)
+
+    result = benchmark(lambda: [substitute(replacement, m) for m in file_matches])
+
+    assert result[0]["matches"][0]["replace"] == f"[{NEEDLE}]"
+
+
+def test_search_text(benchmark, dense_root):
+    text = (dense_root / "dense_0.txt").read_text(encoding="utf-8")
+    pattern = compile_query(NEEDLE, False, False, False)
+
+    assert benchmark(search_text, text, pattern)
+
+
+def test_rewrite(benchmark, dense_root):
+    content = (dense_root / "dense_0.txt").read_bytes()
+    line_edits = {}
+    for line_number, line in enumerate(content.split(b"\n"), start=1):
+        start = line.find(NEEDLE.encode())
+        while start >= 0:
+            line_edits.setdefault(line_number, []).append(
+                (start, start + len(NEEDLE), b"pin")
+            )
+            start = line.find(NEEDLE.encode(), start + 1)
+
+    def run():
+        destination = io.BytesIO()
+        rewrite(io.BytesIO(content), destination, line_edits)
+        return destination.getvalue()
+
+    assert NEEDLE.encode() not in benchmark(run)
+
+
+def test_search_notebook_cells(benchmark, tmp_path):
+    notebooks(tmp_path, files=1)
+    content = (tmp_path / "notebook_0.ipynb").read_bytes()
+    pattern = compile_query(NEEDLE, False, False, False)
+
+    def run():
+        return list(search_cells(get_cells_text(content, True), pattern))
+
+    assert benchmark(run)
+
+
+def test_edit_notebook(benchmark, tmp_path):
+    notebooks(tmp_path, files=1)
+    content = (tmp_path / "notebook_0.ipynb").read_bytes()
+
+    edited = benchmark(edit_notebook, content, {0: {1: [(0, 0, b"# ")]}})
+
+    assert edited != content
+
+
+def _engine_search(benchmark, contents_manager, backend, query, **options):
+    if backend == "ripgrep" and shutil.which("rg") is None:
+        pytest.skip("ripgrep is not installed.")
+    engine = SearchEngine(contents_manager, search_backend=backend)
+    loop = asyncio.new_event_loop()
+    try:
+        # Start the Python worker processes before measuring
+        loop.run_until_complete(engine.search(query, **options))
+
+        return benchmark(
+            lambda: loop.run_until_complete(engine.search(query, **options))
+        )
+    finally:
+        loop.run_until_complete(engine.stop())
+        loop.close()
+
+
+@pytest.mark.benchmark(group="engine_search")
+@pytest.mark.parametrize("backend", ["ripgrep", "python"])
+def test_engine_search(benchmark, contents_manager, backend):
+    many_small_files(contents_manager.root_dir, files=500)
+
+    result = _engine_search(benchmark, contents_manager, backend, NEEDLE)
+
+    assert result["matches"]
+
+
+@pytest.mark.benchmark(group="engine_search_regex")
+@pytest.mark.parametrize("backend", ["ripgrep", "python"])
+def test_engine_search_regex(benchmark, contents_manager, backend):
+    many_small_files(contents_manager.root_dir, files=500)
+
+    result = _engine_search(
+        benchmark, contents_manager, backend, r"\bn[e]+dle \w+", use_regex=True
+    )
+
+    assert result["matches"]
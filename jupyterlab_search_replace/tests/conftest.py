@@ -8,6 +8,18 @@ SCHEMA_FILE = Path(__file__).parent / "schema.json"
 TEST_PATH = "test_lab_search_replace"
 
 
+class _ContentsManager:
+    """Contents manager of a search engine run outside of the server."""
+
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+
+
+@pytest.fixture
+def contents_manager(jp_root_dir):
+    return _ContentsManager(jp_root_dir)
+
+
 @pytest.fixture
 def schema():
     return json.load(open(SCHEMA_FILE, "r"))
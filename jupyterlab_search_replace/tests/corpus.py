@@ -0,0 +1,107 @@
+"""Synthetic corpora for the benchmarks
+
+The corpora are generated with a fixed seed so that the benchmarks of two
+revisions search the same content. Each corpus contains the word ``needle``.
+"""
+
+import json
+import random
+from pathlib import Path
+from typing import Callable, Dict
+
+# Word searched in all corpora
+NEEDLE = "needle"
+
+_WORDS = ["alpha", "beta", "gamma", "delta", "λambda", "strange", "value", "ü"]
+
+
+def _text(rng: random.Random, lines: int, words: int, density: float) -> str:
+    return "\n".join(
+        " ".join(
+            NEEDLE if rng.random() < density else rng.choice(_WORDS)
+            for _ in range(words)
+        )
+        for _ in range(lines)
+    )
+
+
+def many_small_files(root: Path, files: int = 2000, lines: int = 20) -> None:
+    """Many small files spread over nested folders, with a few matches."""
+    rng = random.Random(1)
+    for index in range(files):
+        file_path = root / f"folder_{index % 20}" / f"sub_{index % 7}" / f"f{index}.txt"
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.write_text(_text(rng, lines, 10, 0.005), encoding="utf-8")
+
+
+def few_huge_files(root: Path, files: int = 2, size: int = 16 * 1024 * 1024) -> None:
+    """A few huge files with rare matches."""
+    rng = random.Random(2)
+    # Repeat a block to generate the files quickly
+    block = _text(rng, 2000, 10, 0.0001) + "\n"
+    for index in range(files):
+        with open(root / f"huge_{index}.txt", "w", encoding="utf-8") as f:
+            written = 0
+            while written < size:
+                written += f.write(block)
+
+
+def long_unicode_lines(root: Path, files: int = 10, line_length: int = 5000) -> None:
+    """Files with long lines of multi-byte characters and many matches per line."""
+    rng = random.Random(3)
+    for index in range(files):
+        lines = []
+        for _ in range(20):
+            chars = [rng.choice("λüé漢字 ") for _ in range(line_length)]
+            for position in range(0, line_length, 500):
+                chars[position] = f" {NEEDLE} "
+            lines.append("".join(chars))
+        (root / f"unicode_{index}.txt").write_text("\n".join(lines), encoding="utf-8")
+
+
+def dense_matches(root: Path, files: int = 100, lines: int = 200) -> None:
+    """Files with matches on almost every line."""
+    rng = random.Random(4)
+    for index in range(files):
+        (root / f"dense_{index}.txt").write_text(
+            _text(rng, lines, 12, 0.3), encoding="utf-8"
+        )
+
+
+def notebooks(root: Path, files: int = 100, cells: int = 30) -> None:
+    """Notebooks with code cells having outputs."""
+    rng = random.Random(5)
+    for index in range(files):
+        notebook = {
+            "cells": [
+                {
+                    "cell_type": "code",
+                    "execution_count": cell,
+                    "metadata": {},
+                    "outputs": [
+                        {
+                            "name": "stdout",
+                            "output_type": "stream",
+                            "text": _text(rng, 5, 8, 0.05).splitlines(keepends=True),
+                        }
+                    ],
+                    "source": _text(rng, 10, 8, 0.02).splitlines(keepends=True),
+                }
+                for cell in range(cells)
+            ],
+            "metadata": {},
+            "nbformat": 4,
+            "nbformat_minor": 5,
+        }
+        (root / f"notebook_{index}.ipynb").write_text(
+            json.dumps(notebook, indent=1, ensure_ascii=False) + "\n", encoding="utf-8"
+        )
+
+
+CORPORA: Dict[str, Callable[[Path], None]] = {
+    "many_small_files": many_small_files,
+    "few_huge_files": few_huge_files,
+    "long_unicode_lines": long_unicode_lines,
+    "dense_matches": dense_matches,
+    "notebooks": notebooks,
+}
@@ -0,0 +1,135 @@
+import subprocess
+
+import pytest
+
+from ..backends import SearchError, construct_git_command
+from ..search_engine import SearchEngine
+
+
+def sort(matches):
+    return sorted(matches, key=lambda x: x["path"])
+
+
+def test_construct_git_command():
+    command = construct_git_command(
+        "-a", False, True, ["*.py", "src/*.txt"], ["build"], False
+    )
+
+    assert command[command.index("-e") :] == [
+        "-e",
+        "-a",
+        "--",
+        ":(glob)**/*.py",
+        ":(glob)src/*.txt",
+        ":(exclude,glob)**/build",
+        ":(exclude,glob)**/build/**",
+        ":(exclude,glob)**/.*",
+        ":(exclude,glob)**/.*/**",
+    ]
+    assert "--fixed-strings" in command
+    assert "--ignore-case" in command
+    assert "--word-regexp" in command
+
+
+def test_construct_git_command_files():
+    command = construct_git_command("a.b", True, False, [], [], True, True, ["x.py"])
+
+    assert command[-4:] == ["-e", "a.b", "--", ":(literal)x.py"]
+    assert "--perl-regexp" in command
+    assert "--untracked" in command
+    assert "--ignore-case" not in command
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "options",
+    [
+        {"query": "strange"},
+        {"query": "str.*", "use_regex": True},
+        {"query": "strange", "exclude": ["text_1.txt"]},
+        {"query": "λ", "path": "test_lab_search_replace/subfolder"},
+    ],
+)
+async def test_search_git_backend(test_content, jp_root_dir, options, contents_manager):
+    subprocess.run(["git", "init", "-q"], cwd=jp_root_dir, check=True)
+    subprocess.run(["git", "add", "."], cwd=jp_root_dir, check=True)
+    (test_content / "untracked.txt").write_text("strange λ")
+    engine = SearchEngine(contents_manager)
+
+    expected = await engine.search(**options)
+    payload = await engine.search(**options, backend="git")
+
+    assert sort(payload["matches"]) == sort(
+        [m for m in expected["matches"] if not m["path"].endswith("untracked.txt")]
+    )
+
+
+@pytest.mark.asyncio
+async def test_search_git_backend_file_name_with_new_line(
+    test_content, jp_root_dir, contents_manager
+):
+    (test_content / "new\nline.txt").write_text("strange")
+    subprocess.run(["git", "init", "-q"], cwd=jp_root_dir, check=True)
+    subprocess.run(["git", "add", "."], cwd=jp_root_dir, check=True)
+    engine = SearchEngine(contents_manager)
+
+    payload = await engine.search("strange", backend="git")
+
+    assert "test_lab_search_replace/new\nline.txt" in {
+        m["path"] for m in payload["matches"]
+    }
+    assert engine._backends["git"]._executor is not None
+    await engine.stop()
+    assert engine._backends["git"]._executor is None
+
+
+@pytest.mark.asyncio
+async def test_search_git_backend_outside_work_tree(test_content, contents_manager):
+    engine = SearchEngine(
+        contents_manager,
+        search_backend="auto",
+        backend_order=["git", "ripgrep"],
+    )
+
+    # The auto backend falls back to the next one
+    assert (await engine.search("strange"))["matches"] != []
+    payload = await engine.search("strange", backend="git")
+    assert payload["code"] == 2
+    assert "git" in payload["message"]
+
+
+@pytest.mark.asyncio
+async def test_search_index_backend(test_content, contents_manager, tmp_path):
+    engine = SearchEngine(
+        contents_manager,
+        use_index=True,
+        index_path=str(tmp_path / "index.db"),
+    )
+    backend = engine._backends["index"]
+    searched = []
+    search = backend.search
+
+    def spy(query):
+        searched.append(query.files)
+        return search(query)
+
+    backend.search = spy
+
+    payload = await engine.search("λ strange")
+    expected = await engine.search("λ strange", backend="ripgrep")
+
+    assert len(searched) == 1
+    assert "test_lab_search_replace/subfolder/text_sub.txt" in searched[0]
+    assert sort(payload["matches"]) == sort(expected["matches"])
+
+
+@pytest.mark.asyncio
+async def test_search_unknown_backend(test_content, contents_manager):
+    engine = SearchEngine(contents_manager)
+
+    payload = await engine.search("strange", backend="grep")
+
+    assert payload["code"] == 2
+    assert payload["message"] == "Unknown search backend 'grep'."
+    with pytest.raises(SearchError):
+        [m async for m in engine.search_stream("strange", backend="index")]
@@ -0,0 +1,207 @@
+import asyncio
+import os
+
+import pytest
+
+from ..cache import ChangeTracker, QueryRefiner, SearchCache, get_tree_signature
+from ..watcher import FileWatcher
+
+
+class _RealtimeWatcher(FileWatcher):
+    realtime = True
+
+
+def _touch(path, content):
+    path.write_text(content)
+    # Ensure the modification time changes whatever the file system resolution
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_get_tree_signature(tmp_path):
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "a.txt").write_text("hello")
+    signature = get_tree_signature(tmp_path)
+
+    assert get_tree_signature(tmp_path) == signature
+
+    # Hidden files are ignored
+    (tmp_path / ".hidden.txt").write_text("hello")
+    assert get_tree_signature(tmp_path) == signature
+
+    _touch(tmp_path / "sub" / "a.txt", "world")
+    assert get_tree_signature(tmp_path) != signature
+
+
+@pytest.mark.asyncio
+async def test_tracker_with_signature(tmp_path):
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "a.txt").write_text("hello")
+    (tmp_path / "sub" / "b.txt").write_text("hello")
+    tracker = ChangeTracker(tmp_path)
+    token = await tracker.token("sub")
+
+    assert tracker.unchanged("sub", token, await tracker.token("sub"))
+
+    # Changes outside the folder are ignored
+    _touch(tmp_path / "a.txt", "world")
+    assert tracker.unchanged("sub", token, await tracker.token("sub"))
+
+    _touch(tmp_path / "sub" / "b.txt", "world")
+    assert not tracker.unchanged("sub", token, await tracker.token("sub"))
+
+
+@pytest.mark.asyncio
+async def test_tracker_with_watcher(tmp_path):
+    watcher = _RealtimeWatcher(tmp_path, "polling")
+    # Don't notify the subscribers
+    watcher._flush_scheduled = True
+    tracker = ChangeTracker(tmp_path, watcher)
+    token = await tracker.token("sub")
+    assert token == watcher.version
+
+    watcher.record({"other/a.txt"})
+    current = await tracker.token("sub")
+    assert tracker.unchanged("sub", token, current)
+    assert not tracker.unchanged(".", token, current)
+
+    watcher.record({"sub/b.txt"})
+    assert not tracker.unchanged("sub", token, await tracker.token("sub"))
+
+
+@pytest.mark.asyncio
+async def test_tracker_with_watcher_directory(tmp_path):
+    watcher = _RealtimeWatcher(tmp_path, "polling")
+    # Don't notify the subscribers
+    watcher._flush_scheduled = True
+    tracker = ChangeTracker(tmp_path, watcher)
+    token = await tracker.token("sub/deep")
+
+    # A journaled directory changes all the folders within it
+    watcher.record({"sub"})
+    current = await tracker.token("sub/deep")
+    assert not tracker.unchanged("sub/deep", token, current)
+    assert not tracker.unchanged(".", token, current)
+    assert tracker.unchanged("subfolder", token, current)
+
+
+@pytest.mark.asyncio
+async def test_cache_invalidation(tmp_path):
+    (tmp_path / "a.txt").write_text("hello")
+    tracker = ChangeTracker(tmp_path)
+    cache = SearchCache(1024, tracker)
+    matches = [{"path": "a.txt", "matches": []}]
+
+    token = await tracker.token(".")
+    assert cache.lookup("key", ".", token) is None
+    cache.store("key", ".", token, matches)
+    assert cache.lookup("key", ".", token) == matches
+
+    _touch(tmp_path / "a.txt", "world")
+    assert cache.lookup("key", ".", await tracker.token(".")) is None
+    assert cache.size == 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("operation", ("move", "delete"))
+async def test_cache_invalidation_directory(tmp_path, operation):
+    pytest.importorskip("watchdog")
+    root = tmp_path / "root"
+    (root / "sub").mkdir(parents=True)
+    (root / "sub" / "a.txt").write_text("hello")
+    watcher = FileWatcher(root, "inotify", debounce=0.05)
+    watcher.start()
+    try:
+        tracker = ChangeTracker(root, watcher)
+        cache = SearchCache(1024, tracker)
+        matches = [{"path": "sub/a.txt", "matches": []}]
+        for path in (".", "sub"):
+            cache.store(path, path, await tracker.token(path), matches)
+
+        if operation == "move":
+            (root / "sub").rename(tmp_path / "elsewhere")
+        else:
+            (root / "sub" / "a.txt").unlink()
+            (root / "sub").rmdir()
+        for _ in range(100):
+            if "sub" in watcher.changes_since(0):
+                break
+            await asyncio.sleep(0.05)
+
+        for path in (".", "sub"):
+            assert cache.lookup(path, path, await tracker.token(path)) is None
+    finally:
+        watcher.stop()
+
+
+def test_cache_lru_eviction(tmp_path):
+    matches = [{"path": "a.txt", "matches": []}]
+    # Budget for two entries
+    cache = SearchCache(
+        2 * len('[{"path": "a.txt", "matches": []}]'), ChangeTracker(tmp_path)
+    )
+
+    for key in ("a", "b"):
+        cache.store(key, ".", "token", matches)
+    # Use "a" so that "b" is the least recently used
+    assert cache.lookup("a", ".", "token") == matches
+
+    cache.store("c", ".", "token", matches)
+
+    assert cache.lookup("b", ".", "token") is None
+    assert cache.lookup("a", ".", "token") == matches
+    assert cache.lookup("c", ".", "token") == matches
+
+    # Results bigger than the budget are not cached
+    cache.store("d", ".", "token", matches * 3)
+    assert cache.lookup("d", ".", "token") is None
+    assert cache.lookup("a", ".", "token") == matches
+
+
+def test_refiner(tmp_path):
+    refiner = QueryRefiner(ChangeTracker(tmp_path), max_sessions=2)
+    refiner.record("s1", "key", ".", "fo", "token", ["a.txt", "b.txt"])
+
+    assert refiner.candidates("s1", "key", ".", "foo", "token") == ["a.txt", "b.txt"]
+    assert refiner.candidates("s1", "key", ".", "fo", "token") == ["a.txt", "b.txt"]
+    assert refiner.candidates("s1", "key", ".", "bar", "token") is None
+    assert refiner.candidates("s1", "other", ".", "foo", "token") is None
+    assert refiner.candidates("s2", "key", ".", "foo", "token") is None
+    # Files changed since the previous search
+    assert refiner.candidates("s1", "key", ".", "foo", "changed") is None
+
+    refiner.record("s2", "key", ".", "fo", "token", [])
+    refiner.record("s3", "key", ".", "fo", "token", [])
+    # The least recent session is forgotten
+    assert refiner.candidates("s1", "key", ".", "foo", "token") is None
+    assert refiner.candidates("s3", "key", ".", "foo", "token") == []
+
+
+@pytest.mark.asyncio
+async def test_tracker_with_polling_watcher(tmp_path, monkeypatch):
+    (tmp_path / "a.txt").write_text("hello")
+    watcher = FileWatcher(tmp_path, "polling", poll_interval=0.05, debounce=0.05)
+    tracker = ChangeTracker(tmp_path, watcher)
+    watcher.start()
+    try:
+        for _ in range(100):
+            if watcher.journaling:
+                break
+            await asyncio.sleep(0.05)
+
+        # The folder is not walked at each lookup
+        def walk(folder):
+            raise AssertionError("The folder must not be walked.")
+
+        monkeypatch.setattr("jupyterlab_search_replace.cache.get_tree_signature", walk)
+        token = await tracker.token(".")
+        assert tracker.unchanged(".", token, await tracker.token("."))
+
+        _touch(tmp_path / "a.txt", "world")
+        for _ in range(100):
+            if watcher.version != token:
+                break
+            await asyncio.sleep(0.05)
+        assert not tracker.unchanged(".", token, await tracker.token("."))
+    finally:
+        watcher.stop()
@@ -0,0 +1,146 @@
+import asyncio
+
+import pytest
+
+from ..checkpoints import (
+    CheckpointHistory,
+    OperationConflictError,
+    OperationNotFoundError,
+)
+
+
+class _ContentsManager:
+    """Fake contents manager recording the concurrent checkpoint requests."""
+
+    def __init__(self, failing=()):
+        self.failing = failing
+        self.running = 0
+        self.max_running = 0
+        self.restored = []
+        self.checkpoints = {}
+        self.saves = 0
+
+    async def create_checkpoint(self, path):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+        if path in self.failing:
+            raise OSError(f"Unable to create checkpoint for {path}")
+        self.saves += 1
+        self.checkpoints[path] = {"id": f"cp-{path}", "last_modified": self.saves}
+        return self.checkpoints[path]
+
+    async def list_checkpoints(self, path):
+        return [self.checkpoints[path]] if path in self.checkpoints else []
+
+    async def restore_checkpoint(self, checkpoint_id, path):
+        if path in self.failing:
+            raise OSError(f"Unable to restore {path}")
+        self.restored.append((checkpoint_id, path))
+
+
+@pytest.mark.asyncio
+async def test_create_checkpoints_bounded():
+    manager = _ContentsManager(failing=("3.txt",))
+    history = CheckpointHistory(manager, concurrency=3)
+    paths = [f"{i}.txt" for i in range(10)]
+
+    checkpoints, errors = await history.create(paths)
+
+    assert manager.max_running == 3
+    assert sorted(checkpoints) == sorted(set(paths) - {"3.txt"})
+    assert checkpoints["0.txt"]["id"] == "cp-0.txt"
+    assert list(errors) == ["3.txt"]
+
+
+@pytest.mark.asyncio
+async def test_create_checkpoints_cancelled():
+    manager = _ContentsManager()
+    history = CheckpointHistory(manager, concurrency=1)
+
+    checkpoints, errors = await history.create(["a.txt", "b.txt"], lambda: True)
+
+    assert checkpoints == {}
+    assert errors == {}
+
+
+@pytest.mark.asyncio
+async def test_restore_operation():
+    manager = _ContentsManager()
+    history = CheckpointHistory(manager)
+    operation = history.record((await history.create(["a.txt", "b.txt"]))[0])
+    manager.failing = ("b.txt",)
+
+    report = await history.restore(operation)
+
+    assert manager.restored == [("cp-a.txt", "a.txt")]
+    assert report["total"] == 2
+    assert report["restored"] == 1
+    assert [e["path"] for e in report["errors"]] == ["b.txt"]
+    with pytest.raises(OperationNotFoundError):
+        await history.restore(operation)
+
+
+@pytest.mark.asyncio
+async def test_restore_operation_of_another_user():
+    manager = _ContentsManager()
+    history = CheckpointHistory(manager)
+    operation = history.record((await history.create(["a.txt"]))[0], "alice")
+
+    with pytest.raises(OperationNotFoundError):
+        await history.restore(operation, "bob")
+
+    assert manager.restored == []
+    assert (await history.restore(operation, "alice"))["restored"] == 1
+
+
+@pytest.mark.asyncio
+async def test_restore_overwritten_checkpoint():
+    manager = _ContentsManager()
+    history = CheckpointHistory(manager)
+    operation = history.record((await history.create(["a.txt", "b.txt"]))[0])
+    # The user saves b.txt with a checkpoint after the replace
+    await manager.create_checkpoint("b.txt")
+
+    with pytest.raises(OperationConflictError) as e:
+        await history.restore(operation)
+
+    assert e.value.paths == ["b.txt"]
+    assert manager.restored == []
+    with pytest.raises(OperationNotFoundError):
+        await history.restore(operation)
+
+
+@pytest.mark.asyncio
+async def test_history_size():
+    history = CheckpointHistory(_ContentsManager(), max_operations=2)
+    operations = [
+        history.record((await history.create([f"{i}.txt"]))[0]) for i in range(3)
+    ]
+
+    assert len(history) == 2
+    with pytest.raises(OperationNotFoundError):
+        await history.restore(operations[0])
+    await history.restore(operations[2])
+
+
+@pytest.mark.asyncio
+async def test_newer_operation_supersedes():
+    history = CheckpointHistory(_ContentsManager(failing=("c.txt",)))
+    first = history.record((await history.create(["a.txt", "b.txt"]))[0])
+    other = history.record((await history.create(["d.txt"]))[0])
+    failed = history.record({"c.txt": {"id": "cp-c.txt", "last_modified": 0}})
+
+    # The checkpoint of the first operation for a.txt is overwritten
+    second = history.record((await history.create(["a.txt"]))[0])
+    # A failed checkpoint may have been overwritten too
+    await history.create(["c.txt"])
+
+    assert len(history) == 2
+    with pytest.raises(OperationNotFoundError):
+        await history.restore(first)
+    with pytest.raises(OperationNotFoundError):
+        await history.restore(failed)
+    assert (await history.restore(second))["restored"] == 1
+    assert (await history.restore(other))["restored"] == 1
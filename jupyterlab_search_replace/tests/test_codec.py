@@ -0,0 +1,65 @@
+import pytest
+
+from .. import codec
+from ..codec import (
+    RipgrepBegin,
+    RipgrepEnd,
+    RipgrepMatch,
+    RipgrepSummary,
+    decode_ripgrep,
+    dumps,
+    loads,
+)
+
+RIPGREP_OUTPUT = [
+    b'{"type":"begin","data":{"path":{"text":"a.txt"}}}',
+    b'{"type":"context","data":{"path":{"text":"a.txt"},"lines":{"text":"bye\\n"},"line_number":2,"absolute_offset":13,"submatches":[]}}',
+    '{"type":"match","data":{"path":{"text":"a.txt"},"lines":{"text":"héllo héllo\\n"},"line_number":3,"absolute_offset":17,"submatches":[{"match":{"text":"héllo"},"start":0,"end":6},{"match":{"text":"héllo"},"start":7,"end":13}]}}'.encode(
+        "utf-8"
+    ),
+    b'{"type":"match","data":{"path":{"text":"a.txt"},"lines":{"bytes":"/w=="},"line_number":4,"absolute_offset":32,"submatches":[{"match":{"bytes":"/w=="},"start":0,"end":1}]}}',
+    b'{"type":"end","data":{"path":{"text":"a.txt"},"binary_offset":null,"stats":{"searches":1}}}',
+    b'{"data":{"elapsed_total":{"human":"0.000579s","nanos":578570,"secs":0},"stats":{"matches":1}},"type":"summary"}',
+    b'{"data":{"elapsed_total":{"human":"0.0004s","nanos":402779,"secs":0},"stats":{"bytes_printed":233,"bytes_searched":6,"matched_lines":1,"matches":1,"searches":2,"searches_with_match":1}},"type":"summary"}',
+]
+
+EXPECTED = [
+    RipgrepBegin("a.txt"),
+    None,
+    RipgrepMatch("héllo héllo\n", 3, 17, [("héllo", 0, 6), ("héllo", 7, 13)]),
+    RipgrepMatch(None, 4, 32, [(None, 0, 1)]),
+    RipgrepEnd(),
+    RipgrepSummary(),
+    RipgrepSummary(2, 1, 6),
+]
+
+
+@pytest.mark.parametrize("decoder", ("struct", "dict"))
+def test_decode_ripgrep(decoder):
+    if decoder == "struct":
+        pytest.importorskip("msgspec")
+        decode = codec._decode_ripgrep_struct
+    else:
+        decode = codec._decode_ripgrep_dict
+
+    assert [decode(line) for line in RIPGREP_OUTPUT] == EXPECTED
+    assert [decode(line.decode("utf-8")) for line in RIPGREP_OUTPUT] == EXPECTED
+
+
+def test_decode_ripgrep_default():
+    assert [decode_ripgrep(line) for line in RIPGREP_OUTPUT] == EXPECTED
+
+
+@pytest.mark.parametrize("use_orjson", (True, False))
+def test_dumps_loads(monkeypatch, use_orjson):
+    if use_orjson:
+        pytest.importorskip("orjson")
+    else:
+        monkeypatch.setattr(codec, "orjson", None)
+    obj = {"path": "λ.txt", "matches": [{"start": 0, "replace": None}]}
+
+    encoded = dumps(obj)
+
+    assert isinstance(encoded, bytes)
+    assert loads(encoded) == obj
+    assert loads(encoded.decode("utf-8")) == obj
@@ -1,11 +1,37 @@
 import asyncio
 import json
+import os
 from pathlib import Path
 
 import pytest
+import tornado
 from jsonschema import validate
+from traitlets.config import Config
 
-from ..search_engine import SearchEngine
+from ..replacer import ReplaceReport
+from ..search_engine import SearchEngine, SearchStats
+
+
+def _login_cookie(response):
+    """Get the cookie identifying the user of the next requests."""
+    cookies = response.headers.get_list("Set-Cookie")
+    return {"Cookie": "; ".join(c.split(";", 1)[0] for c in cookies)}
+
+
+async def test_extension_stops_engine(test_content, jp_serverapp):
+    [app] = jp_serverapp.extension_manager.extension_apps["jupyterlab_search_replace"]
+    pool = app.engine._backends["python"]._get_pool()
+    page = await app.engine.search_paginated("strange", page_size=1)
+    assert page["cursor"] is not None
+
+    await jp_serverapp.cleanup_extensions()
+
+    # The paused search is stopped
+    assert app.engine.pager._searches == {}
+    assert app.engine._replace_executor._shutdown
+    assert app.engine._backends["python"]._pool is None
+    with pytest.raises(RuntimeError):
+        pool.submit(print)
 
 
 async def test_search_get(test_content, schema, jp_fetch):
@@ -484,13 +510,327 @@ async def test_search_regex(test_content, schema, jp_fetch):
     ]
 
 
+async def test_search_stream(test_content, schema, jp_fetch):
+    response = await jp_fetch(
+        "search", params={"query": "strange", "stream": "true"}, method="GET"
+    )
+    assert response.code == 200
+    assert response.headers["Content-Type"] == "application/x-ndjson"
+    streamed = [json.loads(line) for line in response.body.decode().splitlines()]
+
+    response = await jp_fetch("search", params={"query": "strange"}, method="GET")
+    payload = json.loads(response.body)
+    validate(instance={"matches": streamed}, schema=schema)
+    assert sorted(streamed, key=lambda x: x["path"]) == sorted(
+        payload["matches"], key=lambda x: x["path"]
+    )
+
+
+async def test_search_stream_no_match(test_content, jp_fetch):
+    response = await jp_fetch(
+        "search", params={"query": "hello", "stream": "true"}, method="GET"
+    )
+    assert response.code == 200
+    assert response.body == b""
+
+
+async def test_search_stream_error(test_content, jp_fetch):
+    response = await jp_fetch(
+        "search",
+        params={"query": "str(", "use_regex": "true", "stream": "true"},
+        method="GET",
+    )
+    assert response.code == 200
+    lines = response.body.decode().splitlines()
+    assert len(lines) == 1
+    error = json.loads(lines[0])
+    assert error["code"] == 2
+    assert "regex parse error" in error["message"]
+
+
+@pytest.mark.parametrize(
+    "jp_server_config",
+    (
+        {
+            "ServerApp": {"jpserver_extensions": {"jupyterlab_search_replace": True}},
+            "SearchEngine": {"max_matches": 4},
+        },
+    ),
+)
+async def test_search_truncated(test_content, schema, jp_fetch):
+    response = await jp_fetch("search", params={"query": "strange"}, method="GET")
+    assert response.code == 200
+    payload = json.loads(response.body)
+    validate(instance=payload, schema=schema)
+    assert payload["truncated"]
+    assert payload["stats"]["limit"] == "max_matches"
+    assert sum(len(f["matches"]) for f in payload["matches"]) == 4
+
+    response = await jp_fetch(
+        "search", params={"query": "strange", "stream": "true"}, method="GET"
+    )
+    lines = [json.loads(line) for line in response.body.decode().splitlines()]
+    assert lines[-1]["truncated"]
+    assert lines[-1]["stats"]["matches"] == 4
+    assert sum(len(f["matches"]) for f in lines[:-1]) == 4
+
+
+async def test_search_paginated(test_content, schema, jp_fetch):
+    response = await jp_fetch(
+        "search", params={"query": "strange", "page_size": "1"}, method="GET"
+    )
+    assert response.code == 200
+    first = json.loads(response.body)
+    validate(instance=first, schema=schema)
+    assert len(first["matches"]) == 1
+    assert first["cursor"]
+    headers = _login_cookie(response)
+
+    response = await jp_fetch(
+        "search-replace",
+        "page",
+        params={"cursor": first["cursor"], "page_size": "1"},
+        method="GET",
+        headers=headers,
+    )
+    assert response.code == 200
+    second = json.loads(response.body)
+    validate(instance=second, schema=schema)
+    assert second["cursor"] is None
+
+    response = await jp_fetch("search", params={"query": "strange"}, method="GET")
+    expected = json.loads(response.body)
+    assert sorted(first["matches"] + second["matches"], key=lambda x: x["path"]) == (
+        sorted(expected["matches"], key=lambda x: x["path"])
+    )
+
+    # The cursor is released after the last page
+    with pytest.raises(tornado.httpclient.HTTPClientError) as e:
+        await jp_fetch(
+            "search-replace",
+            "page",
+            params={"cursor": first["cursor"]},
+            method="GET",
+            headers=headers,
+        )
+    assert e.value.code == 404
+
+
+async def test_search_paginated_delete(test_content, jp_fetch):
+    response = await jp_fetch(
+        "search", params={"query": "strange", "page_size": "1"}, method="GET"
+    )
+    cursor = json.loads(response.body)["cursor"]
+    headers = _login_cookie(response)
+
+    # Another user cannot stop the search
+    with pytest.raises(tornado.httpclient.HTTPClientError) as e:
+        await jp_fetch(
+            "search-replace", "page", params={"cursor": cursor}, method="DELETE"
+        )
+    assert e.value.code == 404
+
+    response = await jp_fetch(
+        "search-replace",
+        "page",
+        params={"cursor": cursor},
+        method="DELETE",
+        headers=headers,
+    )
+    assert response.code == 204
+
+    with pytest.raises(tornado.httpclient.HTTPClientError) as e:
+        await jp_fetch(
+            "search-replace",
+            "page",
+            params={"cursor": cursor},
+            method="GET",
+            headers=headers,
+        )
+    assert e.value.code == 404
+
+
+@pytest.mark.parametrize(
+    "jp_server_config",
+    (
+        {
+            "ServerApp": {"jpserver_extensions": {"jupyterlab_search_replace": True}},
+            "SearchEngine": {"max_processes": 1, "max_pending": 1},
+        },
+    ),
+)
+async def test_search_paginated_releases_slot(test_content, jp_fetch):
+    response = await jp_fetch(
+        "search", params={"query": "strange", "page_size": "1"}, method="GET"
+    )
+    cursor = json.loads(response.body)["cursor"]
+    assert cursor
+    headers = _login_cookie(response)
+
+    # The paused search lets another search run
+    response = await asyncio.wait_for(
+        jp_fetch("search", params={"query": "dash"}, method="GET"), 5
+    )
+    assert response.code == 200
+    assert json.loads(response.body)["matches"]
+
+    response = await jp_fetch(
+        "search-replace",
+        "page",
+        params={"cursor": cursor},
+        method="GET",
+        headers=headers,
+    )
+    assert response.code == 200
+    assert json.loads(response.body)["cursor"] is None
+
+
+async def _receive_until_end(ws, request_id):
+    messages = []
+    while True:
+        message = json.loads(await ws.read_message())
+        assert message["id"] == request_id
+        messages.append(message)
+        if message["type"] != "matches":
+            return messages
+
+
+async def test_search_websocket(test_content, schema, jp_fetch, jp_ws_fetch):
+    ws = await jp_ws_fetch("search-replace", "ws")
+    ws.write_message(json.dumps({"id": "1", "action": "search", "query": "strange"}))
+    messages = await _receive_until_end(ws, "1")
+    ws.close()
+
+    assert messages[-1] == {"id": "1", "type": "done"}
+    pushed = [m for message in messages[:-1] for m in message["matches"]]
+    validate(instance={"matches": pushed}, schema=schema)
+
+    response = await jp_fetch("search", params={"query": "strange"}, method="GET")
+    payload = json.loads(response.body)
+    assert sorted(pushed, key=lambda x: x["path"]) == sorted(
+        payload["matches"], key=lambda x: x["path"]
+    )
+
+
+async def test_search_websocket_error(test_content, jp_ws_fetch):
+    ws = await jp_ws_fetch("search-replace", "ws")
+    ws.write_message(
+        json.dumps({"id": "1", "action": "search", "query": "str(", "use_regex": True})
+    )
+    messages = await _receive_until_end(ws, "1")
+    ws.write_message(json.dumps({"id": "2", "action": "unknown"}))
+    unknown = json.loads(await ws.read_message())
+    ws.close()
+
+    assert len(messages) == 1
+    assert messages[0]["type"] == "error"
+    assert messages[0]["code"] == 2
+    assert unknown["id"] == "2"
+    assert unknown["type"] == "error"
+
+
+@pytest.mark.parametrize(
+    "fields",
+    (
+        {"query": 1},
+        {"query": "strange", "max_count": "abc"},
+        {"query": "strange", "max_count": True},
+        {"query": "strange", "use_regex": "yes"},
+        {"query": "strange", "include": "*.txt"},
+        {"query": "strange", "exclude": [1]},
+        {"query": "strange", "backend": 2},
+    ),
+)
+async def test_search_websocket_invalid_fields(test_content, jp_ws_fetch, fields):
+    ws = await jp_ws_fetch("search-replace", "ws")
+    ws.write_message(json.dumps({"id": "1", "action": "search", **fields}))
+    invalid = json.loads(await ws.read_message())
+    # The channel is still usable
+    ws.write_message(json.dumps({"id": "2", "action": "search", "query": "strange"}))
+    messages = await _receive_until_end(ws, "2")
+    ws.close()
+
+    assert invalid["id"] == "1"
+    assert invalid["type"] == "error"
+    assert invalid["code"] == 3
+    assert messages[-1]["type"] == "done"
+
+
+async def test_search_websocket_cancel(test_content, jp_ws_fetch):
+    ws = await jp_ws_fetch("search-replace", "ws")
+    ws.write_message(json.dumps({"id": "1", "action": "search", "query": "strange"}))
+    ws.write_message(json.dumps({"id": "1", "action": "cancel"}))
+    ws.write_message(json.dumps({"id": "2", "action": "search", "query": "hello"}))
+
+    first = await _receive_until_end(ws, "1")
+    second = await _receive_until_end(ws, "2")
+    ws.close()
+
+    assert first[-1]["type"] in ("cancelled", "done")
+    assert second == [{"id": "2", "type": "done"}]
+
+
+async def test_search_status(jp_fetch):
+    response = await jp_fetch("search-replace", "status", method="GET")
+
+    assert response.code == 200
+    payload = json.loads(response.body)
+    assert payload["running"] == 0
+    assert payload["pending"] == 0
+    assert payload["max_processes"] == 0
+
+
+async def test_search_without_subprocess_support(
+    test_content, contents_manager, monkeypatch
+):
+    engine = SearchEngine(contents_manager)
+    expected = await engine.search("strange")
+
+    # Like the selector event loop used on Windows
+    async def unsupported(*args, **kwargs):
+        raise NotImplementedError()
+
+    monkeypatch.setattr(asyncio, "create_subprocess_exec", unsupported)
+
+    assert await engine.search("strange") == expected
+    code, output = await engine.execute(["rg", "--files"], cwd=str(test_content))
+    assert code == 0
+    assert "text_1.txt" in output.splitlines()
+
+
 @pytest.mark.asyncio
-async def test_two_search_operations(test_content, schema, jp_root_dir):
-    class DummyContentsManager:
-        def __init__(self, root_dir):
-            self.root_dir = root_dir
+async def test_search_python_engine(test_content, contents_manager):
+    ripgrep = SearchEngine(contents_manager, search_backend="ripgrep")
+    python = SearchEngine(
+        contents_manager,
+        search_backend="python",
+        config=Config({"PythonBackend": {"processes": 2, "chunk_size": 1}}),
+    )
+    # The worker processes are started once for all queries
+    queries = [
+        {"query": "strange"},
+        {"query": "str.*", "use_regex": True},
+        {"query": "Strange", "case_sensitive": True},
+        {"query": "λ", "path": "test_lab_search_replace/subfolder"},
+        {"query": "strange", "exclude": ["text_1.txt"], "max_count": 1},
+    ]
+    try:
+        for options in queries:
+            expected = await ripgrep.search(**options)
+            payload = await python.search(**options)
+
+            assert "code" not in payload and "code" not in expected
+            assert sorted(payload["matches"], key=lambda x: x["path"]) == sorted(
+                expected["matches"], key=lambda x: x["path"]
+            )
+    finally:
+        await ripgrep.stop()
+        await python.stop()
 
-    engine = SearchEngine(DummyContentsManager(jp_root_dir))
+
+@pytest.mark.asyncio
+async def test_two_search_operations(test_content, schema, contents_manager):
+    engine = SearchEngine(contents_manager)
     task_1 = asyncio.create_task(engine.search(query="s"))
     payload = await asyncio.create_task(engine.search(query="str.*"))
     assert task_1.cancelled() == True
@@ -518,6 +858,165 @@ async def test_two_search_operations(test_content, schema, jp_root_dir):
     ]
 
 
+@pytest.mark.asyncio
+async def test_search_operations_in_two_sessions(
+    test_content, schema, contents_manager
+):
+    engine = SearchEngine(contents_manager)
+    task_1 = asyncio.create_task(engine.search(query="s", session="1"))
+    payload = await asyncio.create_task(engine.search(query="str.*", session="2"))
+    payload_1 = await task_1
+    assert task_1.cancelled() == False
+    validate(instance=payload_1, schema=schema)
+    assert len(payload_1["matches"]) == 2
+    validate(instance=payload, schema=schema)
+    assert len(payload["matches"]) == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "kwargs",
+    (
+        {"query": "strange"},
+        {"query": "strange", "case_sensitive": True},
+        {"query": "strange", "exclude": ["*_1.txt"]},
+        {"query": "strange", "include": ["*_1.txt"]},
+        {"query": "strange", "path": "test_lab_search_replace/subfolder"},
+        {"query": "λ strange"},
+        {"query": "str.*", "use_regex": True},
+        {"query": "hello"},
+    ),
+)
+async def test_search_with_index(test_content, contents_manager, tmp_path, kwargs):
+    engine = SearchEngine(contents_manager)
+    indexed_engine = SearchEngine(
+        contents_manager,
+        use_index=True,
+        index_path=str(tmp_path / "index.db"),
+    )
+
+    expected = await engine.search(**kwargs)
+    payload = await indexed_engine.search(**kwargs)
+    streamed = [m async for m in indexed_engine.search_stream(**kwargs)]
+
+    def sort(matches):
+        return sorted(matches, key=lambda x: x["path"])
+
+    assert sort(payload["matches"]) == sort(expected["matches"])
+    assert sort(streamed) == sort(expected["matches"])
+
+    # Modified files are re-indexed
+    (test_content / "text_1.txt").write_text("strange λ strange hello")
+    expected = await engine.search(**kwargs)
+    payload = await indexed_engine.search(**kwargs)
+    assert sort(payload["matches"]) == sort(expected["matches"])
+
+
+async def test_search_with_cache(test_content, contents_manager):
+    engine = SearchEngine(contents_manager, use_cache=True, file_watcher="none")
+
+    expected = await engine.search("strange")
+    calls = []
+    engine.stream = lambda *args, **kwargs: calls.append(args)
+
+    # Hits are served without running ripgrep
+    stats = SearchStats()
+    assert await engine.search("strange", stats=stats) == expected
+    assert [m async for m in engine.search_stream("strange")] == expected["matches"]
+    assert calls == []
+    assert stats.timings.backend == "cache"
+
+    # Modified files invalidate the cached results
+    file = test_content / "text_1.txt"
+    file.write_text("strange world")
+    stat = file.stat()
+    os.utime(file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    del engine.stream
+    payload = await engine.search("strange")
+    assert payload != expected
+    assert [m async for m in engine.search_stream("strange")] == payload["matches"]
+
+
+async def test_search_refined_query(test_content, jp_root_dir, contents_manager):
+    engine = SearchEngine(contents_manager)
+    refining_engine = SearchEngine(
+        contents_manager, refine_queries=True, file_watcher="none"
+    )
+    commands = []
+    stream = refining_engine.stream
+
+    def spy(command, **kwargs):
+        commands.append(command)
+        return stream(command, **kwargs)
+
+    refining_engine.stream = spy
+
+    first = await refining_engine.search("str", session="s")
+    refined = await refining_engine.search("strange", session="s")
+    streamed = [
+        m async for m in refining_engine.search_stream("strange λ", session="s")
+    ]
+
+    def sort(matches):
+        return sorted(matches, key=lambda x: x["path"])
+
+    # Only the files matching the previous query are searched
+    matched = sorted(m["path"] for m in first["matches"])
+    assert sorted(commands[1][commands[1].index("strange") + 1 :]) == matched
+    assert sort(refined["matches"]) == sort((await engine.search("strange"))["matches"])
+    assert sort(streamed) == sort((await engine.search("strange λ"))["matches"])
+
+    # Another session searches the whole folder
+    await refining_engine.search("strange", session="other")
+    assert commands[-1][-1] == "strange"
+
+    # A matched file is deleted before its deletion is detected
+    await refining_engine.search("str", session="s")
+    (jp_root_dir / matched[0]).unlink()
+    refining_engine._tracker.unchanged = lambda *args: True
+    refined = await refining_engine.search("strange", session="s")
+    assert "code" not in refined
+    assert matched[0] not in commands[-1]
+    assert sort(refined["matches"]) == sort((await engine.search("strange"))["matches"])
+
+
+@pytest.mark.parametrize(
+    "limits, limit, matches, files",
+    (
+        ({}, None, 5, 2),
+        ({"max_matches": 4}, "max_matches", 4, 2),
+        ({"max_matches": 2}, "max_matches", 2, 1),
+        ({"max_files": 1}, "max_files", None, 1),
+        ({"max_response_size": 1}, "max_size", 0, 0),
+        ({"search_timeout": 1e-9}, "timeout", 0, 0),
+    ),
+)
+async def test_search_limits(
+    test_content, contents_manager, limits, limit, matches, files
+):
+    engine = SearchEngine(contents_manager, **limits)
+
+    payload = await engine.search("strange")
+    stats = SearchStats()
+    streamed = [m async for m in engine.search_stream("strange", stats=stats)]
+
+    for result, truncated in (
+        (payload["matches"], payload.get("stats")),
+        (streamed, stats.to_dict()),
+    ):
+        if matches is not None:
+            assert sum(len(f["matches"]) for f in result) == matches
+        assert len(result) == files
+    if limit is None:
+        assert "truncated" not in payload
+        assert stats.truncated is None
+    else:
+        assert payload["truncated"]
+        assert payload["stats"]["limit"] == limit
+        assert stats.truncated == limit
+        assert stats.elapsed > 0
+
+
 async def test_replace_operation(test_content, schema, jp_fetch):
     # Given
     response = await jp_fetch(
@@ -546,6 +1045,15 @@ async def test_replace_operation(test_content, schema, jp_fetch):
 
     # Then
     assert response.code == 201
+    report = json.loads(response.body)
+    assert isinstance(report.pop("operation"), str)
+    assert report == {
+        "total": 1,
+        "done": 1,
+        "replaced": 1,
+        "bytes": len(file_match.read_bytes()),
+        "errors": [],
+    }
 
     ## Check checkpoint is created
     checkpoint_file = (
@@ -605,3 +1113,576 @@ async def test_replace_operation(test_content, schema, jp_fetch):
             ],
         },
     ]
+
+
+@pytest.mark.parametrize(
+    "jp_server_config",
+    [
+        {
+            "ServerApp": {"jpserver_extensions": {"jupyterlab_search_replace": True}},
+            "SearchEngine": {"max_replace_workers": 2},
+        }
+    ],
+)
+async def test_replace_partial_failure(test_content, jp_fetch):
+    # Given
+    response = await jp_fetch(
+        "search", params={"query": "strange", "exclude": "*_1.txt"}, method="GET"
+    )
+    matches = json.loads(response.body)["matches"]
+    for file in matches:
+        for match in file["matches"]:
+            match["replace"] = "hello"
+    stale = json.loads(json.dumps(matches[0]))
+    stale["path"] = "missing.txt"
+    stale_line = json.loads(json.dumps(matches[0]))
+    stale_line["path"] = "test_lab_search_replace/text_1.txt"
+    for match in stale_line["matches"]:
+        match["line_number"] = 1000
+    original = (test_content / "text_1.txt").read_text()
+
+    # When
+    with pytest.raises(tornado.httpclient.HTTPClientError) as e:
+        await jp_fetch(
+            "search",
+            body=json.dumps({"matches": [stale, *matches, stale_line]}),
+            method="POST",
+        )
+
+    # Then
+    assert e.value.code == 500
+    report = json.loads(e.value.response.body)
+    assert report["total"] == 3
+    assert report["done"] == 3
+    assert report["replaced"] == 1
+    assert sorted(error["path"] for error in report["errors"]) == [
+        "missing.txt",
+        "test_lab_search_replace/text_1.txt",
+    ]
+    assert "hello" in (test_content / "subfolder" / "text_sub.txt").read_text()
+    assert (test_content / "text_1.txt").read_text() == original
+    assert not [p for p in test_content.iterdir() if p.name.endswith(".tmp")]
+
+
+async def test_replace_job(test_content, jp_fetch):
+    # Given
+    response = await jp_fetch(
+        "search", params={"query": "strange", "exclude": "*_1.txt"}, method="GET"
+    )
+    matches = json.loads(response.body)["matches"]
+    for file in matches:
+        for match in file["matches"]:
+            match["replace"] = "hello"
+
+    # When
+    response = await jp_fetch(
+        "search",
+        params={"background": "true"},
+        body=json.dumps({"matches": matches}),
+        method="POST",
+    )
+
+    # Then
+    assert response.code == 202
+    headers = _login_cookie(response)
+    job = json.loads(response.body)
+    assert job["total"] == 1
+    assert response.headers["Location"].endswith(f"/search-replace/jobs/{job['id']}")
+    for _ in range(100):
+        response = await jp_fetch(
+            "search-replace", "jobs", job["id"], method="GET", headers=headers
+        )
+        job = json.loads(response.body)
+        if job["status"] != "running":
+            break
+        await asyncio.sleep(0.05)
+    assert job["status"] == "done"
+    assert job["replaced"] == 1
+    assert "hello" in (test_content / "subfolder" / "text_sub.txt").read_text()
+
+
+@pytest.mark.parametrize("background", ("false", "true"))
+async def test_replace_duplicated_path(test_content, jp_fetch, background):
+    file = test_content / "text_1.txt"
+    original = file.read_text()
+    matches = [
+        {
+            "path": "test_lab_search_replace/text_1.txt",
+            "matches": [{"line_number": 1, "start": i, "end": i + 1, "replace": "X"}],
+        }
+        for i in range(2)
+    ]
+
+    with pytest.raises(tornado.httpclient.HTTPClientError) as e:
+        await jp_fetch(
+            "search",
+            params={"background": background},
+            body=json.dumps({"matches": matches}),
+            method="POST",
+        )
+
+    assert e.value.code == 400
+    assert json.loads(e.value.response.body)["code"] == 8
+    assert file.read_text() == original
+
+
+async def test_replace_job_of_another_user(test_content, jp_fetch):
+    response = await jp_fetch(
+        "search",
+        params={"query": "strange", "replace": "hello", "background": "true"},
+        body=b"",
+        method="POST",
+    )
+    job = json.loads(response.body)
+
+    # jp_fetch identifies each request without cookie as a new anonymous user
+    for method in ("GET", "DELETE"):
+        with pytest.raises(tornado.httpclient.HTTPClientError) as e:
+            await jp_fetch("search-replace", "jobs", job["id"], method=method)
+        assert e.value.code == 404
+        assert json.loads(e.value.response.body)["code"] == 6
+
+    response = await jp_fetch(
+        "search-replace",
+        "jobs",
+        job["id"],
+        method="GET",
+        headers=_login_cookie(response),
+    )
+    assert json.loads(response.body)["id"] == job["id"]
+
+
+async def test_replace_job_cancel_unknown(jp_fetch):
+    with pytest.raises(tornado.httpclient.HTTPClientError) as e:
+        await jp_fetch("search-replace", "jobs", "0123abcd", method="DELETE")
+
+    assert e.value.code == 404
+    assert json.loads(e.value.response.body)["code"] == 6
+
+
+async def test_replace_cancelled_before_start(test_content, contents_manager):
+    engine = SearchEngine(contents_manager)
+    payload = await engine.search(query="strange")
+    report = ReplaceReport(len(payload["matches"]))
+    report.cancelled = True
+
+    await engine.replace(payload["matches"], "", create_checkpoint=False, report=report)
+
+    assert report.done == 0
+    assert "strange" in (test_content / "subfolder" / "text_sub.txt").read_text()
+
+
+async def test_search_with_replace(test_content, schema, jp_fetch):
+    response = await jp_fetch(
+        "search",
+        params={
+            "query": r"(\w+) (f\w+)",
+            "use_regex": "true",
+            "replace": "$2 $1",
+            "include": "text_sub.txt",
+        },
+        method="GET",
+    )
+
+    assert response.code == 200
+    payload = json.loads(response.body)
+    validate(instance=payload, schema=schema)
+    assert [(m["match"], m["replace"]) for m in payload["matches"][0]["matches"]] == [
+        ("sub file", "file sub")
+    ]
+
+
+async def test_replace_by_query(test_content, jp_fetch):
+    # Given
+    params = {"query": "str(an)ge", "use_regex": "true", "exclude": "*_1.txt"}
+    response = await jp_fetch("search", params=params, method="GET")
+    etag = response.headers["Etag"]
+    count = sum(len(f["matches"]) for f in json.loads(response.body)["matches"])
+
+    # When
+    response = await jp_fetch(
+        "search",
+        params={**params, "replace": "r$1d", "expected_count": str(count)},
+        headers={"If-Match": etag},
+        body=b"",
+        method="POST",
+    )
+
+    # Then
+    assert response.code == 201
+    assert json.loads(response.body)["replaced"] == 1
+    assert (
+        (test_content / "subfolder" / "text_sub.txt")
+        .read_text()
+        .startswith("Unicode rand sub file, very rand")
+    )
+    assert "strange" in (test_content / "text_1.txt").read_text()
+
+
+async def test_replace_by_query_without_template(test_content, jp_fetch):
+    original = (test_content / "text_1.txt").read_text()
+
+    with pytest.raises(tornado.httpclient.HTTPClientError) as e:
+        await jp_fetch(
+            "search",
+            params={"query": "strange"},
+            body=b"",
+            method="POST",
+        )
+
+    assert e.value.code == 400
+    assert json.loads(e.value.response.body)["code"] == 8
+    # The matches are not deleted
+    assert (test_content / "text_1.txt").read_text() == original
+
+
+@pytest.mark.parametrize(
+    "params, headers",
+    [({"expected_count": "2"}, {}), ({}, {"If-Match": '"0123"'})],
+)
+async def test_replace_by_query_conflict(test_content, jp_fetch, params, headers):
+    original = (test_content / "subfolder" / "text_sub.txt").read_text()
+
+    with pytest.raises(tornado.httpclient.HTTPClientError) as e:
+        await jp_fetch(
+            "search",
+            params={"query": "strange", "replace": "hello", **params},
+            headers=headers,
+            body=b"",
+            method="POST",
+        )
+
+    assert e.value.code == 412
+    assert json.loads(e.value.response.body)["code"] == 7
+    assert (test_content / "subfolder" / "text_sub.txt").read_text() == original
+
+
+@pytest.mark.parametrize(
+    "method, params",
+    (
+        ("GET", {}),
+        ("GET", {"stream": "true"}),
+        ("GET", {"page_size": "1"}),
+        ("POST", {"replace": "odd"}),
+    ),
+)
+async def test_search_unknown_backend(test_content, jp_fetch, method, params):
+    with pytest.raises(tornado.httpclient.HTTPClientError) as e:
+        await jp_fetch(
+            "search",
+            params={"query": "strange", "backend": "grep", **params},
+            method=method,
+            **({"body": b""} if method == "POST" else {}),
+        )
+
+    assert e.value.code == 400
+    payload = json.loads(e.value.response.body)
+    assert payload == {"code": 8, "message": "Unknown search backend 'grep'."}
+
+
+async def test_replace_by_query_unsupported(test_content, jp_fetch):
+    with pytest.raises(tornado.httpclient.HTTPClientError) as e:
+        await jp_fetch(
+            "search",
+            params={"query": r"(\p{L})", "use_regex": "true", "replace": "$1"},
+            body=b"",
+            method="POST",
+        )
+
+    assert e.value.code == 400
+    assert json.loads(e.value.response.body)["code"] == 8
+
+
+async def test_undo_replace(test_content, jp_fetch):
+    # Given
+    original = {
+        path: path.read_text()
+        for path in (
+            test_content / "text_1.txt",
+            test_content / "subfolder" / "text_sub.txt",
+        )
+    }
+    response = await jp_fetch(
+        "search",
+        params={"query": "strange", "replace": "hello"},
+        body=b"",
+        method="POST",
+    )
+    headers = _login_cookie(response)
+    report = json.loads(response.body)
+    assert report["replaced"] == 2
+    assert all("strange" not in path.read_text() for path in original)
+
+    # When
+    response = await jp_fetch(
+        "search-replace",
+        "undo",
+        report["operation"],
+        body=b"",
+        method="POST",
+        headers=headers,
+    )
+
+    # Then
+    assert response.code == 200
+    assert json.loads(response.body) == {
+        "operation": report["operation"],
+        "total": 2,
+        "restored": 2,
+        "errors": [],
+    }
+    assert {path: path.read_text() for path in original} == original
+    ## An operation is undone only once
+    with pytest.raises(tornado.httpclient.HTTPClientError) as e:
+        await jp_fetch(
+            "search-replace",
+            "undo",
+            report["operation"],
+            body=b"",
+            method="POST",
+            headers=headers,
+        )
+    assert e.value.code == 404
+    assert json.loads(e.value.response.body)["code"] == 9
+
+
+async def test_undo_replace_of_another_user(test_content, jp_fetch):
+    file = test_content / "text_1.txt"
+    response = await jp_fetch(
+        "search",
+        params={"query": "strange", "replace": "hello", "include": "text_1.txt"},
+        body=b"",
+        method="POST",
+    )
+    operation = json.loads(response.body)["operation"]
+    replaced = file.read_text()
+
+    # jp_fetch identifies each request without cookie as a new anonymous user
+    with pytest.raises(tornado.httpclient.HTTPClientError) as e:
+        await jp_fetch("search-replace", "undo", operation, body=b"", method="POST")
+    assert e.value.code == 404
+    assert json.loads(e.value.response.body)["code"] == 9
+    assert file.read_text() == replaced
+
+    await jp_fetch(
+        "search-replace",
+        "undo",
+        operation,
+        body=b"",
+        method="POST",
+        headers=_login_cookie(response),
+    )
+    assert "strange" in file.read_text()
+
+
+async def test_undo_replace_after_checkpoint(test_content, jp_fetch):
+    file = test_content / "text_1.txt"
+    response = await jp_fetch(
+        "search",
+        params={"query": "strange", "replace": "hello", "include": "text_1.txt"},
+        body=b"",
+        method="POST",
+    )
+    headers = _login_cookie(response)
+    operation = json.loads(response.body)["operation"]
+    # The user saves the file with a checkpoint, overwriting the replace one
+    file.write_text("saved")
+    await jp_fetch(
+        "api",
+        "contents",
+        "test_lab_search_replace",
+        "text_1.txt",
+        "checkpoints",
+        body=b"",
+        method="POST",
+    )
+
+    with pytest.raises(tornado.httpclient.HTTPClientError) as e:
+        await jp_fetch(
+            "search-replace",
+            "undo",
+            operation,
+            body=b"",
+            method="POST",
+            headers=headers,
+        )
+
+    assert e.value.code == 409
+    r = json.loads(e.value.response.body)
+    assert r["code"] == 10
+    assert r["paths"] == ["test_lab_search_replace/text_1.txt"]
+    assert file.read_text() == "saved"
+
+
+async def test_undo_superseded_replace(test_content, jp_fetch):
+    file = test_content / "numbers.txt"
+    file.write_text("one")
+    headers = {}
+
+    async def replace(query, replace):
+        response = await jp_fetch(
+            "search",
+            params={"query": query, "replace": replace, "include": "numbers.txt"},
+            body=b"",
+            method="POST",
+        )
+        headers.update(_login_cookie(response))
+        return json.loads(response.body)["operation"]
+
+    first = await replace("one", "two")
+    second = await replace("two", "six")
+    assert file.read_text() == "six"
+
+    # The checkpoint of the first operation has been overwritten by the second one
+    with pytest.raises(tornado.httpclient.HTTPClientError) as e:
+        await jp_fetch(
+            "search-replace", "undo", first, body=b"", method="POST", headers=headers
+        )
+    assert e.value.code == 404
+    assert file.read_text() == "six"
+
+    await jp_fetch(
+        "search-replace", "undo", second, body=b"", method="POST", headers=headers
+    )
+    assert file.read_text() == "two"
+
+
+@pytest.mark.parametrize(
+    "jp_server_config",
+    [
+        {
+            "ServerApp": {"jpserver_extensions": {"jupyterlab_search_replace": True}},
+            "SearchEngine": {"file_backend": "contents"},
+        }
+    ],
+)
+async def test_replace_through_contents_manager(test_content, jp_fetch):
+    response = await jp_fetch(
+        "search",
+        params={"query": "strange", "replace": "hello", "include": "text_sub.txt"},
+        body=b"",
+        method="POST",
+    )
+
+    assert response.code == 201
+    assert json.loads(response.body)["replaced"] == 1
+    assert (test_content / "subfolder" / "text_sub.txt").read_text() == "\n".join(
+        [
+            "Unicode hello sub file, very hello",
+            "ü notebook with ",
+            "Is that λ hello enough?",
+            "A line with a -dash",
+        ]
+    )
+
+
+@pytest.mark.parametrize(
+    "jp_server_config",
+    [
+        {
+            "ServerApp": {"jpserver_extensions": {"jupyterlab_search_replace": True}},
+            "SearchEngine": {"notebook_search": True},
+        }
+    ],
+)
+async def test_search_notebook_cells(test_content, schema, jp_fetch):
+    # Given
+    notebook = {
+        "cells": [
+            {
+                "cell_type": "code",
+                "execution_count": None,
+                "metadata": {},
+                "outputs": [],
+                "source": ["s = 'a \"strange\" value'\n", "print(s)"],
+            }
+        ],
+        "metadata": {},
+        "nbformat": 4,
+        "nbformat_minor": 5,
+    }
+    (test_content / "notebook.ipynb").write_text(json.dumps(notebook, indent=1) + "\n")
+
+    # When
+    response = await jp_fetch(
+        "search", params={"query": '"strange"', "exclude": "*.txt"}, method="GET"
+    )
+
+    # Then
+    assert response.code == 200
+    payload = json.loads(response.body)
+    validate(instance=payload, schema=schema)
+    assert payload["matches"] == [
+        {
+            "path": "test_lab_search_replace/notebook.ipynb",
+            "matches": [
+                {
+                    "line": "s = 'a \"strange\" value'\n",
+                    "match": '"strange"',
+                    "start": 7,
+                    "end": 16,
+                    "replace": None,
+                    "start_utf8": 7,
+                    "end_utf8": 16,
+                    "line_number": 1,
+                    "absolute_offset": 0,
+                    "cell": 0,
+                }
+            ],
+        }
+    ]
+
+    ## Replace within the cell
+    response = await jp_fetch(
+        "search",
+        params={"query": '"strange"', "exclude": "*.txt", "replace": "'odd'"},
+        body=b"",
+        method="POST",
+    )
+    assert response.code == 201
+    edited = json.loads((test_content / "notebook.ipynb").read_text())
+    assert edited["cells"][0]["source"] == ["s = 'a 'odd' value'\n", "print(s)"]
+
+
+async def test_search_timings(test_content, schema, jp_fetch):
+    response = await jp_fetch(
+        "search", params={"query": "strange", "timings": "true"}, method="GET"
+    )
+
+    payload = json.loads(response.body)
+    validate(instance=payload, schema=schema)
+    timings = payload["timings"]
+    assert timings["backend"] == "ripgrep"
+    assert timings["files_searched"] == 2
+    assert timings["files_matched"] == 2
+    assert timings["output_bytes"] > 0
+    assert timings["spawn"] >= 0
+    assert 0 <= timings["first_match"] <= timings["search"]
+    assert timings["parse"] >= 0
+    assert timings["serialize"] >= 0
+
+    response = await jp_fetch("search", params={"query": "strange"}, method="GET")
+    assert "timings" not in json.loads(response.body)
+
+
+async def test_search_stream_timings(test_content, jp_fetch):
+    response = await jp_fetch(
+        "search",
+        params={"query": "strange", "stream": "true", "timings": "true"},
+        method="GET",
+    )
+
+    lines = [json.loads(line) for line in response.body.splitlines()]
+    assert len(lines) == 3
+    assert lines[-1]["timings"]["files_matched"] == 2
+
+
+async def test_search_metrics(test_content, jp_fetch):
+    await jp_fetch("search", params={"query": "strange"}, method="GET")
+
+    response = await jp_fetch("metrics", method="GET")
+
+    metrics = response.body.decode("utf-8")
+    assert 'search_replace_searches_total{backend="ripgrep",outcome="done"}' in metrics
+    assert "search_replace_files_searched_total" in metrics
+    assert "search_replace_serialization_duration_seconds_count" in metrics
@@ -0,0 +1,149 @@
+import pytest
+
+from ..index import TrigramIndex, get_query_trigrams, get_trigrams
+
+
+def _trigram(value: bytes) -> int:
+    return int.from_bytes(value, "big")
+
+
+def test_get_trigrams():
+    assert get_trigrams(b"HeLlo") == {
+        _trigram(b"hel"),
+        _trigram(b"ell"),
+        _trigram(b"llo"),
+    }
+    assert get_trigrams(b"he") == set()
+
+
+@pytest.mark.parametrize(
+    "query, case_sensitive, expected",
+    (
+        ("Hello", True, {b"hel", b"ell", b"llo"}),
+        ("Hello", False, {b"hel", b"ell", b"llo"}),
+        ("he", True, set()),
+        # Characters with case foldings outside of ASCII are skipped
+        ("desk", False, set()),
+        (
+            "docs world",
+            True,
+            {b"doc", b"ocs", b"cs ", b"s w", b" wo", b"wor", b"orl", b"rld"},
+        ),
+        ("docs world", False, {b"doc", b" wo", b"wor", b"orl", b"rld"}),
+        (
+            "λ ab",
+            True,
+            {"λ".encode("utf-8") + b" ", "λ ".encode("utf-8")[1:] + b"a", b" ab"},
+        ),
+        ("λ ab", False, {b" ab"}),
+    ),
+)
+def test_get_query_trigrams(query, case_sensitive, expected):
+    assert get_query_trigrams(query, case_sensitive) == {_trigram(t) for t in expected}
+
+
+@pytest.fixture
+def index(tmp_path):
+    root = tmp_path / "root"
+    root.mkdir()
+    (root / "a.txt").write_text("hello world")
+    (root / "b.txt").write_text("Strange HELLO")
+    (root / "c.txt").write_text("nothing here")
+    (root / "big.txt").write_text("x" * 20)
+    return TrigramIndex(root, tmp_path / "index.db", max_file_size=15)
+
+
+@pytest.mark.asyncio
+async def test_index_candidates(index):
+    paths = ["a.txt", "b.txt", "c.txt", "big.txt"]
+
+    assert await index.candidates(paths, "hello", False) == [
+        "a.txt",
+        "b.txt",
+        "big.txt",
+    ]
+    assert await index.candidates(paths, "strange", False) == ["b.txt", "big.txt"]
+    assert await index.candidates(paths, "he", False) is None
+    await index.close()
+
+
+@pytest.mark.asyncio
+async def test_index_update(index, tmp_path):
+    paths = ["a.txt", "b.txt", "c.txt"]
+    assert await index.candidates(paths, "world", False) == ["a.txt"]
+
+    (tmp_path / "root" / "c.txt").write_text("new world")
+    (tmp_path / "root" / "a.txt").unlink()
+    assert await index.candidates(paths, "world", False) == ["c.txt"]
+    await index.close()
+
+
+@pytest.mark.asyncio
+async def test_index_persistence(index, tmp_path):
+    paths = ["a.txt", "b.txt", "c.txt"]
+    assert await index.candidates(paths, "world", False) == ["a.txt"]
+    await index.close()
+
+    reopened = TrigramIndex(
+        tmp_path / "root", tmp_path / "index.db", max_inline_updates=0
+    )
+    # All files are up-to-date so the index is used
+    assert await reopened.candidates(paths, "world", False) == ["a.txt"]
+    await reopened.close()
+
+
+@pytest.mark.asyncio
+async def test_index_cold(index):
+    index.max_inline_updates = 1
+    paths = ["a.txt", "b.txt", "c.txt"]
+
+    assert await index.candidates(paths, "world", False) is None
+    assert index.updating
+    await index._background_update
+    assert await index.candidates(paths, "world", False) == ["a.txt"]
+    await index.close()
+
+
+@pytest.mark.asyncio
+async def test_index_background_update_limit(index):
+    index.max_inline_updates = 0
+    index.max_background_updates = 2
+    paths = ["a.txt", "b.txt", "c.txt"]
+
+    assert await index.candidates(paths, "hello", False) is None
+    await index._background_update
+    # The trigrams were extracted out of the server process
+    assert index._extractor is not None
+    assert len(index._files) == 2
+
+    # The next query completes the update
+    assert await index.candidates(paths, "hello", False) is None
+    await index._background_update
+    index.max_inline_updates = 200
+    assert await index.candidates(paths, "hello", False) == ["a.txt", "b.txt"]
+    await index.close()
+    assert index._extractor is None
+
+
+@pytest.mark.asyncio
+async def test_index_outdated_files_checked_once_indexed(index):
+    paths = ["a.txt", "b.txt", "c.txt"]
+
+    # The update in the background may not start, e.g. if one is running
+    assert await index._run(index._outdated, paths, set()) == paths
+    assert await index._run(index._outdated, paths, set()) == paths
+
+    await index._run(index._index, paths, 2)
+    assert await index._run(index._outdated, paths, set()) == ["c.txt"]
+    await index.close()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("encoding", ("utf-16-le", "utf-16-be"))
+async def test_index_utf16_with_bom(index, tmp_path, encoding):
+    # Small enough to be indexed
+    (tmp_path / "root" / "d.txt").write_bytes("\ufeffworld".encode(encoding))
+    paths = ["a.txt", "b.txt", "c.txt", "d.txt"]
+
+    assert await index.candidates(paths, "world", True) == ["a.txt", "d.txt"]
+    await index.close()
@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+
+from ..jobs import JobNotFoundError, ReplaceJobManager
+
+
+class _Replace:
+    """Fake replacement rewriting a file each time it is released."""
+
+    def __init__(self, count, error=None):
+        self.count = count
+        self.error = error
+        self.release = asyncio.Semaphore(0)
+
+    async def __call__(self, report):
+        for i in range(self.count):
+            await self.release.acquire()
+            if report.cancelled:
+                break
+            report.add_success(f"{i}.txt", 10)
+        if self.error is not None:
+            raise self.error
+        return report
+
+
+@pytest.mark.asyncio
+async def test_job_progress():
+    jobs = ReplaceJobManager()
+    replace = _Replace(3)
+
+    job = jobs.start(replace, 3)
+
+    assert job["status"] == "running"
+    assert job["total"] == 3
+    assert job["done"] == 0
+    replace.release.release()
+    await asyncio.sleep(0)
+    assert jobs.get(job["id"])["done"] == 1
+    for _ in range(2):
+        replace.release.release()
+    state = await jobs.wait(job["id"])
+    assert state["status"] == "done"
+    assert state["done"] == 3
+    assert state["bytes"] == 30
+    assert state["errors"] == []
+    # The report is kept after completion
+    assert jobs.get(job["id"]) == state
+
+
+@pytest.mark.asyncio
+async def test_job_cancel():
+    jobs = ReplaceJobManager()
+    replace = _Replace(3)
+    job = jobs.start(replace, 3)
+    replace.release.release()
+    await asyncio.sleep(0)
+
+    state = jobs.cancel(job["id"])
+
+    assert state["status"] == "cancelling"
+    replace.release.release()
+    state = await jobs.wait(job["id"])
+    assert state["status"] == "cancelled"
+    assert state["done"] == 1
+
+
+@pytest.mark.asyncio
+async def test_job_failure():
+    jobs = ReplaceJobManager()
+    replace = _Replace(1, RuntimeError("disk full"))
+    job = jobs.start(replace, 1)
+    replace.release.release()
+
+    state = await jobs.wait(job["id"])
+
+    assert state["status"] == "failed"
+    assert state["message"] == "disk full"
+    assert state["done"] == 1
+
+
+@pytest.mark.asyncio
+async def test_job_expiration():
+    jobs = ReplaceJobManager(ttl=0.05)
+    replace = _Replace(0)
+    job = jobs.start(replace, 0)
+    await jobs.wait(job["id"])
+    assert len(jobs) == 1
+
+    await asyncio.sleep(0.1)
+
+    assert len(jobs) == 0
+    with pytest.raises(JobNotFoundError):
+        jobs.get(job["id"])
+
+
+@pytest.mark.asyncio
+async def test_job_not_found():
+    jobs = ReplaceJobManager()
+
+    with pytest.raises(JobNotFoundError):
+        jobs.get("unknown")
+    with pytest.raises(JobNotFoundError):
+        jobs.cancel("unknown")
+
+
+@pytest.mark.asyncio
+async def test_job_of_another_user():
+    jobs = ReplaceJobManager()
+    replace = _Replace(1)
+    job = jobs.start(replace, 1, "alice")
+
+    with pytest.raises(JobNotFoundError):
+        jobs.get(job["id"], "bob")
+    with pytest.raises(JobNotFoundError):
+        jobs.cancel(job["id"], "bob")
+
+    replace.release.release()
+    state = await jobs.wait(job["id"], "alice")
+    assert state["status"] == "done"
@@ -0,0 +1,91 @@
+import pytest
+
+from ..metrics import CACHE_BACKEND, SearchTimings
+
+prometheus_client = pytest.importorskip("prometheus_client")
+
+
+def _sample(name, **labels):
+    return prometheus_client.REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_search_timings_to_dict():
+    timings = SearchTimings()
+    timings.backend = "python"
+    timings.add_spawn(0.001)
+    timings.add_spawn(0.002)
+    timings.add_files(10, 2)
+    timings.add_files(None, 1)
+    timings.search = 0.5
+
+    assert timings.to_dict() == {
+        "backend": "python",
+        "spawn": 3.0,
+        "first_match": None,
+        "search": 500.0,
+        "parse": 0.0,
+        "serialize": 0.0,
+        "output_bytes": 0,
+        "files_searched": 10,
+        "files_matched": 3,
+    }
+
+
+def test_search_timings_first_match():
+    timings = SearchTimings()
+
+    timings.match_found()
+    first_match = timings.first_match
+    timings.match_found()
+
+    assert timings.first_match == first_match >= 0
+
+
+def test_search_timings_observe():
+    searches = _sample(
+        "search_replace_searches_total", backend="test", outcome="cancelled"
+    )
+    files = _sample("search_replace_files_searched_total", backend="test")
+    no_backend = _sample(
+        "search_replace_searches_total", backend="none", outcome="error"
+    )
+    timings = SearchTimings()
+    timings.backend = "test"
+    timings.add_files(4, 1)
+
+    timings.observe("cancelled")
+    SearchTimings().observe("error")
+
+    assert (
+        _sample("search_replace_searches_total", backend="test", outcome="cancelled")
+        == searches + 1
+    )
+    assert _sample("search_replace_files_searched_total", backend="test") == files + 4
+    assert (
+        _sample("search_replace_searches_total", backend="none", outcome="error")
+        == no_backend + 1
+    )
+
+
+def test_search_timings_observe_cache_hit():
+    hits = _sample("search_replace_searches_total", backend="cache", outcome="done")
+    durations = _sample("search_replace_search_duration_seconds_count", backend="cache")
+    parses = _sample("search_replace_parse_duration_seconds_count", backend="cache")
+    timings = SearchTimings()
+    timings.backend = CACHE_BACKEND
+    timings.search = 0.001
+
+    timings.observe("done")
+
+    assert (
+        _sample("search_replace_searches_total", backend="cache", outcome="done")
+        == hits + 1
+    )
+    assert (
+        _sample("search_replace_search_duration_seconds_count", backend="cache")
+        == durations + 1
+    )
+    assert (
+        _sample("search_replace_parse_duration_seconds_count", backend="cache")
+        == parses
+    )
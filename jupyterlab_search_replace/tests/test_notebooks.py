@@ -0,0 +1,131 @@
+import json
+import os
+
+import pytest
+
+from ..notebooks import NotebookCache, edit_notebook, get_cells_text, search_cells
+from ..pysearch import compile_query
+
+NOTEBOOK = {
+    "cells": [
+        {"cell_type": "markdown", "metadata": {}, "source": ["# Title λ\n", "text"]},
+        {
+            "cell_type": "code",
+            "execution_count": 1,
+            "metadata": {},
+            "outputs": [
+                {"name": "stdout", "output_type": "stream", "text": ["λ = 1\n"]},
+                {
+                    "data": {"image/png": "iVBORw0KGgo=", "text/plain": ["<Figure>"]},
+                    "metadata": {},
+                    "output_type": "display_data",
+                },
+            ],
+            "source": 'x = "λ"\nprint(f"λ = {x}")',
+        },
+    ],
+    "metadata": {},
+    "nbformat": 4,
+    "nbformat_minor": 5,
+}
+
+
+def _content():
+    return (json.dumps(NOTEBOOK, indent=1, ensure_ascii=False) + "\n").encode()
+
+
+def test_get_cells_text():
+    cells = get_cells_text(_content())
+
+    assert [(c.cell, c.output, c.text) for c in cells] == [
+        (0, None, "# Title λ\ntext"),
+        (1, None, 'x = "λ"\nprint(f"λ = {x}")'),
+    ]
+
+
+def test_get_cells_text_outputs():
+    cells = get_cells_text(_content(), include_outputs=True)
+
+    assert [(c.cell, c.output, c.text) for c in cells][2:] == [
+        (1, 0, "λ = 1\n"),
+        (1, 1, "<Figure>"),
+    ]
+
+
+def test_search_cells():
+    pattern = compile_query("λ", False, False, False)
+
+    lines = list(search_cells(get_cells_text(_content()), pattern))
+
+    assert [
+        (m.cell, m.line_number, m.absolute_offset, m.submatches) for m in lines
+    ] == [
+        (0, 1, 0, [("λ", 8, 10)]),
+        (1, 1, 0, [("λ", 5, 7)]),
+        (1, 2, 9, [("λ", 8, 10)]),
+    ]
+    assert lines[2].line == 'print(f"λ = {x}")'
+
+
+def test_search_cells_max_count():
+    pattern = compile_query("λ", False, False, False)
+
+    lines = list(search_cells(get_cells_text(_content()), pattern, max_count=2))
+
+    assert len(lines) == 2
+
+
+def test_notebook_cache(tmp_path):
+    cache = NotebookCache(max_entries=1)
+    notebook = tmp_path / "a.ipynb"
+    notebook.write_bytes(_content())
+
+    cells = cache.get_cells(notebook)
+    assert cache.get_cells(notebook) is cells
+
+    NOTEBOOK_2 = json.loads(_content())
+    NOTEBOOK_2["cells"][0]["source"] = "changed"
+    notebook.write_text(json.dumps(NOTEBOOK_2))
+    stat = notebook.stat()
+    os.utime(notebook, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert cache.get_cells(notebook)[0].text == "changed"
+
+    other = tmp_path / "b.ipynb"
+    other.write_bytes(_content())
+    cache.get_cells(other)
+    assert len(cache) == 1
+
+
+def test_edit_notebook():
+    edited = edit_notebook(
+        _content(), {0: {1: [(8, 10, b"mu")]}, 1: {2: [(8, 10, b"mu")]}}
+    )
+
+    notebook = json.loads(edited)
+    assert notebook["cells"][0]["source"] == ["# Title mu\n", "text"]
+    assert notebook["cells"][1]["source"] == 'x = "λ"\nprint(f"mu = {x}")'
+    # Only the sources are modified
+    notebook["cells"][0]["source"] = NOTEBOOK["cells"][0]["source"]
+    notebook["cells"][1]["source"] = NOTEBOOK["cells"][1]["source"]
+    assert edited.endswith(b"}\n")
+    assert notebook == NOTEBOOK
+
+
+def test_edit_notebook_line_separators():
+    notebook = {
+        "cells": [{"cell_type": "code", "source": ["a = 'λ\r\x0c\u2028'\n", "b"]}],
+        "metadata": {},
+        "nbformat": 4,
+        "nbformat_minor": 5,
+    }
+    content = json.dumps(notebook).encode()
+
+    edited = edit_notebook(content, {0: {2: [(0, 1, b"c")]}})
+
+    # Only "\n" separates the lines of the source
+    assert json.loads(edited)["cells"][0]["source"] == ["a = 'λ\r\x0c\u2028'\n", "c"]
+
+
+def test_edit_notebook_invalid():
+    with pytest.raises(ValueError):
+        edit_notebook(_content(), {2: {1: [(0, 1, b"")]}})
@@ -0,0 +1,142 @@
+import asyncio
+
+import pytest
+
+from ..pagination import CursorNotFoundError, ResultPager
+from ..search_engine import SearchError, SearchStats
+
+
+class _Stream:
+    """Fake search stream recording how far it was consumed."""
+
+    def __init__(self, count, error=None):
+        self.count = count
+        self.error = error
+        self.read = 0
+        self.closed = False
+
+    async def _generate(self):
+        try:
+            for i in range(self.count):
+                self.read += 1
+                yield {"path": f"{i}.txt", "matches": []}
+            if self.error is not None:
+                raise self.error
+        finally:
+            self.closed = True
+
+    def __call__(self):
+        return self._generate()
+
+
+def _paths(page):
+    return [f["path"] for f in page["matches"]]
+
+
+@pytest.mark.asyncio
+async def test_pager_pages():
+    pager = ResultPager()
+    stream = _Stream(5)
+
+    page = await pager.start(stream(), SearchStats(), 2)
+    assert _paths(page) == ["0.txt", "1.txt"]
+    # The stream is only read ahead by one file
+    assert stream.read == 3
+    cursor = page["cursor"]
+
+    page = await pager.next(cursor, 2)
+    assert _paths(page) == ["2.txt", "3.txt"]
+    assert page["cursor"] == cursor
+
+    page = await pager.next(cursor, 2)
+    assert _paths(page) == ["4.txt"]
+    assert page["cursor"] is None
+    assert stream.closed
+    assert len(pager) == 0
+
+    with pytest.raises(CursorNotFoundError):
+        await pager.next(cursor, 2)
+
+
+@pytest.mark.asyncio
+async def test_pager_exact_last_page():
+    pager = ResultPager()
+    stats = SearchStats()
+    stats.truncated = "max_files"
+
+    page = await pager.start(_Stream(2)(), stats, 2)
+
+    assert _paths(page) == ["0.txt", "1.txt"]
+    assert page["cursor"] is None
+    assert page["truncated"]
+    assert page["stats"]["limit"] == "max_files"
+
+
+@pytest.mark.asyncio
+async def test_pager_close():
+    pager = ResultPager()
+    stream = _Stream(5)
+    cursor = (await pager.start(stream(), SearchStats(), 1))["cursor"]
+
+    await pager.close(cursor)
+
+    assert stream.closed
+    with pytest.raises(CursorNotFoundError):
+        await pager.next(cursor, 1)
+    with pytest.raises(CursorNotFoundError):
+        await pager.close(cursor)
+
+
+@pytest.mark.asyncio
+async def test_pager_new_search_of_session_closes_previous():
+    pager = ResultPager()
+    first, second = _Stream(5), _Stream(5)
+    cursor = (await pager.start(first(), SearchStats(), 1, session="s"))["cursor"]
+    other = (await pager.start(_Stream(5)(), SearchStats(), 1, session="t"))["cursor"]
+
+    await pager.start(second(), SearchStats(), 1, session="s")
+
+    assert first.closed
+    with pytest.raises(CursorNotFoundError):
+        await pager.next(cursor, 1)
+    assert _paths(await pager.next(other, 1)) == ["1.txt"]
+
+
+@pytest.mark.asyncio
+async def test_pager_expiration():
+    pager = ResultPager(ttl=0.05)
+    stream = _Stream(5)
+    cursor = (await pager.start(stream(), SearchStats(), 1))["cursor"]
+
+    await asyncio.sleep(0.2)
+
+    assert stream.closed
+    with pytest.raises(CursorNotFoundError):
+        await pager.next(cursor, 1)
+
+
+@pytest.mark.asyncio
+async def test_pager_error():
+    pager = ResultPager()
+    stream = _Stream(2, SearchError(2, "failure", ["rg"]))
+    cursor = (await pager.start(stream(), SearchStats(), 1))["cursor"]
+
+    with pytest.raises(SearchError):
+        await pager.next(cursor, 1)
+
+    assert len(pager) == 0
+
+
+@pytest.mark.asyncio
+async def test_pager_cursor_of_another_user():
+    pager = ResultPager()
+    stream = _Stream(5)
+    cursor = (await pager.start(stream(), SearchStats(), 1, user="alice"))["cursor"]
+
+    with pytest.raises(CursorNotFoundError):
+        await pager.next(cursor, 1, user="bob")
+    with pytest.raises(CursorNotFoundError):
+        await pager.close(cursor, user="bob")
+
+    assert not stream.closed
+    assert _paths(await pager.next(cursor, 1, user="alice")) == ["1.txt"]
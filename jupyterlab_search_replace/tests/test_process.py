@@ -0,0 +1,111 @@
+import asyncio
+import os
+import signal
+import sys
+import time
+
+import pytest
+
+from ..process import ThreadedProcess, start_process, terminate_process
+
+pytestmark = [
+    pytest.mark.skipif(
+        sys.platform == "win32", reason="Process groups are POSIX specific."
+    ),
+    pytest.mark.usefixtures("subprocess_support"),
+]
+
+
+@pytest.fixture(params=("asyncio", "threads"))
+def subprocess_support(request, monkeypatch):
+    if request.param == "threads":
+        # Like the selector event loop used on Windows
+        async def unsupported(*args, **kwargs):
+            raise NotImplementedError()
+
+        monkeypatch.setattr(asyncio, "create_subprocess_exec", unsupported)
+    return request.param
+
+
+def _is_running(pid: int) -> bool:
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # Zombie processes have exited
+            return f.read().split(")")[-1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+    except OSError:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        return True
+
+
+@pytest.mark.asyncio
+async def test_start_process(subprocess_support):
+    process = await start_process(
+        [
+            sys.executable,
+            "-c",
+            "import sys, time; time.sleep(0.2); print(sys.stdin.read())",
+        ]
+    )
+
+    assert isinstance(process, ThreadedProcess) == (subprocess_support == "threads")
+    assert os.getpgid(process.pid) == process.pid
+    output, _ = await process.communicate()
+
+    assert process.returncode == 0
+    # The standard input is closed
+    assert output.strip() == b""
+
+
+@pytest.mark.asyncio
+async def test_terminate_process():
+    process = await start_process([sys.executable, "-c", "import time; time.sleep(60)"])
+
+    returncode = await terminate_process(process, 5)
+
+    assert returncode == -signal.SIGTERM
+
+
+@pytest.mark.asyncio
+async def test_terminate_process_kill():
+    code = "import signal, time; signal.signal(signal.SIGTERM, signal.SIG_IGN); print(flush=True); time.sleep(60)"
+    process = await start_process([sys.executable, "-c", code])
+    await process.stdout.readline()
+
+    start = time.monotonic()
+    returncode = await terminate_process(process, 0.2)
+
+    assert returncode == -signal.SIGKILL
+    assert time.monotonic() - start < 5
+
+
+@pytest.mark.asyncio
+async def test_terminate_process_group():
+    code = (
+        "import subprocess, sys, time;"
+        "child = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)']);"
+        "print(child.pid, flush=True);"
+        "time.sleep(60)"
+    )
+    process = await start_process([sys.executable, "-c", code])
+    child = int(await process.stdout.readline())
+
+    await terminate_process(process, 5)
+
+    for _ in range(50):
+        if not _is_running(child):
+            break
+        await asyncio.sleep(0.1)
+    assert not _is_running(child)
+
+
+@pytest.mark.asyncio
+async def test_terminate_process_exited():
+    process = await start_process([sys.executable, "-c", "pass"])
+    await process.wait()
+
+    assert await terminate_process(process) == 0
@@ -0,0 +1,95 @@
+import pytest
+
+from ..pysearch import compile_query, iter_files, search_files, search_text
+from ..replacer import rewrite_file
+
+
+@pytest.mark.parametrize(
+    "query, case_sensitive, whole_word, use_regex, text, expected",
+    [
+        ("a.b", False, False, False, "a.b axb", ["a.b"]),
+        ("a.b", False, False, True, "a.b axb", ["a.b", "axb"]),
+        ("Ab", True, False, False, "ab Ab", ["Ab"]),
+        ("ab", False, True, False, "ab abc", ["ab"]),
+    ],
+)
+def test_compile_query(query, case_sensitive, whole_word, use_regex, text, expected):
+    pattern = compile_query(query, case_sensitive, whole_word, use_regex)
+
+    assert pattern.findall(text) == expected
+
+
+def test_compile_query_unsupported():
+    assert compile_query(r"\p{Greek}", False, False, True) is None
+
+
+@pytest.mark.parametrize(
+    "include, exclude, expected",
+    [
+        ([], [], ["a.py", "b.txt", "sub/c.py", "sub/deep/d.py"]),
+        (["*.py"], [], ["a.py", "sub/c.py", "sub/deep/d.py"]),
+        ([], ["sub"], ["a.py", "b.txt"]),
+        (["*.py"], ["deep"], ["a.py", "sub/c.py"]),
+        (["sub/*.py"], [], ["sub/c.py"]),
+    ],
+)
+def test_iter_files(tmp_path, include, exclude, expected):
+    for name in ["a.py", "b.txt", "sub/c.py", "sub/deep/d.py", ".hidden/e.py", ".f.py"]:
+        (tmp_path / name).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / name).write_text("content")
+
+    assert list(iter_files(str(tmp_path), include, exclude)) == expected
+
+
+def test_search_text():
+    pattern = compile_query("λ", False, False, False)
+
+    lines = search_text("a λ b λ\nnothing\nλ", pattern)
+
+    assert [(line.line_number, line.absolute_offset) for line in lines] == [
+        (1, 0),
+        (3, 18),
+    ]
+    assert lines[0].line == "a λ b λ\n"
+    assert lines[0].submatches == [("λ", 2, 4), ("λ", 7, 9)]
+    assert lines[1].line == "λ"
+
+
+def test_search_text_max_count():
+    pattern = compile_query("a", False, False, False)
+
+    assert len(search_text("a\na\na", pattern, max_count=2)) == 2
+
+
+def test_search_files(tmp_path):
+    (tmp_path / "text.txt").write_text("hello\nworld\n")
+    (tmp_path / "binary.bin").write_bytes(b"hello\0world")
+    (tmp_path / "empty.txt").write_bytes(b"")
+    pattern = compile_query("world", True, False, False)
+
+    results = search_files(
+        str(tmp_path), ["binary.bin", "empty.txt", "missing.txt", "text.txt"], pattern
+    )
+
+    assert [(file, [line.line for line in lines]) for file, lines in results] == [
+        ("text.txt", ["world\n"])
+    ]
+
+
+def test_search_files_not_utf8(tmp_path):
+    file_path = tmp_path / "latin1.txt"
+    file_path.write_bytes(b"caf\xe9 foo and more text\nfoo\n")
+    pattern = compile_query("foo", True, False, False)
+
+    [(_, lines)] = search_files(str(tmp_path), ["latin1.txt"], pattern)
+
+    # Like ripgrep, the invalid line is not reported but the positions are in bytes
+    assert [(line.line, line.absolute_offset) for line in lines] == [
+        (None, 0),
+        ("foo\n", 23),
+    ]
+    assert lines[0].submatches == [("foo", 5, 8)]
+
+    rewrite_file(file_path, {1: [(5, 8, b"bar")]})
+
+    assert file_path.read_bytes() == b"caf\xe9 bar and more text\nfoo\n"
@@ -0,0 +1,135 @@
+import io
+import os
+import stat
+
+import pytest
+
+from ..replacer import rewrite, rewrite_file
+
+
+def _reference(data: bytes, line_edits) -> bytes:
+    lines = data.splitlines(keepends=True)
+    for line_number, edits in line_edits.items():
+        line = lines[line_number - 1]
+        parts, position = [], 0
+        for start, end, replacement in edits:
+            parts.extend((line[position:start], replacement))
+            position = end
+        parts.append(line[position:])
+        lines[line_number - 1] = b"".join(parts)
+    return b"".join(lines)
+
+
+@pytest.mark.parametrize("chunk_size", (1, 3, 1024))
+@pytest.mark.parametrize(
+    "data, line_edits",
+    (
+        (b"hello world\nbye world\n", {1: [(6, 11, b"there")]}),
+        (b"hello world\nbye world", {2: [(0, 3, b"see you"), (4, 9, b"")]}),
+        (b"a\r\nb\r\nc\r\n", {1: [(0, 1, b"x")], 3: [(0, 1, b"\xce\xbb")]}),
+        (b"abc", {1: [(0, 0, b">"), (3, 3, b"<")]}),
+        (b"no edit\n", {}),
+        # Long line with many matches
+        (
+            b"ab" * 5000 + b"\n" + b"tail\n",
+            {1: [(i, i + 1, b"c") for i in range(0, 10000, 2)]},
+        ),
+    ),
+)
+def test_rewrite(data, line_edits, chunk_size):
+    destination = io.BytesIO()
+
+    size = rewrite(io.BytesIO(data), destination, line_edits, chunk_size)
+
+    assert destination.getvalue() == _reference(data, line_edits)
+    assert size == len(destination.getvalue())
+
+
+@pytest.mark.parametrize(
+    "line_edits",
+    (
+        {3: [(0, 1, b"x")]},
+        {1: [(0, 50, b"x")]},
+        {1: [(2, 4, b"x"), (3, 5, b"y")]},
+    ),
+)
+def test_rewrite_file_invalid_edits(tmp_path, line_edits):
+    file = tmp_path / "a.txt"
+    file.write_bytes(b"hello\nworld")
+
+    with pytest.raises(ValueError):
+        rewrite_file(file, line_edits)
+
+    # The original file is untouched and no temporary file is left
+    assert file.read_bytes() == b"hello\nworld"
+    assert os.listdir(tmp_path) == ["a.txt"]
+
+
+def test_rewrite_file(tmp_path):
+    file = tmp_path / "a.sh"
+    file.write_bytes(b"echo hello\n")
+    file.chmod(0o750)
+
+    size = rewrite_file(file, {1: [(5, 10, b"world")]}, chunk_size=4)
+
+    assert file.read_bytes() == b"echo world\n"
+    assert size == 11
+    assert stat.S_IMODE(file.stat().st_mode) == 0o750
+    assert os.listdir(tmp_path) == ["a.sh"]
+
+
+@pytest.mark.skipif(not hasattr(os, "symlink"), reason="No symbolic links.")
+def test_rewrite_file_symlink(tmp_path):
+    target = tmp_path / "real.txt"
+    target.write_bytes(b"hello")
+    link = tmp_path / "link.txt"
+    link.symlink_to(target)
+
+    rewrite_file(link, {1: [(0, 5, b"world")]})
+
+    # The target is written through the link
+    assert link.is_symlink()
+    assert target.read_bytes() == b"world"
+
+
+def test_rewrite_file_hard_link(tmp_path):
+    file = tmp_path / "a.txt"
+    file.write_bytes(b"hello")
+    other = tmp_path / "b.txt"
+    os.link(file, other)
+
+    rewrite_file(file, {1: [(0, 5, b"world")]})
+
+    assert other.read_bytes() == b"world"
+    assert os.path.samefile(file, other)
+    assert sorted(os.listdir(tmp_path)) == ["a.txt", "b.txt"]
+
+
+def test_rewrite_file_read_only_directory(tmp_path, monkeypatch):
+    file = tmp_path / "a.txt"
+    file.write_bytes(b"hello\nworld")
+    inode = file.stat().st_ino
+    # The directory permissions are ignored when running as root
+    monkeypatch.setattr(os, "access", lambda path, mode: False)
+
+    size = rewrite_file(file, {2: [(0, 5, b"you")]})
+
+    assert file.read_bytes() == b"hello\nyou"
+    assert size == 9
+    assert file.stat().st_ino == inode
+    assert os.listdir(tmp_path) == ["a.txt"]
+
+
+@pytest.mark.skipif(
+    not hasattr(os, "geteuid") or os.geteuid() != 0,
+    reason="Changing the owner of a file requires root.",
+)
+def test_rewrite_file_owner(tmp_path):
+    file = tmp_path / "a.txt"
+    file.write_bytes(b"hello")
+    os.chown(file, 12345, 12345)
+
+    rewrite_file(file, {1: [(0, 5, b"world")]})
+
+    assert file.read_bytes() == b"world"
+    assert (file.stat().st_uid, file.stat().st_gid) == (12345, 12345)
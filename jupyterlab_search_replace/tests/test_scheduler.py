@@ -0,0 +1,203 @@
+import asyncio
+
+import pytest
+
+from ..scheduler import SearchQueueFullError, SearchScheduler
+
+
+async def _hold(scheduler, user, session, events, name, release):
+    async with scheduler.slot(user, session):
+        events.append(name)
+        await release.wait()
+
+
+@pytest.mark.asyncio
+async def test_slot_cancels_same_session():
+    scheduler = SearchScheduler()
+    release = asyncio.Event()
+    events = []
+
+    first = asyncio.create_task(_hold(scheduler, "alice", "a", events, "1", release))
+    await asyncio.sleep(0)
+    second = asyncio.create_task(_hold(scheduler, "alice", "a", events, "2", release))
+    await asyncio.sleep(0)
+    release.set()
+    await second
+
+    assert first.cancelled()
+    assert events == ["1", "2"]
+    assert scheduler.running == 0
+
+
+@pytest.mark.asyncio
+async def test_slot_does_not_cancel_other_users():
+    scheduler = SearchScheduler()
+    release = asyncio.Event()
+    events = []
+
+    tasks = [
+        asyncio.create_task(_hold(scheduler, user, "a", events, user, release))
+        for user in ("alice", "bob")
+    ]
+    await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(*tasks)
+
+    assert sorted(events) == ["alice", "bob"]
+
+
+@pytest.mark.asyncio
+async def test_slot_max_processes_per_user():
+    scheduler = SearchScheduler(max_processes_per_user=1)
+    release = asyncio.Event()
+    events = []
+
+    tasks = [
+        asyncio.create_task(_hold(scheduler, user, session, events, name, release))
+        for user, session, name in (
+            ("alice", "a", "alice-1"),
+            ("alice", "b", "alice-2"),
+            ("bob", "a", "bob-1"),
+        )
+    ]
+    await asyncio.sleep(0)
+
+    assert events == ["alice-1", "bob-1"]
+    assert scheduler.running == 2
+    assert scheduler.pending == 1
+
+    release.set()
+    await asyncio.gather(*tasks)
+
+    assert events == ["alice-1", "bob-1", "alice-2"]
+    assert scheduler.running == 0
+    assert scheduler.pending == 0
+
+
+@pytest.mark.asyncio
+async def test_slot_round_robin_admission():
+    scheduler = SearchScheduler(max_processes=1)
+    events = []
+    releases = {}
+
+    async def hold(user, session):
+        name = f"{user}-{session}"
+        releases[name] = asyncio.Event()
+        async with scheduler.slot(user, session):
+            events.append(name)
+            await releases[name].wait()
+
+    tasks = [
+        asyncio.create_task(hold(user, session))
+        for user, session in (
+            ("alice", "1"),
+            ("alice", "2"),
+            ("alice", "3"),
+            ("bob", "1"),
+        )
+    ]
+    await asyncio.sleep(0)
+    for _ in range(4):
+        releases[events[-1]].set()
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+
+    # bob does not wait for all alice searches to complete
+    assert events == ["alice-1", "alice-2", "bob-1", "alice-3"]
+
+
+@pytest.mark.asyncio
+async def test_slot_cancel_pending():
+    scheduler = SearchScheduler(max_processes=1)
+    release = asyncio.Event()
+    events = []
+
+    first = asyncio.create_task(_hold(scheduler, "alice", "a", events, "1", release))
+    await asyncio.sleep(0)
+    pending = asyncio.create_task(_hold(scheduler, "bob", "a", events, "2", release))
+    await asyncio.sleep(0)
+    assert scheduler.pending == 1
+
+    pending.cancel()
+    await asyncio.sleep(0)
+    assert scheduler.pending == 0
+
+    release.set()
+    await first
+    assert events == ["1"]
+    assert scheduler.running == 0
+
+
+@pytest.mark.asyncio
+async def test_slot_max_pending():
+    scheduler = SearchScheduler(max_processes=1, max_pending=1)
+    release = asyncio.Event()
+    events = []
+
+    first = asyncio.create_task(_hold(scheduler, "alice", "a", events, "1", release))
+    second = asyncio.create_task(_hold(scheduler, "bob", "a", events, "2", release))
+    await asyncio.sleep(0)
+
+    with pytest.raises(SearchQueueFullError):
+        async with scheduler.slot("carol", "a"):
+            pass
+
+    assert scheduler.status() == {
+        "running": 1,
+        "pending": 1,
+        "max_processes": 1,
+        "max_processes_per_user": 0,
+        "max_pending": 1,
+        "threads_budget": 0,
+    }
+    release.set()
+    await asyncio.gather(first, second)
+    assert events == ["1", "2"]
+
+
+@pytest.mark.asyncio
+async def test_slot_threads_budget():
+    scheduler = SearchScheduler(threads_budget=8)
+
+    async with scheduler.slot("alice", "a") as slot_1:
+        async with scheduler.slot("bob", "a") as slot_2:
+            async with scheduler.slot("carol", "a") as slot_3:
+                pass
+
+    assert (slot_1.threads, slot_2.threads, slot_3.threads) == (8, 4, 2)
+
+    async with SearchScheduler().slot() as slot:
+        assert slot.threads == 0
+
+
+@pytest.mark.asyncio
+async def test_slot_paused():
+    scheduler = SearchScheduler(max_processes=1)
+    release = asyncio.Event()
+    events = []
+
+    async with scheduler.slot("alice", "a") as slot:
+        slot.pause()
+        assert scheduler.running == 0
+        # Another search runs while the first one is paused
+        other = asyncio.create_task(
+            _hold(scheduler, "bob", "a", events, "bob", release)
+        )
+        await asyncio.sleep(0)
+        assert events == ["bob"]
+
+        resume = asyncio.create_task(slot.resume())
+        await asyncio.sleep(0)
+        assert not resume.done()
+        release.set()
+        await asyncio.gather(other, resume)
+        assert not slot.paused
+        assert scheduler.running == 1
+
+    assert scheduler.running == 0
+
+    # A search stopped while paused releases nothing more
+    async with scheduler.slot("alice", "a") as slot:
+        slot.pause()
+    assert scheduler.running == 0
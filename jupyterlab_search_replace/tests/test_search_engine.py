@@ -1,6 +1,18 @@
+import asyncio
+import sys
+
 import pytest
 
-from ..search_engine import get_utf8_positions
+from ..codec import RipgrepBegin, RipgrepEnd, RipgrepMatch
+from ..search_engine import (
+    SearchEngine,
+    SearchError,
+    _FileMatchesBuilder,
+    _read_lines,
+    construct_command,
+    get_matches_etag,
+    get_utf8_positions,
+)
 
 
 @pytest.mark.parametrize(
@@ -15,3 +27,113 @@ from ..search_engine import get_utf8_positions
 def test_get_utf8_positions(string, position, expected):
     pos = get_utf8_positions(string, [position])
     assert string[: pos[0]] == expected
+
+
+def test_get_utf8_positions_many():
+    string = "λ€" * 1000 + "hello" + "£" * 1000
+    bstring = string.encode("utf-8")
+    positions = [bstring.index(b"hello") + 5, 0, len(bstring), 2, 2]
+    expected = [len(bstring[:p].decode("utf-8")) for p in positions]
+
+    assert get_utf8_positions(string, positions) == expected
+    assert get_utf8_positions("hello", iter([4, 1])) == [4, 1]
+
+
+def test_construct_command_threads():
+    command = construct_command("hello", False, False, [], [], False, 10, threads=2)
+    assert command[:6] == ["rg", "--json", "--max-count", "10", "--threads", "2"]
+    assert "--threads" not in construct_command(
+        "hello", False, False, [], [], False, 10
+    )
+
+
+def test_get_matches_etag():
+    def file_matches(path, start):
+        return {
+            "path": path,
+            "matches": [
+                {
+                    "line_number": 1,
+                    "start": start,
+                    "end": start + 1,
+                    "match": "a",
+                    "replace": None,
+                }
+            ],
+        }
+
+    etag = get_matches_etag([file_matches("a.txt", 0), file_matches("b.txt", 2)])
+
+    assert etag == get_matches_etag(
+        [file_matches("b.txt", 2), file_matches("a.txt", 0)]
+    )
+    assert etag != get_matches_etag(
+        [file_matches("a.txt", 0), file_matches("b.txt", 3)]
+    )
+    assert etag != get_matches_etag([file_matches("a.txt", 0)])
+
+
+def test_file_matches_builder_not_utf8():
+    builder = _FileMatchesBuilder()
+    builder.feed(RipgrepBegin("latin1.txt"))
+    # ripgrep reports the lines that are not valid UTF-8 as bytes
+    builder.feed(RipgrepMatch(None, 1, 0, [("foo", 5, 8)]))
+
+    [match] = builder.feed(RipgrepEnd())["matches"]
+
+    assert (match["line"], match["start"], match["end"]) == (None, 5, 8)
+    assert (match["start_utf8"], match["end_utf8"]) == (5, 8)
+
+
+@pytest.fixture(params=("asyncio", "threads"))
+def subprocess_support(request, monkeypatch):
+    if request.param == "threads":
+        # Like the selector event loop used on Windows
+        async def unsupported(*args, **kwargs):
+            raise NotImplementedError()
+
+        monkeypatch.setattr(asyncio, "create_subprocess_exec", unsupported)
+    return request.param
+
+
+@pytest.mark.asyncio
+async def test_stream_error_after_exit(contents_manager, subprocess_support):
+    # The grandchild keeps the standard error open after the command exited
+    code = (
+        "import subprocess, sys;"
+        "subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(0.5)'],"
+        " stdout=subprocess.DEVNULL);"
+        "sys.stderr.write('boom'); sys.exit(2)"
+    )
+    engine = SearchEngine(contents_manager)
+
+    with pytest.raises(SearchError) as e:
+        [line async for line in engine.stream([sys.executable, "-c", code])]
+
+    assert e.value.code == 2
+    assert e.value.message == "boom"
+    await engine.stop()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("chunk_size", (1, 3, 64))
+async def test_read_lines(chunk_size):
+    stream = asyncio.StreamReader()
+    long_line = b"x" * 1000
+    stream.feed_data(b"a\n\nbc\n" + long_line + b"\nend")
+    stream.feed_eof()
+
+    lines = [line async for line in _read_lines(stream, chunk_size)]
+
+    assert lines == [b"a", b"", b"bc", long_line, b"end"]
+
+
+@pytest.mark.asyncio
+async def test_read_lines_separator():
+    stream = asyncio.StreamReader()
+    stream.feed_data(b"a.txt\0new\nline.txt\0")
+    stream.feed_eof()
+
+    lines = [line async for line in _read_lines(stream, 4, separator=b"\0")]
+
+    assert lines == [b"a.txt", b"new\nline.txt"]
@@ -0,0 +1,67 @@
+import base64
+
+import pytest
+from jupyter_server.services.contents.filemanager import AsyncFileContentsManager
+from jupyter_server.services.contents.manager import AsyncContentsManager
+
+from ..storage import ContentsFileBackend, LocalFileBackend, is_local
+
+
+class _RemoteContentsManager(AsyncContentsManager):
+    """Contents manager storing the files in memory."""
+
+    def __init__(self, files, **kwargs):
+        super().__init__(**kwargs)
+        self.files = files
+
+    async def get(self, path, content=True, type=None, format=None):
+        data = self.files[path]
+        try:
+            return {"format": "text", "content": data.decode("utf-8")}
+        except UnicodeDecodeError:
+            return {"format": "base64", "content": base64.b64encode(data).decode()}
+
+    async def save(self, model, path):
+        if model["format"] == "base64":
+            self.files[path] = base64.b64decode(model["content"])
+        else:
+            self.files[path] = model["content"].encode("utf-8")
+        return model
+
+
+def test_is_local(tmp_path):
+    assert is_local(AsyncFileContentsManager(root_dir=str(tmp_path)))
+    assert not is_local(_RemoteContentsManager({}))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "content, expected",
+    [
+        (
+            "héllo world\nbye world\n".encode("utf-8"),
+            "héllo monde\nbye world\n".encode(),
+        ),
+        (b"\xff world\nbye world\n", b"\xff monde\nbye world\n"),
+    ],
+)
+async def test_contents_backend_rewrite(content, expected):
+    manager = _RemoteContentsManager({"folder/a.txt": content})
+    backend = ContentsFileBackend(manager)
+    start = content.index(b"world")
+
+    size = await backend.rewrite("folder/a.txt", {1: [(start, start + 5, b"monde")]})
+
+    assert manager.files["folder/a.txt"] == expected
+    assert size == len(expected)
+
+
+@pytest.mark.asyncio
+async def test_local_backend_rewrite(tmp_path):
+    (tmp_path / "a.txt").write_bytes(b"hello world\n")
+    backend = LocalFileBackend(tmp_path)
+
+    size = await backend.rewrite("a.txt", {1: [(6, 11, b"monde")]})
+
+    assert (tmp_path / "a.txt").read_bytes() == b"hello monde\n"
+    assert size == 12
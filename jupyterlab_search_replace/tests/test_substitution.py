@@ -0,0 +1,86 @@
+import pytest
+
+from ..substitution import compile_replacement, substitute
+
+
+def _match(line, start, end):
+    return {
+        "line": line,
+        "match": line[start:end],
+        "start_utf8": start,
+        "end_utf8": end,
+        "replace": None,
+    }
+
+
+@pytest.mark.parametrize(
+    "query, replace, line, start, end, expected",
+    [
+        # Literal replacement
+        ("str", "hello", "a string", 2, 5, "hello"),
+        # Groups
+        (r"(\w+)@(\w+)", "$2 at $1", "mail me@host", 5, 12, "host at me"),
+        (r"(?P<user>\w+)@(\w+)", "$<user>!", "me@host", 0, 7, "me!"),
+        # Whole match and escapes
+        (r"\d+", "[$&]", "x 42", 2, 4, "[42]"),
+        (r"(\d+)", "$$1 $1", "42", 0, 2, "$1 42"),
+        (r"(\d+)", r"\n$1", "42", 0, 2, r"\n42"),
+        # Unknown groups are kept
+        (r"(\d+)", "$2", "42", 0, 2, "$2"),
+        (r"(\d)", "$10", "42", 0, 1, "40"),
+        # Lookarounds see the whole line
+        (r"(?<=a)(b)", "[$1]", "ab b", 1, 2, "[b]"),
+        # Case insensitive
+        (r"(s)tr", "$1-", "a STRING", 2, 5, "S-"),
+        # Unicode
+        (r"(λ)", "<$1>", "ü λ", 2, 3, "<λ>"),
+    ],
+)
+def test_compile_replacement(query, replace, line, start, end, expected):
+    replacement = compile_replacement(
+        query, replace, case_sensitive=False, use_regex=True
+    )
+
+    assert replacement(_match(line, start, end)) == expected
+
+
+@pytest.mark.parametrize("replace", ["$1", "[$&]", "$<name>", "$$&"])
+def test_compile_replacement_literal_query(replace):
+    # The frontend inserts the template of a literal search as is too
+    replacement = compile_replacement(
+        "(a)", replace, case_sensitive=False, use_regex=False
+    )
+
+    assert replacement(_match("(a)", 0, 3)) == replace
+
+
+@pytest.mark.parametrize(
+    "query, replace",
+    [
+        ("a", None),
+        # Rust regex syntax not supported by Python
+        (r"(\p{Greek})", "$1"),
+    ],
+)
+def test_compile_replacement_unsupported(query, replace):
+    assert (
+        compile_replacement(query, replace, case_sensitive=False, use_regex=True)
+        is None
+    )
+
+
+def test_substitute_copy():
+    file_matches = {"path": "a.txt", "matches": [_match("abc", 1, 2)]}
+
+    result = substitute(lambda m: m["match"].upper(), file_matches)
+
+    assert result["matches"][0]["replace"] == "B"
+    assert file_matches["matches"][0]["replace"] is None
+
+
+def test_compile_replacement_not_utf8():
+    replacement = compile_replacement(r"(fo+)", "[$1]", False, True)
+    match = {"line": None, "match": "foo", "start_utf8": 5, "end_utf8": 8}
+
+    assert replacement(match) == "[foo]"
+    assert replacement({**match, "match": None}) is None
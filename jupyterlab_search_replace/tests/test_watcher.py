@@ -0,0 +1,142 @@
+import asyncio
+
+import pytest
+from tornado.ioloop import IOLoop
+
+from ..index import TrigramIndex
+from ..watcher import FileWatcher, is_changed
+
+
+async def _wait_for(condition, timeout=5.0):
+    for _ in range(int(timeout / 0.05)):
+        if condition():
+            return
+        await asyncio.sleep(0.05)
+    raise TimeoutError()
+
+
+@pytest.mark.asyncio
+async def test_watcher_journal(tmp_path):
+    watcher = FileWatcher(tmp_path, "polling", debounce=0.05)
+    watcher._io_loop = IOLoop.current()
+    batches = []
+    watcher.subscribe(batches.append)
+
+    assert watcher.changes_since(0) == set()
+    watcher.record({"a.txt", "sub/b.txt", ".hidden/c.txt"})
+    version = watcher.version
+    watcher.record({"a.txt"})
+
+    assert watcher.changes_since(0) == {"a.txt", "sub/b.txt"}
+    assert watcher.changes_since(version) == {"a.txt"}
+    assert watcher.changes_since(watcher.version) == set()
+
+    await _wait_for(lambda: batches)
+    assert batches == [{"a.txt", "sub/b.txt"}]
+
+
+def test_watcher_journal_overflow(tmp_path):
+    watcher = FileWatcher(tmp_path, "polling")
+    watcher._journal = type(watcher._journal)(maxlen=2)
+    # Don't notify the subscribers
+    watcher._flush_scheduled = True
+    watcher.record({"a.txt"})
+    watcher.record({"b.txt"})
+    watcher.record({"c.txt"})
+
+    assert watcher.changes_since(0) is None
+    assert watcher.changes_since(1) == {"b.txt", "c.txt"}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("backend", ("polling", "inotify"))
+async def test_watcher_detects_changes(tmp_path, backend):
+    if backend == "inotify":
+        pytest.importorskip("watchdog")
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "a.txt").write_text("hello")
+    watcher = FileWatcher(tmp_path, backend, poll_interval=0.05, debounce=0.05)
+    batches = []
+    watcher.subscribe(batches.append)
+    watcher.start()
+    try:
+        await asyncio.sleep(0.2)
+        (tmp_path / "a.txt").write_text("hello world")
+        (tmp_path / "sub" / "b.txt").write_text("new")
+
+        await _wait_for(
+            lambda: {"a.txt", "sub/b.txt"} <= set().union(*batches)
+            if batches
+            else False
+        )
+        assert watcher.changes_since(0) >= {"a.txt", "sub/b.txt"}
+    finally:
+        watcher.stop()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("backend", ("polling", "inotify"))
+async def test_watcher_detects_directory_move(tmp_path, backend):
+    if backend == "inotify":
+        pytest.importorskip("watchdog")
+    root = tmp_path / "root"
+    (root / "sub" / "deep").mkdir(parents=True)
+    (root / "sub" / "deep" / "a.txt").write_text("hello")
+    watcher = FileWatcher(root, backend, poll_interval=0.05, debounce=0.05)
+    watcher.start()
+    try:
+        await asyncio.sleep(0.2)
+        version = watcher.version
+        (root / "sub").rename(tmp_path / "elsewhere")
+
+        # inotify journals the directory, polling the files it contained
+        await _wait_for(
+            lambda: is_changed("sub/deep/a.txt", watcher.changes_since(version))
+        )
+    finally:
+        watcher.stop()
+
+
+def test_is_changed():
+    assert is_changed("sub/deep/a.txt", {"sub"})
+    assert is_changed("sub/deep/a.txt", {"sub/deep/a.txt"})
+    assert not is_changed("sub/deep/a.txt", {"su", "sub/deep/a"})
+    assert not is_changed("sub/deep/a.txt", set())
+
+
+@pytest.mark.asyncio
+async def test_index_with_watcher(tmp_path):
+    pytest.importorskip("watchdog")
+    root = tmp_path / "root"
+    root.mkdir()
+    (root / "a.txt").write_text("hello world")
+    (root / "b.txt").write_text("nothing")
+    watcher = FileWatcher(root, "inotify", debounce=0.05)
+    watcher.start()
+    index = TrigramIndex(root, tmp_path / "index.db", watcher=watcher)
+    paths = ["a.txt", "b.txt"]
+    try:
+        assert watcher.realtime
+        assert await index.candidates(paths, "world", True) == ["a.txt"]
+        # Without journaled changes, the files are not checked again
+        assert await index._run(index._outdated, paths, set()) == []
+
+        (root / "b.txt").write_text("brave new world")
+        await _wait_for(lambda: "b.txt" in watcher.changes_since(0))
+        # The changed file is re-indexed in the background
+        await _wait_for(lambda: not watcher._flush_scheduled and not index.updating)
+        assert await index.candidates(paths, "world", True) == ["a.txt", "b.txt"]
+
+        (root / "sub").mkdir()
+        (root / "sub" / "c.txt").write_text("another world")
+        paths.append("sub/c.txt")
+        assert await index.candidates(paths, "world", True) == paths
+        # Moving the folder away removes its files from the index
+        (root / "sub").rename(tmp_path / "elsewhere")
+        await _wait_for(lambda: "sub" in watcher.changes_since(0))
+        await _wait_for(lambda: not watcher._flush_scheduled and not index.updating)
+        assert "sub/c.txt" not in index._files
+        assert await index.candidates(paths, "world", True) == ["a.txt", "b.txt"]
+    finally:
+        watcher.stop()
+        await index.close()
@@ -0,0 +1,274 @@
+"""Journal of the files changed within a directory
+
+Changes are detected with inotify (through the optional `watchdog
+<https://github.com/gorakhargosh/watchdog>`_ package) or by polling
+the files modification time and size.
+"""
+
+import os
+import time
+from collections import deque
+from pathlib import Path
+from typing import Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from tornado.ioloop import IOLoop, PeriodicCallback
+
+from .log import get_logger
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # pragma: no cover
+    Observer = None
+
+# Maximal number of changes kept in the journal
+MAX_JOURNAL_SIZE = 100000  # type: int
+# Events not modifying the files
+_IGNORED_EVENTS = frozenset(("opened", "closed_no_write"))
+# Events on a directory modifying the files it contains; a directory is
+# "modified" when one of its files changes, which is journaled on its own.
+_DIRECTORY_EVENTS = frozenset(("created", "deleted", "moved"))
+
+
+def _is_hidden(relative_path: str) -> bool:
+    # ripgrep does not search hidden files by default
+    return any(part.startswith(".") for part in Path(relative_path).parts)
+
+
+def is_changed(path: str, changes: Set[str]) -> bool:
+    """Whether ``path`` or one of its parent directories is in ``changes``.
+
+    A directory in the journal means that all the files under it may have
+    changed; e.g. it was moved or deleted.
+
+    Args:
+        path: The file relative to the root directory, in POSIX format
+        changes: The changed paths; see :meth:`FileWatcher.changes_since`
+    Returns:
+        Whether the file may have changed
+    """
+    while path:
+        if path in changes:
+            return True
+        path = path.rpartition("/")[0]
+    return False
+
+
+class FileWatcher:
+    """Watch the files within a directory and journal their changes.
+
+    Each change bumps the journal version; consumers keep the version they
+    last processed and ask for the files changed since then. Consumers can
+    also subscribe to batches of changes, notified once no change happened
+    for ``debounce`` seconds (or at most after ten times that delay) so that
+    bulk operations like a ``git checkout`` are processed at once.
+
+    Hidden files and folders are not watched.
+
+    Args:
+        root_dir: The directory to watch
+        backend: ``"inotify"``, ``"polling"`` or ``"auto"`` to use inotify if available
+        poll_interval: Interval in seconds between two scans of the directory when polling
+        debounce: Quiet period in seconds before notifying the subscribers
+    """
+
+    def __init__(
+        self,
+        root_dir: Path,
+        backend: str = "auto",
+        poll_interval: float = 5.0,
+        debounce: float = 0.5,
+    ) -> None:
+        if backend == "auto":
+            backend = "polling" if Observer is None else "inotify"
+        if backend == "inotify" and Observer is None:
+            raise ValueError("The inotify backend requires the watchdog package.")
+
+        self._root_dir = root_dir
+        self.backend = backend
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self._version = 0
+        self._journal: Deque[Tuple[int, str]] = deque(maxlen=MAX_JOURNAL_SIZE)
+        self._subscribers: List[Callable[[Set[str]], None]] = []
+        self._pending: Set[str] = set()
+        self._first_change = 0.0
+        self._last_change = 0.0
+        self._flush_scheduled = False
+        self._io_loop: Optional[IOLoop] = None
+        self._observer = None
+        self._poller: Optional[PeriodicCallback] = None
+        self._snapshot: Optional[Dict[str, Tuple[int, int]]] = None
+
+    @property
+    def realtime(self) -> bool:
+        """Whether the changes are journaled as soon as they happen."""
+        return self._observer is not None and self._observer.is_alive()
+
+    @property
+    def journaling(self) -> bool:
+        """Whether the changes are journaled, as they happen or at each scan when polling."""
+        return self.realtime or (
+            self._poller is not None and self._snapshot is not None
+        )
+
+    @property
+    def version(self) -> int:
+        """The journal version."""
+        return self._version
+
+    def changes_since(self, version: int) -> Optional[Set[str]]:
+        """Get the files changed since ``version``.
+
+        Args:
+            version: The journal version
+        Returns:
+            The changed files relative to the root directory or ``None`` if the
+            journal does not go back to ``version``. A directory stands for all
+            the files under it; see :func:`is_changed`.
+        """
+        if version == self._version:
+            return set()
+        if not self._journal or self._journal[0][0] > version + 1:
+            return None
+        return {path for v, path in self._journal if v > version}
+
+    def subscribe(self, callback: Callable[[Set[str]], None]) -> None:
+        """Be notified of the changed files, by batches.
+
+        Args:
+            callback: Function called with the changed files relative to the root directory;
+                a directory stands for all the files under it.
+        """
+        self._subscribers.append(callback)
+
+    def start(self) -> None:
+        """Start watching the directory."""
+        self._io_loop = IOLoop.current()
+        get_logger().info(
+            f"Watching files changes in {self._root_dir!s} using {self.backend}."
+        )
+        if self.backend == "inotify":
+            self._observer = Observer()
+            self._observer.schedule(
+                _EventHandler(self), str(self._root_dir), recursive=True
+            )
+            self._observer.daemon = True
+            self._observer.start()
+        else:
+            self._poller = PeriodicCallback(self._poll, self.poll_interval * 1000)
+            self._poller.start()
+            self._io_loop.add_callback(self._poll)
+
+    def stop(self) -> None:
+        """Stop watching the directory."""
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer = None
+        if self._poller is not None:
+            self._poller.stop()
+            self._poller = None
+
+    def record(self, paths: Set[str]) -> None:
+        """Journal changed files.
+
+        This must be called from the event loop thread.
+
+        Args:
+            paths: The changed files relative to the root directory
+        """
+        paths = {path for path in paths if not _is_hidden(path)}
+        if not paths:
+            return
+
+        for path in paths:
+            self._version += 1
+            self._journal.append((self._version, path))
+
+        now = time.monotonic()
+        if not self._pending:
+            self._first_change = now
+        self._last_change = now
+        self._pending |= paths
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            self._io_loop.call_later(self.debounce, self._flush)
+
+    def _flush(self) -> None:
+        now = time.monotonic()
+        if (
+            now - self._last_change < self.debounce
+            and now - self._first_change < 10 * self.debounce
+        ):
+            self._io_loop.call_later(self.debounce, self._flush)
+            return
+
+        self._flush_scheduled = False
+        paths, self._pending = self._pending, set()
+        for callback in self._subscribers:
+            try:
+                callback(paths)
+            except Exception as e:
+                get_logger().error(f"Failed to process files changes: {e!s}")
+
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        snapshot = {}
+        stack = [self._root_dir]
+        while stack:
+            try:
+                entries = list(os.scandir(stack.pop()))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(Path(entry.path))
+                    elif entry.is_file():
+                        stat = entry.stat()
+                        path = Path(entry.path).relative_to(self._root_dir).as_posix()
+                        snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+                except OSError:
+                    continue
+        return snapshot
+
+    async def _poll(self) -> None:
+        snapshot = await self._io_loop.run_in_executor(None, self._scan)
+        if self._snapshot is not None:
+            changed = {
+                path
+                for path in snapshot.keys() | self._snapshot.keys()
+                if snapshot.get(path) != self._snapshot.get(path)
+            }
+            self.record(changed)
+        self._snapshot = snapshot
+
+
+if Observer is not None:
+
+    class _EventHandler(FileSystemEventHandler):
+        """Forward watchdog events to the watcher journal."""
+
+        def __init__(self, watcher: FileWatcher) -> None:
+            super().__init__()
+            self._watcher = watcher
+
+        def on_any_event(self, event) -> None:
+            if event.event_type in _IGNORED_EVENTS or (
+                event.is_directory and event.event_type not in _DIRECTORY_EVENTS
+            ):
+                return
+            paths = set()
+            for path in (event.src_path, getattr(event, "dest_path", "")):
+                if path:
+                    try:
+                        paths.add(
+                            Path(os.fsdecode(path))
+                            .relative_to(self._watcher._root_dir)
+                            .as_posix()
+                        )
+                    except ValueError:
+                        continue
+            # Events are emitted from the observer thread
+            self._watcher._io_loop.add_callback(self._watcher.record, paths)
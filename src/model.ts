@@ -1,10 +1,10 @@
 import { VDomModel } from '@jupyterlab/apputils';
-import { JSONExt, PromiseDelegate } from '@lumino/coreutils';
+import { JSONExt, PromiseDelegate, UUID } from '@lumino/coreutils';
 import { Debouncer } from '@lumino/polling';
 import { requestAPI } from './handler';
 import { SearchReplace } from './tokens';
 
-const REGEXP_GROUP = /\$[1-9]\d*/g;
+const REGEXP_GROUP = /\$([1-9]\d*|&|<[^>]*>)/g;
 
 /**
  * Search and Replace Model
@@ -24,6 +24,7 @@ export class SearchReplaceModel extends VDomModel {
     this._path = '';
     this._replaceString = '';
     this._replaceWorker = null;
+    this._session = UUID.uuid4();
 
     this._defaultExcludeFilters = [];
     this._maxLinesPerFile = 100;
@@ -264,8 +265,13 @@ export class SearchReplaceModel extends VDomModel {
         ['case_sensitive', this.caseSensitive.toString()],
         ['whole_word', this.wholeWord.toString()],
         ['use_regex', this.useRegex.toString()],
-        ['max_count', this.maxLinesPerFile.toString()]
+        ['max_count', this.maxLinesPerFile.toString()],
+        ['session', this._session]
       ];
+      if (this.replaceString) {
+        // The replacement strings are computed by the server when possible
+        queryArgs.push(['replace', this.replaceString]);
+      }
 
       queryArgs.push(
         ...this.excludeFilters
@@ -292,7 +298,10 @@ export class SearchReplaceModel extends VDomModel {
       );
       this._queryResults = data.matches;
       this._errorMsg = null;
-      if (this.replaceString) {
+      if (
+        this.replaceString &&
+        data.matches.some(f => f.matches.some(m => m.replace === null))
+      ) {
         await this._updateReplace();
       }
     } catch (reason) {
@@ -314,7 +323,8 @@ export class SearchReplaceModel extends VDomModel {
       });
     };
 
-    if (this.replaceString.match(REGEXP_GROUP) === null) {
+    // Like the server, the template of a literal search is inserted as is
+    if (!this.useRegex || this.replaceString.match(REGEXP_GROUP) === null) {
       setReplace(this.replaceString ? this.replaceString : null);
     } else {
       if (!window.Worker) {
@@ -374,6 +384,7 @@ export class SearchReplaceModel extends VDomModel {
   private _queryResults: SearchReplace.IFileMatch[];
   private _debouncedSearch: Debouncer;
   private _replaceWorker: Worker | null;
+  private _session: string;
   // Configuration from settings
   private _defaultExcludeFilters: string[];
   private _maxLinesPerFile: number;
@@ -7,6 +7,44 @@ export namespace SearchReplace {
      * Matches per file
      */
     matches: IFileMatch[];
+    /**
+     * Cursor of the next page of a paginated search; null for the last page
+     */
+    cursor?: string | null;
+    /**
+     * Whether the search was stopped by a server limit
+     */
+    truncated?: boolean;
+    /**
+     * Statistics of a truncated search
+     */
+    stats?: ISearchStats;
+  }
+
+  /**
+   * Statistics of a search
+   */
+  export interface ISearchStats {
+    /**
+     * Number of matches returned
+     */
+    matches: number;
+    /**
+     * Number of files with matches returned
+     */
+    files: number;
+    /**
+     * Size in bytes of the matches returned; 0 if not measured
+     */
+    bytes: number;
+    /**
+     * Search duration in seconds
+     */
+    elapsed: number;
+    /**
+     * Name of the limit that stopped the search
+     */
+    limit: 'max_matches' | 'max_files' | 'max_size' | 'timeout' | null;
   }
 
   /**
@@ -36,6 +74,10 @@ export namespace SearchReplace {
      * the offset from the beginning of file
      */
     absolute_offset: number;
+    /**
+     * index of the output of the notebook cell containing the line
+     */
+    output?: number;
   }
 
   /**
@@ -87,5 +129,9 @@ export namespace SearchReplace {
      * Replacement string
      */
     replace: string | null;
+    /**
+     * index of the notebook cell; the line and offsets are within the cell
+     */
+    cell?: number;
   }
 }
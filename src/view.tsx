@@ -35,6 +35,7 @@ import {
 import type { CommandRegistry } from '@lumino/commands';
 import { PromiseDelegate } from '@lumino/coreutils';
 import { Message } from '@lumino/messaging';
+import type { Widget } from '@lumino/widgets';
 import React, { useEffect, useState } from 'react';
 import { AskBoolean } from './askBoolean';
 import {
@@ -49,6 +50,29 @@ import { SearchReplace } from './tokens';
 
 const RIPGREP_MISSING_ERROR = 'ripgrep command not found.';
 
+/**
+ * Subset of the notebook widget API used to reveal a cell match
+ */
+interface INotebook extends Widget {
+  activeCellIndex: number;
+  readonly activeCell: {
+    editor: {
+      setSelection(selection: {
+        start: { line: number; column: number };
+        end: { line: number; column: number };
+      }): void;
+    } | null;
+  } | null;
+  scrollToCell?: (cell: any) => Promise<void>;
+}
+
+/**
+ * Whether a match is within a notebook cell; its positions are relative to the cell
+ */
+function isCellMatch(match: SearchReplace.IReplacement): boolean {
+  return match.cell !== undefined;
+}
+
 /**
  * MatchesTreeView component properties
  */
@@ -292,9 +316,13 @@ export class SearchReplaceView extends VDomRenderer<SearchReplaceModel> {
           r: SearchReplace.IFileReplacement[],
           filePath?: string
         ) => {
-          if (filePath) {
+          if (filePath && !r[0].matches.some(isCellMatch)) {
             await this.replaceInFile(filePath, r[0].matches);
             this.model.refresh();
+          } else if (filePath) {
+            // The positions of the notebooks matches are relative to their cell;
+            // the server edits the cells sources.
+            await this.model.replace(r);
           } else {
             if (this.askReplaceConfirmation) {
               const result = await showDialog<boolean>({
@@ -329,7 +357,11 @@ export class SearchReplaceView extends VDomRenderer<SearchReplaceModel> {
         isLoading={this.model.isLoading}
         queryResults={this.model.error ? [] : this.model.queryResults}
         onMatchClick={(path: string, m: SearchReplace.IMatch) => {
-          this.openFile(path, m);
+          if (isCellMatch(m)) {
+            this.openCell(path, m);
+          } else {
+            this.openFile(path, m);
+          }
         }}
         refresh={() => {
           this.model.refresh();
@@ -482,6 +514,41 @@ export class SearchReplaceView extends VDomRenderer<SearchReplaceModel> {
     return widget;
   }
 
+  /**
+   * Open a notebook and select a match of one of its cells
+   *
+   * @param path Notebook path
+   * @param match Search match within a cell
+   */
+  protected async openCell(
+    path: string,
+    match: SearchReplace.IMatch
+  ): Promise<IDocumentWidget<INotebook>> {
+    const widget: IDocumentWidget<INotebook> = await this.commands.execute(
+      'docmanager:open',
+      { path }
+    );
+    await widget.context.ready;
+    const notebook = widget.content;
+    if (typeof notebook.activeCellIndex !== 'number') {
+      // Not opened with the notebook panel
+      return widget;
+    }
+    notebook.activeCellIndex = match.cell!;
+    const cell = notebook.activeCell;
+    if (!cell) {
+      return widget;
+    }
+    await notebook.scrollToCell?.(cell);
+    if (match.output === undefined && cell.editor) {
+      cell.editor.setSelection({
+        start: { line: match.line_number - 1, column: match.start_utf8 },
+        end: { line: match.line_number - 1, column: match.end_utf8 }
+      });
+    }
+    return widget;
+  }
+
   /**
    * Replace matches within the editor
    *
@@ -293,6 +293,52 @@ test('should replace results on replace-all button', async ({ page }) => {
   );
 });
 
+test('should insert the replace template as is for a literal search', async ({
+  page
+}) => {
+  await page.getByRole('tab', { name: 'Search and Replace' }).click();
+  await page
+    .getByRole('textbox', { name: 'Search Files for Text' })
+    .fill('strange');
+  await Promise.all([
+    page.waitForResponse(
+      response =>
+        /.*search\/[\w-]+\?query=strange/.test(response.url()) &&
+        response.request().method() === 'GET'
+    ),
+    page.getByRole('textbox', { name: 'Search Files for Text' }).press('Enter'),
+    page.waitForSelector('.jp-search-replace-tab >> .jp-progress', {
+      state: 'hidden'
+    })
+  ]);
+
+  await page.locator('#jp-search-replace >> [title="Toggle Replace"]').click();
+  await page
+    .locator('#jp-search-replace >> jp-text-field[placeholder="Replace"]')
+    .click();
+  await page
+    .locator('#jp-search-replace >> input[placeholder="Replace"]')
+    .fill('[$&]');
+
+  // Replacement computed by the frontend
+  await expect(page.locator('#jp-search-replace ins').first()).toHaveText(
+    '[$&]'
+  );
+
+  // Replacement computed by the server
+  await Promise.all([
+    page.waitForResponse(
+      response =>
+        /.*search\/[\w-]+\?query=strange.*&replace=/.test(response.url()) &&
+        response.request().method() === 'GET'
+    ),
+    page.locator('[title="Refresh"]').click()
+  ]);
+  await expect(page.locator('#jp-search-replace ins').first()).toHaveText(
+    '[$&]'
+  );
+});
+
 test('should display a warning if a file is dirty', async ({ page }) => {
   // Click #tab-key-0 .lm-TabBar-tabIcon svg >> nth=0
   await page.getByRole('tab', { name: 'Search and Replace' }).click();